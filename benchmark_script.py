@@ -0,0 +1,450 @@
+#!/usr/bin/env python3
+"""
+Script para medir o desempenho das etapas de processamento
+
+Gera entradas sintéticas e determinísticas, sem acesso à rede (vídeos
+testsrc2 do FFmpeg, sequências JPEG e arquivos tar.xz aninhados como os do
+Zenodo), mede cada operação de video_utils e os pipelines completos dos
+datasets (e o download de uma fonte HLS servida localmente, simulando o
+YouTube), e grava o resultado em JSON: tempo de parede, quadros/s, MB/s e
+pico de uso de disco, além do tempo de inicialização (imports) dos
+scripts. Com --baseline, compara com um resultado anterior e aponta as
+regressões.
+
+Uso:
+    python benchmark_script.py --output baseline.json
+    python benchmark_script.py --baseline baseline.json
+    python benchmark_script.py --profile full --only convert cut
+"""
+
+import argparse
+import functools
+import http.server
+import io
+import json
+import lzma
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+from video_utils import *
+from video_utils import _run_ffmpeg_command
+
+# Entradas de cada perfil: vídeos (resolução, duração em s) e imagens
+PROFILES = {
+    'quick': {'videos': [('640x360', 6)], 'images': ('640x360', 120), 'fps': 30},
+    'full': {'videos': [('1920x1080', 20), ('3840x2160', 10)],
+             'images': ('1920x1080', 600), 'fps': 30},
+}
+
+def make_synthetic_video(output_file, duration, size, fps):
+    """Gera um vídeo H.264 + AAC sintético com o testsrc2 do FFmpeg"""
+    cmd = [
+        'ffmpeg', '-f', 'lavfi', '-i', f'testsrc2=size={size}:rate={fps}',
+        '-f', 'lavfi', '-i', 'sine=frequency=440',
+        '-t', str(duration), '-pix_fmt', 'yuv420p',
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-g', str(fps * 2),
+        '-c:a', 'aac', output_file, '-y'
+    ]
+    _run_ffmpeg_command(cmd)
+
+def make_jpeg_sequence(output_dir, count, size, fps, start=1):
+    """Gera `count` imagens JPEG numeradas (%08d.jpg) a partir do testsrc2"""
+    os.makedirs(output_dir, exist_ok=True)
+    cmd = [
+        'ffmpeg', '-f', 'lavfi', '-i', f'testsrc2=size={size}:rate={fps}',
+        '-frames:v', str(count), '-q:v', '2', '-start_number', str(start),
+        os.path.join(output_dir, '%08d.jpg'), '-y'
+    ]
+    _run_ffmpeg_command(cmd)
+
+def _reset_tarinfo(info):
+    """Metadados fixos, para que os arquivos tar gerados sejam idênticos entre execuções"""
+    info.mtime = 0
+    info.uid = info.gid = 0
+    info.uname = info.gname = ''
+    return info
+
+def make_nested_tar(output_file, image_dir, parts):
+    """
+    Gera um tar.xz com `parts` tar.xz internos de imagens, como os do Choke1
+
+    As imagens de `image_dir` são divididas em partes consecutivas.
+
+    Returns:
+        list[str]: Nomes dos tar.xz internos, em ordem
+    """
+    images = sorted(os.listdir(image_dir))
+    per_part = -(-len(images) // parts)
+    stem = os.path.basename(output_file).replace('.tar.xz', '')
+    names = []
+    with tarfile.open(output_file, 'w:xz') as outer:
+        for i in range(parts):
+            buffer = io.BytesIO()
+            with tarfile.open(fileobj=buffer, mode='w:xz') as inner:
+                for image in images[i * per_part:(i + 1) * per_part]:
+                    inner.add(os.path.join(image_dir, image), arcname=image,
+                              filter=_reset_tarinfo)
+            names.append(f"{stem}_C1.{i + 1}.tar.xz")
+            info = _reset_tarinfo(tarfile.TarInfo(names[-1]))
+            info.size = buffer.tell()
+            buffer.seek(0)
+            outer.addfile(info, buffer)
+    return names
+
+def make_multiblock_xz(input_file, output_file, block_size=1 << 20):
+    """Recomprime um .xz em blocos independentes de `block_size` bytes (como o xz -T)"""
+    with lzma.open(input_file) as f, open(output_file, 'wb') as out:
+        for data in iter(lambda: f.read(block_size), b''):
+            out.write(lzma.compress(data))
+
+def extract_tar_xz_lzma(tar_path, extract_to, nested=False):
+    """Extração de referência: lzma do Python, uma thread, aninhados em sequência"""
+    with tarfile.open(tar_path, 'r:xz') as tar:
+        names = tar.getnames()
+        tar.extractall(path=extract_to)
+    if nested:
+        for name in names:
+            if name.endswith('.tar.xz'):
+                extract_tar_xz_lzma(os.path.join(extract_to, name), extract_to)
+
+def directory_size(path):
+    """Soma o tamanho dos arquivos em `path`, recursivamente"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except FileNotFoundError:
+                pass  # Arquivo temporário removido durante a contagem
+    return total
+
+class DiskMonitor:
+    """Amostra o tamanho de um diretório em segundo plano e guarda o pico acima do inicial"""
+
+    def __init__(self, path, interval=0.05):
+        self.path = path
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while True:
+            self.peak = max(self.peak, directory_size(self.path) - self._initial)
+            if self._stop.wait(self.interval):
+                break
+
+    def __enter__(self):
+        self._initial = directory_size(self.path)
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, directory_size(self.path) - self._initial)
+
+# Fonte HLS local que simula o YouTube: segmentos fMP4 curtos servidos com
+# uma latência fixa por requisição, para que o download seja limitado pela
+# latência (como o de um fragmento por vez) e não pela banda
+FRAGMENT_SEGMENT_SECONDS = 0.5
+FRAGMENT_LATENCY = 0.05
+
+class SlowRequestHandler(http.server.SimpleHTTPRequestHandler):
+    """Serve arquivos de um diretório esperando FRAGMENT_LATENCY por requisição"""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        time.sleep(FRAGMENT_LATENCY)
+        super().do_GET()
+
+def make_hls_source(source, output_dir, fps):
+    """Segmenta um vídeo em HLS fMP4 (master.m3u8 + segmentos de FRAGMENT_SEGMENT_SECONDS)"""
+    os.makedirs(output_dir, exist_ok=True)
+    gop = max(1, int(fps * FRAGMENT_SEGMENT_SECONDS))
+    cmd = [
+        'ffmpeg', '-i', source, '-c:v', 'libx264', '-preset', 'ultrafast', '-g', str(gop),
+        '-c:a', 'aac', '-f', 'hls', '-hls_time', str(FRAGMENT_SEGMENT_SECONDS),
+        '-hls_segment_type', 'fmp4', '-hls_playlist_type', 'vod',
+        '-master_pl_name', 'master.m3u8',
+        '-hls_segment_filename', os.path.join(output_dir, 'seg%05d.m4s'),
+        os.path.join(output_dir, 'stream.m3u8'), '-y'
+    ]
+    _run_ffmpeg_command(cmd)
+
+def count_frames(video_file):
+    """Conta os quadros de vídeo pelos pacotes, sem decodificar"""
+    cmd = ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-count_packets',
+           '-show_entries', 'stream=nb_read_packets', '-of', 'csv=p=0', video_file]
+    result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+    return int(result.stdout.strip().split(',')[0] or 0)
+
+def measure(work_dir, function, *args, input_bytes=0, output_file=None, **kwargs):
+    """
+    Executa a operação medindo tempo, vazão e pico de disco em `work_dir`
+
+    Returns:
+        dict: seconds, frames, fps, mb_per_s (sobre `input_bytes`) e peak_disk
+    """
+    with DiskMonitor(work_dir) as disk:
+        start = time.perf_counter()
+        function(*args, **kwargs)
+        seconds = time.perf_counter() - start
+    frames = count_frames(output_file) if output_file else 0
+    return {
+        'seconds': round(seconds, 3),
+        'frames': frames,
+        'fps': round(frames / seconds, 2) if seconds else None,
+        'mb_per_s': round(input_bytes / 2**20 / seconds, 2) if seconds else None,
+        'peak_disk': disk.peak,
+    }
+
+def bench_video_operations(temp_dir, source, label, fps, segments, results, selected):
+    """Operações sobre um vídeo de origem: corte, filtro, concatenação e codificação"""
+    source_bytes = os.path.getsize(source)
+    duration = float(probe_video(source)['format']['duration'])
+    output = lambda name: os.path.join(temp_dir, f"{label}_{name}.mkv")
+
+    def run(name, function, *args, output_file=None, input_bytes=source_bytes, **kwargs):
+        if selected(name):
+            results[f"{name}[{label}]"] = measure(temp_dir, function, *args,
+                                                  input_bytes=input_bytes,
+                                                  output_file=output_file, **kwargs)
+
+    start_frame, end_frame = int(duration * fps / 4), int(duration * fps * 3 / 4)
+    for seek in ('copy', 'smart'):
+        run(f'cut_video_by_frames_{seek}', cut_video_by_frames, source, output(f'cut_{seek}'),
+            start_frame, end_frame, fps, seek=seek, output_file=output(f'cut_{seek}'))
+    run('keep_even_frames', keep_even_frames, source, output('even'),
+        output_file=output('even'))
+    run('concatenate_videos', concatenate_videos, [source] * 3, output('concat'),
+        output_file=output('concat'), input_bytes=source_bytes * 3)
+    run('convert_to_h264_mkv', convert_to_h264_mkv, source, output('single'),
+        output_file=output('single'))
+    run('convert_to_h264_mkv_segmented', convert_to_h264_mkv, source, output('segmented'),
+        segments=segments, output_file=output('segmented'))
+
+    # Pipeline dos datasets do YouTube (Sidewalk): corte + frames pares + codificação
+    pipeline = VideoPipeline(source).cut_frames(start_frame, end_frame, fps).keep_even_frames()
+    run('pipeline_youtube', pipeline.run, output('pipeline'), output_file=output('pipeline'))
+
+    # Mesmas três etapas como processos separados: em sequência, com
+    # intermediários em disco, e encadeadas por pipes (run_piped_stages)
+    start_time, cut_duration = start_frame / fps, (end_frame - start_frame) / fps
+    def sequential_stages(output_file):
+        cut_video_by_frames(source, output('seq_cut'), start_frame, end_frame, fps)
+        keep_even_frames(output('seq_cut'), output('seq_even'))
+        convert_to_h264_mkv(output('seq_even'), output_file)
+    run('stages_sequential', sequential_stages, output('sequential'),
+        output_file=output('sequential'))
+    run('stages_piped', run_piped_stages, ffmpeg_chain(source, output('piped'), [
+        ('cut', ['-t', str(cut_duration)], ['-ss', str(start_time)]),
+        ('filter', ['-vf', EVEN_FRAMES_FILTER]),
+        ('encode', ['-c:v', 'libx264', '-crf', '23', '-preset', 'medium', '-c:a', 'aac']),
+    ]), output_file=output('piped'))
+
+    for name in os.listdir(temp_dir):
+        if name.startswith(f"{label}_"):
+            os.remove(os.path.join(temp_dir, name))
+
+def bench_fragment_download(temp_dir, source, label, fps, results, selected):
+    """Download de uma fonte HLS local com um fragmento por vez e com vários em paralelo"""
+    workers = sorted({1, YOUTUBE_FRAGMENT_WORKERS})
+    names = {n: f'youtube_fragments_{n}' for n in workers}
+    if not any(selected(name) for name in names.values()):
+        return
+    hls_dir = os.path.join(temp_dir, f"{label}_hls")
+    make_hls_source(source, hls_dir, fps)
+    hls_bytes = directory_size(hls_dir)
+
+    handler = functools.partial(SlowRequestHandler, directory=hls_dir)
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/master.m3u8"
+    # Sem cache, cada medida baixa de novo
+    previous_cache = os.environ.get(CACHE_ENV)
+    os.environ[CACHE_ENV] = 'off'
+    try:
+        for n, name in names.items():
+            if not selected(name):
+                continue
+            output_path = os.path.join(temp_dir, f"{label}_fragments_{n}.%(ext)s")
+            results[f"{name}[{label}]"] = measure(
+                temp_dir, download_youtube_video, url, output_path, fragment_workers=n,
+                input_bytes=hls_bytes, output_file=os.path.join(
+                    temp_dir, f"{label}_fragments_{n}.mp4"))
+    finally:
+        server.shutdown()
+        server.server_close()
+        if previous_cache is None:
+            del os.environ[CACHE_ENV]
+        else:
+            os.environ[CACHE_ENV] = previous_cache
+    shutil.rmtree(hls_dir)
+
+def bench_image_operations(temp_dir, size, count, fps, results, selected):
+    """Operações sobre imagens: sequência JPEG, tar.xz aninhado e pipelines do Zenodo"""
+    image_dir = os.path.join(temp_dir, 'images')
+    make_jpeg_sequence(image_dir, count, size, fps)
+    image_bytes = directory_size(image_dir)
+    label = f"{size}x{count}"
+
+    def run(name, function, *args, output_file=None, input_bytes=image_bytes, **kwargs):
+        if selected(name):
+            results[f"{name}[{label}]"] = measure(temp_dir, function, *args,
+                                                  input_bytes=input_bytes,
+                                                  output_file=output_file, **kwargs)
+
+    output = os.path.join(temp_dir, 'images.mkv')
+    run('images_to_video', images_to_video, image_dir, output, fps, '%08d.jpg',
+        output_file=output)
+
+    archive = os.path.join(temp_dir, 'P2E_S5.tar.xz')
+    nested = make_nested_tar(archive, image_dir, parts=3)
+    archive_bytes = os.path.getsize(archive)
+    extract_dir = os.path.join(temp_dir, 'extracted')
+    os.makedirs(extract_dir, exist_ok=True)
+    run('extract_tar_xz', extract_tar_xz, archive, extract_dir, input_bytes=archive_bytes)
+    if not all(os.path.exists(os.path.join(extract_dir, name)) for name in nested):
+        extract_tar_xz(archive, extract_dir)
+
+    # Extração antiga (lzma do Python, uma thread) contra a atual, com o
+    # arquivo externo e os aninhados, num arquivo de um bloco e num de vários
+    multiblock = os.path.join(temp_dir, 'P2E_S5_multiblock.tar.xz')
+    make_multiblock_xz(archive, multiblock)
+    for name, path in (('single_block', archive), ('multiblock', multiblock)):
+        for backend, function in (('lzma', extract_tar_xz_lzma), ('parallel', extract_tar_xz)):
+            target = os.path.join(temp_dir, f'extract_{name}_{backend}')
+            os.makedirs(target)
+            run(f'extract_nested_{name}_{backend}', function, path, target, nested=True,
+                input_bytes=os.path.getsize(path))
+            shutil.rmtree(target)
+
+    nested_files = [os.path.join(extract_dir, name) for name in nested]
+    output = os.path.join(temp_dir, 'tar_images.mkv')
+    run('tar_images_to_video', tar_images_to_video, nested_files, output, fps,
+        output_file=output, input_bytes=sum(map(os.path.getsize, nested_files)))
+
+    # Pipeline completo do Choke1: extração do arquivo externo + imagens em fluxo
+    def choke1_pipeline(output_file):
+        pipeline_dir = os.path.join(temp_dir, 'choke1')
+        os.makedirs(pipeline_dir, exist_ok=True)
+        extract_tar_xz(archive, pipeline_dir)
+        tar_images_to_video([os.path.join(pipeline_dir, name) for name in nested],
+                            output_file, fps)
+        cleanup_temp_files(*[os.path.join(pipeline_dir, name) for name in nested])
+
+    output = os.path.join(temp_dir, 'choke1.mkv')
+    run('pipeline_choke1', choke1_pipeline, output, output_file=output,
+        input_bytes=archive_bytes)
+
+# Inicializações medidas em um interpretador novo: o próprio Python, o
+# `from video_utils import *` dos scripts, a carga de um script do Zenodo e o
+# yt_dlp, importado só quando um dataset do YouTube baixa o vídeo
+COLD_START_COMMANDS = {
+    'cold_start_python': 'pass',
+    'cold_start_video_utils': 'from video_utils import *',
+    'cold_start_zenodo_script': 'import choke1_script',
+    'cold_start_yt_dlp': 'from video_utils import *; import yt_dlp',
+}
+
+def bench_cold_start(results, selected, runs=5):
+    """Tempo de inicialização (melhor de `runs`) de cada comando em um novo interpretador"""
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    for name, code in COLD_START_COMMANDS.items():
+        if not selected(name):
+            continue
+        times = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-c', code], cwd=repo_dir, check=True)
+            times.append(time.perf_counter() - start)
+        results[name] = {'seconds': round(min(times), 3)}
+
+def compare(results, baseline, tolerance):
+    """
+    Compara os tempos com um resultado anterior
+
+    Returns:
+        list[str]: Operações mais lentas que o anterior além da tolerância
+    """
+    regressions = []
+    print(f"\n{'Operação':<50} {'antes':>9} {'agora':>9} {'variação':>9}")
+    for name, result in results.items():
+        before = baseline.get('results', {}).get(name)
+        if not before or not before.get('seconds'):
+            continue
+        change = result['seconds'] / before['seconds'] - 1
+        mark = ''
+        # Diferenças de poucos centésimos são ruído de medição
+        if change > tolerance and result['seconds'] - before['seconds'] > 0.05:
+            regressions.append(name)
+            mark = '  ⚠️'
+        print(f"{name:<50} {before['seconds']:8.2f}s {result['seconds']:8.2f}s "
+              f"{change:+8.1%}{mark}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--profile', choices=PROFILES, default='quick',
+                        help="Tamanho das entradas sintéticas (quick: 360p; full: 1080p e 4K)")
+    parser.add_argument('--segments', type=int, default=os.cpu_count() or 2,
+                        help="Partes da codificação segmentada")
+    parser.add_argument('--only', nargs='+', default=None,
+                        help="Mede apenas as operações cujo nome contém um destes termos")
+    parser.add_argument('--output', help="Arquivo JSON onde salvar o resultado")
+    parser.add_argument('--baseline', help="Resultado anterior (JSON) para comparação")
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help="Lentidão relativa tolerada antes de apontar regressão")
+    args = parser.parse_args()
+
+    profile = PROFILES[args.profile]
+    selected = lambda name: not args.only or any(term in name for term in args.only)
+    results = {}
+    bench_cold_start(results, selected)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for size, duration in profile['videos']:
+            source = os.path.join(temp_dir, f"source_{size}.mp4")
+            make_synthetic_video(source, duration, size, profile['fps'])
+            bench_video_operations(temp_dir, source, size, profile['fps'],
+                                   args.segments, results, selected)
+            bench_fragment_download(temp_dir, source, size, profile['fps'], results, selected)
+            os.remove(source)
+        size, count = profile['images']
+        bench_image_operations(temp_dir, size, count, profile['fps'], results, selected)
+
+    report = {
+        'profile': args.profile,
+        'cpu_count': os.cpu_count(),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'ffmpeg': ffmpeg_version(),
+        'results': results,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('profile') != args.profile:
+            print(f"Aviso: o resultado anterior usa o perfil {baseline.get('profile')}")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n⚠️  {len(regressions)} operação(ões) mais lenta(s) que o anterior.")
+            sys.exit(1)
+        print("\nNenhuma regressão encontrada.")
+
+if __name__ == "__main__":
+    main()
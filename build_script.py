@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Script para construir os datasets descritos em datasets.toml
+
+Cada origem é baixada uma única vez, mesmo quando vários datasets usam
+trechos dela, e apenas os vídeos desatualizados são reconstruídos (veja
+build_datasets em video_utils). Com --dry-run, nada é executado: o script
+estima, por origem e por dataset, os bytes a baixar, o tempo de codificação
+e o pico de disco temporário.
+
+Uso:
+    python build_script.py
+    python build_script.py --only Terminal1 Terminal2
+    python build_script.py --dry-run --calibration baseline.json
+"""
+
+import argparse
+import os
+from collections import Counter
+from video_utils import *
+
+def print_estimates(estimates, pixel_rate):
+    """Imprime a estimativa de cada origem e os totais"""
+    unknown = lambda value, fmt: '?' if value is None else fmt(value)
+    print(f"Vazão do libx264: {pixel_rate / 1e6:.1f} Mpixels/s\n")
+    print(f"{'Dataset':<14} {'Situação':<22} {'Quadros':>8} {'Codificação':>12}")
+
+    total_download = total_encode = peak_scratch = 0
+    unknowns = False
+    for estimate in estimates:
+        print(f"{estimate['url']}")
+        for row in estimate['datasets']:
+            status = f"refazer de '{row['changed']}'" if row['changed'] else "atualizado"
+            print(f"  {row['name']:<12} {status:<22} "
+                  f"{unknown(row['frames'], str):>8} "
+                  f"{unknown(row['encode_seconds'], lambda s: f'{s:.0f}s'):>12}")
+            if row['encode_seconds'] is None:
+                unknowns = True
+            else:
+                total_encode += row['encode_seconds']
+        print(f"  download: {unknown(estimate['download_bytes'], format_size)}, "
+              f"disco temporário: {unknown(estimate['scratch_bytes'], format_size)}")
+        if estimate['download_bytes'] is None:
+            unknowns = True
+        else:
+            total_download += estimate['download_bytes']
+            peak_scratch = max(peak_scratch, estimate['scratch_bytes'])
+
+    print(f"\nTotal a baixar: {format_size(total_download)}")
+    print(f"Codificação (sequencial): {total_encode / 60:.1f} min")
+    print(f"Pico de disco temporário (uma origem por vez): {format_size(peak_scratch)}")
+    if unknowns:
+        print("Valores '?' não puderam ser estimados e ficaram fora dos totais.")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--manifest', default=MANIFEST_FILE, help="Manifesto dos datasets")
+    parser.add_argument('--only', nargs='+', default=None,
+                        help="Constrói apenas estes datasets (ex: Street Terminal1)")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Apenas estima download, codificação e disco, sem executar")
+    parser.add_argument('--calibration', default=None,
+                        help="Resultado do benchmark_script (JSON) com a vazão do libx264; "
+                             "sem ele, uma calibração rápida é executada")
+    parser.add_argument('--force', action='store_true',
+                        help="Reconstrói os vídeos mesmo que estejam atualizados")
+    args = parser.parse_args()
+
+    if args.force:
+        os.environ[FORCE_ENV] = '1'
+    datasets = load_manifest(args.manifest)
+
+    if args.dry_run:
+        if args.calibration:
+            pixel_rate = encoder_rate_from_benchmark(args.calibration)
+        else:
+            # Calibra com o CRF/preset mais usado entre os datasets escolhidos
+            chosen = [dataset for group in plan_datasets(datasets, args.only)
+                      for dataset in group['datasets']]
+            crf, preset = Counter((dataset['crf'], dataset['preset'])
+                                  for dataset in chosen).most_common(1)[0][0]
+            pixel_rate = calibrate_encoder(crf=crf, preset=preset)
+        print_estimates(estimate_datasets(datasets, args.only, pixel_rate), pixel_rate)
+        return
+
+    build_datasets(datasets, args.only)
+    print("Construção concluída!")
+
+if __name__ == "__main__":
+    main()
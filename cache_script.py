@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Script para inspecionar e limpar o cache de downloads
+
+O prune também descarta, do cache de metadados do ffprobe, os arquivos que
+não existem mais ou foram alterados.
+
+Uso:
+    python cache_script.py ls
+    python cache_script.py prune [--max-size 20G]
+"""
+
+import argparse
+from datetime import datetime
+from video_utils import *
+
+def list_cache():
+    """Lista as entradas do cache, da usada há mais tempo para a mais recente"""
+    entries = cache_entries()
+    total_size = sum({entry['sha256']: entry['size'] for entry in entries}.values())
+
+    print(f"Cache: {get_cache_dir()}")
+    for entry in entries:
+        last_used = datetime.fromtimestamp(entry['last_used']).strftime('%Y-%m-%d %H:%M:%S')
+        print(f"{entry['sha256'][:12]}  {format_size(entry['size']):>11}  {last_used}  "
+              f"{entry['url']}")
+        if entry['variant']:
+            print(f"{'':14}{entry['variant']}")
+    print(f"Total: {len(entries)} entradas, {format_size(total_size)} "
+          f"(limite: {format_size(get_cache_max_size())})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Gerencia o cache de downloads")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('ls', help="Lista as entradas do cache")
+    prune_parser = subparsers.add_parser(
+        'prune', help="Remove as entradas usadas há mais tempo até caber no limite")
+    prune_parser.add_argument('--max-size', default=None,
+                              help="Tamanho máximo (ex: 20G); padrão: o limite configurado")
+    args = parser.parse_args()
+
+    if get_cache_dir() is None:
+        print("Cache de downloads desativado.")
+        return
+
+    if args.command == 'ls':
+        list_cache()
+    elif args.command == 'prune':
+        max_size = parse_size(args.max_size) if args.max_size else None
+        removed = cache_prune(max_size)
+        for entry in removed:
+            print(f"Removido: {entry['url']} ({format_size(entry['size'])})")
+        print(f"{len(removed)} entradas removidas.")
+        print(f"{probe_cache_prune()} metadados de arquivos removidos ou alterados descartados.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Script para exportar os vídeos finais para arquivos de quadros (.frames)
+
+Cada vídeo final já construído dos datasets de datasets.toml ganha, ao
+lado, um arquivo de quadros mapeável em memória (veja export_frame_store e
+FrameStore em video_utils), para acesso aleatório rápido durante o
+treinamento. Vídeos cujo arquivo de quadros já está atualizado são pulados.
+
+Uso:
+    python export_frames_script.py
+    python export_frames_script.py --compression zlib --only Street Terminal1
+"""
+
+import argparse
+import os
+from video_utils import *
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--manifest', default=MANIFEST_FILE, help="Manifesto dos datasets")
+    parser.add_argument('--chunk-frames', type=int, default=256, help="Quadros por bloco")
+    parser.add_argument('--compression', choices=['zlib'], default=None,
+                        help="Comprime cada bloco (sem compressão, a leitura não copia)")
+    parser.add_argument('--width', type=int, default=None,
+                        help="Largura dos quadros exportados (mantém a proporção)")
+    parser.add_argument('--only', nargs='+', default=None,
+                        help="Exporta apenas estes vídeos (ex: Street Terminal1)")
+    args = parser.parse_args()
+
+    videos = dataset_outputs(load_manifest(args.manifest), args.only)
+    if not videos:
+        print("Nenhum vídeo encontrado. Execute os scripts dos datasets primeiro.")
+        return
+
+    for video in videos:
+        store_file = os.path.splitext(video)[0] + '.frames'
+        stat = os.stat(video)
+        build = Build(store_file).stage(
+            'export', video=os.path.basename(video), size=stat.st_size,
+            mtime=stat.st_mtime_ns, chunk_frames=args.chunk_frames,
+            compression=args.compression, width=args.width)
+        if build.up_to_date():
+            continue
+        export_frame_store(video, store_file, chunk_frames=args.chunk_frames,
+                           compression=args.compression,
+                           size=(args.width, None) if args.width else None)
+        build.save()
+
+    print("Exportação concluída!")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Script para gerar versões reduzidas dos vídeos finais
+
+Cada vídeo final já construído dos datasets de datasets.toml ganha, em
+uma subpasta "renditions", uma versão para cada perfil pedido (720p, 480p,
+apenas frames pares...). Todas as versões de um vídeo saem de um único
+processo FFmpeg, que decodifica o vídeo uma só vez (veja make_renditions
+em video_utils). Vídeos cujas versões já estão atualizadas são pulados.
+
+Uso:
+    python renditions_script.py
+    python renditions_script.py --profiles 720p even --only Shibuya
+"""
+
+import argparse
+import os
+from video_utils import *
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--manifest', default=MANIFEST_FILE, help="Manifesto dos datasets")
+    parser.add_argument('--profiles', nargs='+', default=['720p', '480p', 'even'],
+                        choices=list(RENDITION_PROFILES), help="Perfis a gerar")
+    parser.add_argument('--crf', type=int, default=23, help="CRF das versões")
+    parser.add_argument('--preset', default='medium', help="Preset do libx264")
+    parser.add_argument('--only', nargs='+', default=None,
+                        help="Gera apenas para estes vídeos (ex: Shibuya Street)")
+    args = parser.parse_args()
+
+    videos = dataset_outputs(load_manifest(args.manifest), args.only)
+    if not videos:
+        print("Nenhum vídeo encontrado. Execute os scripts dos datasets primeiro.")
+        return
+
+    for video in videos:
+        rendition_dir = os.path.join(os.path.dirname(video), "renditions")
+        create_directory(rendition_dir)
+        name = os.path.splitext(os.path.basename(video))[0]
+        stat = os.stat(video)
+
+        outputs = {}
+        builds = []
+        for profile in args.profiles:
+            output_file = os.path.join(rendition_dir, f"{name}_{profile}.mkv")
+            build = Build(output_file).stage(
+                'encode', video=os.path.basename(video), size=stat.st_size,
+                mtime=stat.st_mtime_ns, profile=RENDITION_PROFILES[profile],
+                crf=args.crf, preset=args.preset)
+            if not build.up_to_date():
+                outputs[output_file] = RENDITION_PROFILES[profile]
+                builds.append(build)
+
+        if outputs:
+            make_renditions(video, outputs, crf=args.crf, preset=args.preset)
+            for build in builds:
+                build.save()
+
+    print("Versões concluídas!")
+
+if __name__ == "__main__":
+    main()
@@ -1,90 +1,311 @@
 #!/usr/bin/env python3
 """
 Script para executar todos os downloads de vídeos
+
+Cada dataset é um encadeamento de etapas (download, extract, cut, filter,
+encode). Os scripts rodam em paralelo e cada etapa pede uma vaga ao
+agendador: downloads disputam as vagas de rede e as demais etapas as vagas
+de CPU, de modo que o download de um dataset sobrepõe a codificação do
+anterior.
+
+Cada script pula a construção quando o arquivo final já corresponde às
+etapas e parâmetros declarados (veja Build em video_utils); use --force
+para reconstruir tudo.
+
+Com --in-process, os scripts rodam em threads deste processo (cada um com
+sua saída capturada à parte), sem pagar a inicialização de um interpretador
+e dos imports por script.
+
+Os diretórios temporários ficam em --scratch (ex: /dev/shm para trechos
+curtos) e, com --disk-budget, uma etapa só começa quando o que ela deve
+gravar cabe no orçamento; o pico de uso vai para o relatório.
 """
 
+import argparse
+import importlib
+import io
+import json
 import subprocess
 import sys
 import os
+import threading
+import time
+import traceback
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from video_utils import (StageBoard, StageBoardManager, STAGE_RESOURCES,
+                         SCHEDULER_ENV, DATASET_ENV, PRIORITY_ENV, FORCE_ENV,
+                         SCRATCH_ENV, parse_size, set_stage_board, set_stage_dataset,
+                         _stage_dataset)
 
-def run_script(script_name):
+_print_lock = threading.Lock()
+
+def run_script(script_name, env=None):
     """Executa um script Python e captura o resultado"""
-    print(f"\n{'='*60}")
-    print(f"Executando: {script_name}")
-    print(f"Iniciado em: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print(f"{'='*60}")
-    
+    started = datetime.now()
     try:
-        result = subprocess.run([sys.executable, script_name], 
+        result = subprocess.run([sys.executable, script_name], env=env,
                               capture_output=True, text=True, check=True)
-        print(result.stdout)
-        if result.stderr:
-            print("Avisos:", result.stderr)
-        print(f"✅ {script_name} concluído com sucesso!")
+        with _print_lock:
+            _print_header(script_name, started)
+            print(result.stdout)
+            if result.stderr:
+                print("Avisos:", result.stderr)
+            print(f"✅ {script_name} concluído com sucesso!")
         return True
     except subprocess.CalledProcessError as e:
-        print(f"❌ Erro ao executar {script_name}:")
-        print(f"Código de saída: {e.returncode}")
-        print(f"Stdout: {e.stdout}")
-        print(f"Stderr: {e.stderr}")
+        with _print_lock:
+            _print_header(script_name, started)
+            print(f"❌ Erro ao executar {script_name}:")
+            print(f"Código de saída: {e.returncode}")
+            print(f"Stdout: {e.stdout}")
+            print(f"Stderr: {e.stderr}")
         return False
     except FileNotFoundError:
-        print(f"❌ Arquivo {script_name} não encontrado!")
+        with _print_lock:
+            print(f"❌ Arquivo {script_name} não encontrado!")
         return False
 
+class _ThreadOutput(io.TextIOBase):
+    """
+    Encaminha o que cada script escreve para o buffer dele (ou para o destino original)
+
+    O script é identificado pelo dataset das etapas da thread (veja
+    set_stage_dataset), que o video_utils repassa às threads auxiliares que
+    cria; a saída de threads sem dataset vai para o destino original.
+    """
+
+    def __init__(self, default):
+        self._default = default
+        self._buffers = {}
+
+    def capture(self, dataset, buffer):
+        """Passa a guardar em `buffer` o que as threads de `dataset` escreverem (None encerra)"""
+        if buffer is None:
+            self._buffers.pop(dataset, None)
+        else:
+            self._buffers[dataset] = buffer
+
+    def _target(self):
+        return self._buffers.get(_stage_dataset(), self._default)
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        return self._target().write(text)
+
+    def flush(self):
+        self._target().flush()
+
+def run_script_in_process(script_name, priority):
+    """Importa um script e executa seu main() nesta thread, capturando a saída"""
+    started = datetime.now()
+    module_name = os.path.splitext(script_name)[0]
+    stdout, stderr = io.StringIO(), io.StringIO()
+    set_stage_dataset(module_name, priority)
+    sys.stdout.capture(module_name, stdout)
+    sys.stderr.capture(module_name, stderr)
+    try:
+        importlib.import_module(module_name).main()
+        success = True
+    except SystemExit as e:
+        success = e.code in (None, 0)
+    except Exception:
+        traceback.print_exc()
+        success = False
+    finally:
+        sys.stdout.capture(module_name, None)
+        sys.stderr.capture(module_name, None)
+
+    with _print_lock:
+        _print_header(script_name, started)
+        if success:
+            print(stdout.getvalue())
+            if stderr.getvalue():
+                print("Avisos:", stderr.getvalue())
+            print(f"✅ {script_name} concluído com sucesso!")
+        else:
+            print(f"❌ Erro ao executar {script_name}:")
+            print(f"Stdout: {stdout.getvalue()}")
+            print(f"Stderr: {stderr.getvalue()}")
+    return success
+
+def _print_header(script_name, started):
+    """Imprime o cabeçalho da saída de um script"""
+    print(f"\n{'='*60}")
+    print(f"Executando: {script_name}")
+    print(f"Iniciado em: {started.strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"Finalizado em: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"{'='*60}")
+
+def start_scheduler(board):
+    """
+    Publica o StageBoard para os scripts filhos
+
+    Returns:
+        str: Valor da variável de ambiente SCHEDULER_ENV para os filhos
+    """
+    authkey = os.urandom(16)
+    StageBoardManager.register('get_board', callable=lambda: board)
+    manager = StageBoardManager(address=('127.0.0.1', 0), authkey=authkey)
+    server = manager.get_server()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.address
+    return f"{host}:{port}:{authkey.hex()}"
+
+def print_stage_report(timings, wall_time, disk=None):
+    """Imprime o tempo de parede por etapa e por dataset e o pico de disco"""
+    per_stage = defaultdict(float)
+    per_dataset = defaultdict(lambda: defaultdict(float))
+    waited = defaultdict(float)
+    cpu = defaultdict(float)
+    for timing in timings:
+        per_stage[timing['stage']] += timing['seconds']
+        per_dataset[timing['dataset']][timing['stage']] += timing['seconds']
+        waited[timing['stage']] += timing['waited']
+        cpu[timing['stage']] += timing.get('cpu') or 0.0
+
+    print("\n⏱️  Tempo por etapa (soma entre datasets):")
+    for stage in STAGE_RESOURCES:
+        if stage in per_stage:
+            print(f"  {stage:<10} {per_stage[stage]:10.1f}s  CPU {cpu[stage]:10.1f}s"
+                  f"  (espera por vaga: {waited[stage]:.1f}s)")
+
+    print("\n⏱️  Tempo por dataset:")
+    for dataset, stages in per_dataset.items():
+        detail = ", ".join(f"{stage} {seconds:.1f}s"
+                           for stage, seconds in stages.items())
+        print(f"  {dataset}: {detail}")
+
+    print("\n⏱️  Etapas mais lentas:")
+    for timing in sorted(timings, key=lambda timing: timing['seconds'], reverse=True)[:5]:
+        peak_rss = (timing.get('peak_rss') or 0) / 2**20
+        print(f"  {timing['dataset']}/{timing['stage']}: {timing['seconds']:.1f}s, "
+              f"CPU {timing.get('cpu') or 0:.1f}s, pico de RSS {peak_rss:.0f} MiB, "
+              f"{timing.get('fps') or 0:.1f} fps")
+
+    if disk and disk['peak']:
+        budget = f" (orçamento {disk['budget'] / 2**30:.1f} GiB)" if disk['budget'] else ""
+        print(f"\n💾 Pico de disco temporário: {disk['peak'] / 2**30:.2f} GiB{budget}")
+        for dataset, peak in sorted(disk['datasets'].items(), key=lambda item: -item[1]):
+            print(f"  {dataset}: {peak / 2**30:.2f} GiB")
+
+    print(f"\nTempo total de parede: {wall_time:.1f}s")
+
+def write_run_report(path, timings, wall_time, results, disk=None):
+    """Grava o relatório da execução (etapas, métricas, disco e resultados) em JSON"""
+    report = {
+        'finished': datetime.now().isoformat(timespec='seconds'),
+        'wall_time': wall_time,
+        'scripts': results,
+        'stages': timings,
+        'disk': disk,
+    }
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Relatório da execução salvo em: {path}")
+
 def main():
     """Função principal"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--jobs', '-j', type=int, default=2,
+                        help="Etapas de CPU (extract/cut/filter/encode) simultâneas")
+    parser.add_argument('--downloads', type=int, default=2,
+                        help="Downloads simultâneos")
+    parser.add_argument('--force', action='store_true',
+                        help="Reconstrói os vídeos mesmo que estejam atualizados")
+    parser.add_argument('--report', default='run_report.json',
+                        help="Arquivo JSON com tempo, CPU, pico de RSS e fps de cada etapa")
+    parser.add_argument('--scratch', default=None,
+                        help="Diretório dos temporários (padrão: temporário do sistema)")
+    parser.add_argument('--disk-budget', default=None,
+                        help="Espaço máximo dos temporários (ex: 20G); "
+                             "etapas esperam por espaço")
+    parser.add_argument('--in-process', action='store_true',
+                        help="Executa os scripts em threads deste processo, não em subprocessos")
+    args = parser.parse_args()
+
     scripts = [
-        "download_choke1.py",
-        "download_choke2.py",
-        "download_street.py",
-        "download_sidewalk.py",
-        "download_bengal.py",
-        "download_terminal1.py",
-        "download_terminal2.py",
-        "download_terminal3.py",
-        "download_terminal4.py",
-        "download_shibuya.py"
+        "choke1_script.py",
+        "choke2_script.py",
+        "street_script.py",
+        "sidewalk_script.py",
+        "bengal_script.py",
+        "terminals_script.py",  # Terminal1-4 compartilham o mesmo vídeo de origem
+        "shibuya_script.py"
     ]
-    
+
     print("🎬 Iniciando download e processamento de todos os vídeos...")
     print(f"Total de scripts: {len(scripts)}")
+    print(f"Etapas de CPU simultâneas: {args.jobs}, downloads simultâneos: {args.downloads}")
     print(f"Iniciado em: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    
+
     # Verificar se todos os scripts existem
     missing_scripts = [script for script in scripts if not os.path.exists(script)]
     if missing_scripts:
         print(f"❌ Scripts não encontrados: {missing_scripts}")
         return
-    
+
     # Verificar se video_utils.py existe
     if not os.path.exists("video_utils.py"):
         print("❌ Arquivo video_utils.py não encontrado!")
         return
-    
-    successful = 0
-    failed = 0
-    
-    for script in scripts:
-        if run_script(script):
-            successful += 1
-        else:
-            failed += 1
-            print(f"⚠️  Continuando com os próximos scripts...")
-    
+
+    board = StageBoard(network_jobs=args.downloads, cpu_jobs=args.jobs,
+                       disk_budget=parse_size(args.disk_budget) if args.disk_budget else None)
+    if args.in_process:
+        # As etapas usam o StageBoard diretamente; as variáveis de ambiente
+        # comuns a todos os scripts valem para o processo inteiro
+        set_stage_board(board)
+        if args.force:
+            os.environ[FORCE_ENV] = '1'
+        if args.scratch:
+            os.environ[SCRATCH_ENV] = os.path.abspath(args.scratch)
+        sys.stdout = _ThreadOutput(sys.stdout)
+        sys.stderr = _ThreadOutput(sys.stderr)
+
+        def run_dataset(priority, script):
+            return run_script_in_process(script, priority)
+    else:
+        scheduler_address = start_scheduler(board)
+
+        def run_dataset(priority, script):
+            env = dict(os.environ)
+            env[SCHEDULER_ENV] = scheduler_address
+            env[DATASET_ENV] = os.path.splitext(script)[0]
+            env[PRIORITY_ENV] = str(priority)
+            if args.force:
+                env[FORCE_ENV] = '1'
+            if args.scratch:
+                env[SCRATCH_ENV] = os.path.abspath(args.scratch)
+            return run_script(script, env=env)
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(scripts)) as executor:
+        results = list(executor.map(run_dataset, range(len(scripts)), scripts))
+    wall_time = time.perf_counter() - wall_start
+
+    successful = results.count(True)
+    failed = results.count(False)
+
     print(f"\n{'='*60}")
     print("📊 RELATÓRIO FINAL")
     print(f"{'='*60}")
     print(f"Scripts executados: {len(scripts)}")
     print(f"✅ Sucessos: {successful}")
     print(f"❌ Falhas: {failed}")
+    timings = board.timings()
+    disk = board.disk_report()
+    print_stage_report(timings, wall_time, disk)
+    write_run_report(args.report, timings, wall_time, dict(zip(scripts, results)), disk)
     print(f"Concluído em: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    
+
     if failed > 0:
         print(f"\n⚠️  {failed} script(s) falharam. Verifique os logs acima.")
     else:
-        print(f"\n🎉 Todos os scripts foram executados com sucesso!")
+        print("\n🎉 Todos os scripts foram executados com sucesso!")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,18 @@
+#!/usr/bin/env python3
+"""
+Script para baixar e processar Terminal1, Terminal2, Terminal3 e Terminal4
+
+Os quatro vídeos são trechos do mesmo vídeo do YouTube, então a origem é
+baixada uma única vez e cada trecho é cortado e codificado a partir dela.
+
+A configuração de cada trecho está em datasets.toml (veja build_datasets
+em video_utils).
+"""
+
+from video_utils import *
+
+def main():
+    build_datasets(load_manifest(), only=["Terminal1", "Terminal2", "Terminal3", "Terminal4"])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Retomada de download_file contra um servidor HTTP local com suporte a Range"""
+
+import hashlib
+import http.server
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import video_utils
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAYLOAD = os.urandom(3 * 1024 * 1024 + 123)
+
+
+class RangeHandler(http.server.BaseHTTPRequestHandler):
+    """Serve PAYLOAD com HEAD/GET e Range, em blocos pequenos e com pausa entre eles"""
+
+    delay = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def _headers(self, status, start, end):
+        self.send_response(status)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(end - start))
+        if status == 206:
+            self.send_header('Content-Range', f"bytes {start}-{end - 1}/{len(PAYLOAD)}")
+        self.end_headers()
+
+    def do_HEAD(self):
+        self._headers(200, 0, len(PAYLOAD))
+
+    def do_GET(self):
+        start, end, status = 0, len(PAYLOAD), 200
+        header = self.headers.get('Range')
+        if header:
+            first, _, last = header.removeprefix('bytes=').partition('-')
+            start, end, status = int(first), int(last) + 1 if last else len(PAYLOAD), 206
+        self._headers(status, start, end)
+        try:
+            for offset in range(start, end, 16 * 1024):
+                self.wfile.write(PAYLOAD[offset:min(offset + 16 * 1024, end)])
+                time.sleep(self.delay)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setenv(video_utils.CACHE_ENV, 'off')
+    RangeHandler.delay = 0.0
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), RangeHandler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_port}/payload.bin"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _sha256(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def test_download_in_ranges(server, tmp_path):
+    target = tmp_path / 'payload.bin'
+    video_utils.download_file(server, str(target), connections=4)
+    assert _sha256(target) == hashlib.sha256(PAYLOAD).hexdigest()
+    assert not os.path.exists(str(target) + '.part.json')
+
+
+def test_preallocated_part_without_state_restarts(server, tmp_path):
+    # Processo morto entre a pré-alocação e a primeira gravação do estado
+    target = tmp_path / 'payload.bin'
+    with open(str(target) + '.part', 'wb') as f:
+        f.truncate(len(PAYLOAD))
+    video_utils.download_file(server, str(target), connections=4)
+    assert _sha256(target) == hashlib.sha256(PAYLOAD).hexdigest()
+
+
+def test_killed_download_resumes(server, tmp_path):
+    RangeHandler.delay = 0.02
+    target = tmp_path / 'payload.bin'
+    state_file = str(target) + '.part.json'
+    # Leituras e gravações pequenas: o estado registra progresso logo no início
+    code = (f"import video_utils; video_utils.DOWNLOAD_CHUNK_SIZE = 16 * 1024; "
+            f"video_utils.DOWNLOAD_BUFFER_SIZE = 64 * 1024; "
+            f"video_utils.download_file({server!r}, {str(target)!r}, connections=3)")
+    process = subprocess.Popen([sys.executable, '-c', code], cwd=REPO_DIR,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 30
+        done = 0
+        while done == 0 and process.poll() is None and time.monotonic() < deadline:
+            time.sleep(0.05)
+            try:
+                with open(state_file) as f:
+                    done = sum(progress for _, _, progress in json.load(f)['ranges'])
+            except (OSError, ValueError):
+                pass
+        assert done > 0, "o download não gravou progresso"
+        process.send_signal(signal.SIGKILL)
+    finally:
+        process.wait()
+    assert not target.exists()
+
+    RangeHandler.delay = 0.0
+    video_utils.download_file(server, str(target), connections=3)
+    assert _sha256(target) == hashlib.sha256(PAYLOAD).hexdigest()
+    assert not os.path.exists(state_file)
@@ -0,0 +1,91 @@
+"""Agrupamento dos datasets por origem (plan_datasets) e união de trechos (merge_sections)"""
+
+import os
+
+import pytest
+
+import video_utils
+
+MANIFEST = os.path.join(os.path.dirname(video_utils.__file__), video_utils.MANIFEST_FILE)
+TERMINALS = ['Terminal1', 'Terminal2', 'Terminal3', 'Terminal4']
+
+
+def _youtube(name, start, end, url='https://www.youtube.com/watch?v=x', fps=30, **extra):
+    return {'name': name, 'kind': 'youtube', 'url': url, 'fps': fps,
+            'start_time': start, 'end_time': end, **extra}
+
+
+def _sections(plan):
+    return [(group['section'], [dataset['name'] for dataset in group['datasets']])
+            for group in plan]
+
+
+@pytest.mark.parametrize('ranges, merged', [
+    ([(0, 10), (5, 20)], [(0, 20)]),                 # Sobrepostos
+    ([(0, 10), (10, 20)], [(0, 20)]),                # Adjacentes
+    ([(0, 30), (5, 10)], [(0, 30)]),                 # Contido no anterior
+    ([(0, 10), (19.5, 30)], [(0, 30)]),              # Mais perto que a margem
+    ([(0, 10), (20, 30)], [(0, 10), (20, 30)]),      # Exatamente a margem
+    ([(100, 110), (0, 10), (5, 20)], [(0, 20), (100, 110)]),
+    ([], []),
+])
+def test_merge_sections(ranges, merged):
+    assert video_utils.merge_sections(ranges) == merged
+
+
+def test_merge_sections_gap():
+    assert video_utils.merge_sections([(0, 10), (15, 20)], gap=0) == [(0, 10), (15, 20)]
+    assert video_utils.merge_sections([(0, 10), (15, 20)], gap=6) == [(0, 20)]
+
+
+def test_terminals_download_one_section_each():
+    plan = video_utils.plan_datasets(video_utils.load_manifest(MANIFEST), only=TERMINALS)
+    assert len({group['url'] for group in plan}) == 1
+    assert sorted(_sections(plan)) == [
+        ((80.0, 158.0), ['Terminal1']),        # Frames 2400-4740 a 30 fps
+        ((405.0, 441.0), ['Terminal4']),
+        ((1189.0, 1215.0), ['Terminal3']),
+        ((1417.0, 1492.0), ['Terminal2']),
+    ]
+
+
+def test_nearby_datasets_share_a_section():
+    datasets = [_youtube('A', '00:01:00', '00:01:30'),
+                _youtube('B', '00:01:20', '00:02:00'),   # Sobreposto a A
+                _youtube('C', '00:02:00', '00:02:10'),   # Adjacente a B
+                _youtube('D', '00:10:00', '00:10:10')]
+    plan = video_utils.plan_datasets(datasets)
+    assert _sections(plan) == [((60.0, 130.0), ['A', 'B', 'C']), ((600.0, 610.0), ['D'])]
+
+
+def test_different_sources_are_not_merged():
+    datasets = [_youtube('A', '00:01:00', '00:01:30'),
+                _youtube('B', '00:01:00', '00:01:30', fps=25),
+                _youtube('C', '00:01:00', '00:01:30', resolution='4K'),
+                _youtube('D', '00:01:00', '00:01:30', url='https://www.youtube.com/watch?v=y')]
+    plan = video_utils.plan_datasets(datasets)
+    assert [[dataset['name'] for dataset in group['datasets']] for group in plan] == \
+        [['A'], ['B'], ['C'], ['D']]
+
+
+def test_only_limits_the_sections_to_the_selected_datasets():
+    datasets = video_utils.load_manifest(MANIFEST)
+    plan = video_utils.plan_datasets(datasets, only=['Terminal2', 'Terminal3', 'Choke1'])
+    assert sorted(_sections(plan), key=str) == sorted([
+        ((1189.0, 1215.0), ['Terminal3']),
+        ((1417.0, 1492.0), ['Terminal2']),
+        (None, ['Choke1']),
+    ], key=str)
+
+    # Sem o trecho de B, A e C ficam longe demais para um download só
+    datasets = [_youtube('A', '00:01:00', '00:01:30'),
+                _youtube('B', '00:01:30', '00:02:30'),
+                _youtube('C', '00:02:30', '00:03:00')]
+    plan = video_utils.plan_datasets(datasets, only=['A', 'C'])
+    assert _sections(plan) == [((60.0, 90.0), ['A']), ((150.0, 180.0), ['C'])]
+
+
+def test_only_rejects_unknown_datasets():
+    datasets = video_utils.load_manifest(MANIFEST)
+    with pytest.raises(ValueError, match='Terminal5'):
+        video_utils.plan_datasets(datasets, only=['Terminal1', 'Terminal5'])
@@ -0,0 +1,88 @@
+"""Cache de metadados do ffprobe (_cached_probes) em SQLite"""
+
+import json
+import os
+import sqlite3
+
+import pytest
+
+import video_utils
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    directory = tmp_path / 'cache'
+    monkeypatch.setenv(video_utils.CACHE_ENV, str(directory))
+    monkeypatch.setattr(video_utils, '_probe_memory', {})
+    return directory
+
+
+def _rows(cache_dir):
+    with sqlite3.connect(cache_dir / video_utils.PROBE_CACHE_FILE) as db:
+        return sorted(db.execute('SELECT kind, path, size FROM probes'))
+
+
+def _fake_probe(path):
+    return json.dumps({'size': os.path.getsize(path)})
+
+
+def test_results_are_cached_until_the_file_changes(cache_dir, tmp_path):
+    video = tmp_path / 'a.mp4'
+    video.write_bytes(b'x' * 10)
+    calls = []
+    def run(path):
+        calls.append(path)
+        return _fake_probe(path)
+
+    assert video_utils._cached_probes('info', [str(video)], run) == [{'size': 10}]
+    video_utils._probe_memory.clear()
+    assert video_utils._cached_probes('info', [str(video)], run) == [{'size': 10}]
+    assert len(calls) == 1
+
+    video.write_bytes(b'x' * 20)
+    assert video_utils._cached_probes('info', [str(video)], run) == [{'size': 20}]
+    assert len(calls) == 2
+
+
+def test_changed_file_drops_rows_of_every_kind(cache_dir, tmp_path):
+    video = tmp_path / 'a.mp4'
+    video.write_bytes(b'x' * 10)
+    video_utils._cached_probes('info', [str(video)], _fake_probe)
+    video_utils._cached_probes('packets', [str(video)], _fake_probe)
+    assert [row[0] for row in _rows(cache_dir)] == ['info', 'packets']
+
+    video.write_bytes(b'x' * 20)
+    video_utils._cached_probes('info', [str(video)], _fake_probe)
+    assert _rows(cache_dir) == [('info', str(video), 20)]
+
+
+def test_probe_runs_without_holding_the_write_lock(cache_dir, tmp_path):
+    video = tmp_path / 'a.mp4'
+    video.write_bytes(b'x' * 10)
+    video_utils._cached_probes('info', [str(video)], _fake_probe)
+    video_utils._probe_memory.clear()
+    video.write_bytes(b'x' * 20)  # Força o DELETE da linha antiga
+
+    def run(path):
+        # Outro processo do run_all gravando enquanto este executa o ffprobe
+        other = sqlite3.connect(cache_dir / video_utils.PROBE_CACHE_FILE, timeout=0.1)
+        try:
+            with other:
+                other.execute("INSERT OR REPLACE INTO probes VALUES "
+                              "('info', '/outro.mp4', 1, 1, 1, '{}')")
+        finally:
+            other.close()
+        return _fake_probe(path)
+
+    assert video_utils._cached_probes('info', [str(video)], run) == [{'size': 20}]
+    assert ('info', '/outro.mp4', 1) in _rows(cache_dir)
+
+
+def test_paths_without_stat_are_probed_uncached(cache_dir, tmp_path):
+    video = tmp_path / 'a.mp4'
+    video.write_bytes(b'x' * 10)
+    missing = str(tmp_path / 'missing.mp4')
+    run = lambda path: json.dumps({'path': path})
+    results = video_utils._cached_probes('info', [missing, str(video)], run)
+    assert results == [{'path': missing}, {'path': str(video)}]
+    assert [row[1] for row in _rows(cache_dir)] == [str(video)]
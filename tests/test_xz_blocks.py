@@ -0,0 +1,105 @@
+"""Índice de blocos .xz (xz_blocks) e descompressão bloco a bloco (_xz_decompress_block)"""
+
+import lzma
+import random
+import shutil
+import subprocess
+
+import pytest
+
+import video_utils
+
+requires_xz = pytest.mark.skipif(not shutil.which('xz'), reason="requer o xz")
+
+
+def _data(size, seed=0):
+    # Metade aleatória e metade repetitiva, para blocos de tamanhos diferentes
+    rng = random.Random(seed)
+    return (rng.randbytes(size // 2) + b'video_datasets ' * size)[:size]
+
+
+def _blocks_content(path):
+    return b''.join(video_utils._xz_decompress_block(str(path), block)
+                    for block in video_utils.xz_blocks(str(path)))
+
+
+def _open_xz_content(path, workers):
+    with video_utils.open_xz(str(path), workers=workers) as f:
+        return f.read()
+
+
+def test_single_block(tmp_path):
+    path = tmp_path / 'single.xz'
+    path.write_bytes(lzma.compress(_data(100_000), format=lzma.FORMAT_XZ))
+    blocks = video_utils.xz_blocks(str(path))
+    assert len(blocks) == 1
+    assert _blocks_content(path) == lzma.decompress(path.read_bytes())
+    assert video_utils.xz_uncompressed_size(str(path)) == len(lzma.decompress(path.read_bytes()))
+
+
+@requires_xz
+def test_multiple_blocks(tmp_path):
+    source = tmp_path / 'multi'
+    source.write_bytes(_data(1_000_000))
+    subprocess.run(['xz', '-k', '-1', '--block-size=200000', str(source)], check=True)
+    path = tmp_path / 'multi.xz'
+
+    blocks = video_utils.xz_blocks(str(path))
+    assert len(blocks) == 5
+    assert [uncompressed for _, _, uncompressed, _ in blocks] == [200_000] * 5
+    expected = lzma.decompress(path.read_bytes())
+    for block, start in zip(blocks, range(0, len(expected), 200_000)):
+        content = video_utils._xz_decompress_block(str(path), block)
+        assert content == expected[start:start + 200_000]
+    assert _open_xz_content(path, workers=4) == expected
+
+
+def test_multiple_streams_with_padding(tmp_path):
+    streams = [lzma.compress(_data(size, seed), format=lzma.FORMAT_XZ, check=check)
+               for size, seed, check in [(50_000, 1, lzma.CHECK_CRC64),
+                                         (80_000, 2, lzma.CHECK_CRC32),
+                                         (30_000, 3, lzma.CHECK_SHA256)]]
+    path = tmp_path / 'streams.xz'
+    # Preenchimento de fluxo: múltiplos de 4 bytes nulos entre e depois dos fluxos
+    path.write_bytes(streams[0] + b'\0' * 4 + streams[1] + b'\0' * 8 + streams[2] + b'\0' * 4)
+
+    blocks = video_utils.xz_blocks(str(path))
+    assert len(blocks) == 3
+    assert len({flags for _, _, _, flags in blocks}) == 3
+    # lzma.decompress para no preenchimento: compara fluxo a fluxo
+    expected = b''.join(lzma.decompress(stream) for stream in streams)
+    assert _blocks_content(path) == expected
+    assert _open_xz_content(path, workers=4) == expected
+
+
+@pytest.mark.parametrize('corrupt', [
+    lambda data: data[:-1],                   # Truncado
+    lambda data: data[:-2] + b'ZZ',           # Assinatura do rodapé
+    lambda data: b'\0' * 12 + data[12:],      # Cabeçalho do fluxo
+    lambda data: b'nao e um arquivo xz' * 8,
+])
+def test_malformed_files_are_not_indexed(tmp_path, corrupt):
+    path = tmp_path / 'bad.xz'
+    path.write_bytes(corrupt(lzma.compress(_data(10_000), format=lzma.FORMAT_XZ)))
+    assert video_utils.xz_blocks(str(path)) is None
+    assert video_utils.xz_uncompressed_size(str(path)) == path.stat().st_size
+
+
+@pytest.mark.parametrize('external_xz', [False, pytest.param(True, marks=requires_xz)])
+def test_unindexed_files_fall_back_to_sequential_decompression(tmp_path, monkeypatch,
+                                                               external_xz):
+    if not external_xz:
+        monkeypatch.setattr(video_utils.shutil, 'which', lambda name: None)
+
+    # Formato .lzma antigo: sem índice de blocos, mas legível sequencialmente
+    data = lzma.compress(_data(100_000), format=lzma.FORMAT_ALONE)
+    path = tmp_path / 'alone.xz'
+    path.write_bytes(data)
+    assert video_utils.xz_blocks(str(path)) is None
+    assert _open_xz_content(path, workers=4) == lzma.decompress(data)
+
+    # Um bloco só: índice válido, mas nada a paralelizar
+    data = lzma.compress(_data(100_000), format=lzma.FORMAT_XZ)
+    path = tmp_path / 'single.xz'
+    path.write_bytes(data)
+    assert _open_xz_content(path, workers=4) == lzma.decompress(data)
@@ -0,0 +1,74 @@
+"""Escolha do formato do YouTube (choose_youtube_format) sobre uma lista fixa de formatos"""
+
+import pytest
+
+import video_utils
+
+MB = 1024 * 1024
+
+
+def _video(format_id, height, vcodec, fps, size):
+    return {'format_id': format_id, 'height': height, 'fps': fps, 'vcodec': vcodec,
+            'acodec': 'none', 'filesize': size}
+
+
+def _audio(format_id, acodec, size):
+    return {'format_id': format_id, 'vcodec': 'none', 'acodec': acodec, 'filesize': size}
+
+
+# Formatos típicos de um vídeo do YouTube, com os tamanhos do trecho inteiro
+FORMATS = [
+    {'format_id': '18', 'height': 360, 'fps': 30, 'vcodec': 'avc1.42001E',
+     'acodec': 'mp4a.40.2', 'filesize': 5 * MB},
+    _video('134', 360, 'avc1.4D401E', 30, 3 * MB),
+    _video('243', 360, 'vp09.00.21.08', 30, 2 * MB),
+    _video('136', 720, 'avc1.4D401F', 30, 20 * MB),
+    _video('247', 720, 'vp09.00.31.08', 30, 12 * MB),      # 24 com o custo do VP9
+    _video('298', 720, 'avc1.4D4020', 60, 35 * MB),
+    _video('137', 1080, 'avc1.640028', 30, 40 * MB),
+    _video('248', 1080, 'vp09.00.40.08', 30, 19 * MB),     # 38: mais leve que o H.264
+    _video('399', 1080, 'av01.0.08M.08', 30, 15 * MB),     # 45: AV1 decodifica devagar
+    _video('299', 1080, 'avc1.64002a', 60, 70 * MB),
+    _video('303', 1080, 'vp09.00.41.08', 60, 30 * MB),     # 60: o dobro de quadros pesa mais
+    _video('400', 1440, 'av01.0.12M.08', 30, 60 * MB),
+    _video('313', 2160, 'vp09.00.50.08', 30, 150 * MB),
+    _video('401', 2160, 'av01.0.12M.08', 30, 90 * MB),     # 270 contra 300 do VP9
+    _video('315', 2160, 'vp09.00.51.08', 60, 300 * MB),
+    _audio('139', 'mp4a.40.5', 1.2 * MB),
+    _audio('140', 'mp4a.40.2', 3 * MB),
+    _audio('249', 'opus', 1 * MB),                         # 1.5 com a recodificação
+    _audio('251', 'opus', 2.5 * MB),
+]
+
+
+@pytest.mark.parametrize('resolution, audio, expected', [
+    ('1080p', True, '248+139'),
+    ('1080p', False, '248'),
+    ('4K', True, '401+139'),
+    ('4K', False, '401'),
+    (None, False, '401'),
+])
+def test_choice_for_fixed_format_list(resolution, audio, expected):
+    assert video_utils.choose_youtube_format(FORMATS, resolution, audio) == expected
+
+
+def test_h264_is_kept_when_it_is_cheaper_to_decode():
+    formats = [fmt for fmt in FORMATS if fmt.get('height', 0) <= 720]
+    assert video_utils.choose_youtube_format(formats, audio=False) == '136'
+
+
+def test_sizes_from_bitrate_and_unknown_sizes():
+    formats = [{**_video('137', 1080, 'avc1.640028', 30, None), 'tbr': 4000},
+               {**_video('248', 1080, 'vp09.00.40.08', 30, None), 'tbr': 1500},
+               _video('399', 1080, 'av01.0.08M.08', 30, None)]
+    # 1500 kbit/s x 2 (VP9) < 4000 kbit/s do H.264; o AV1 sem tamanho fica por último
+    assert video_utils.choose_youtube_format(formats, audio=False, duration=60) == '248'
+    # Sem duração, nenhum tamanho é conhecido: vale a ordem da lista
+    assert video_utils.choose_youtube_format(formats, audio=False) == '137'
+
+
+def test_format_with_audio_and_no_video():
+    combined = [fmt for fmt in FORMATS if fmt['format_id'] in ('18', '139')]
+    assert video_utils.choose_youtube_format(combined, audio=True) == '18'
+    audios = [fmt for fmt in FORMATS if fmt['vcodec'] == 'none']
+    assert video_utils.choose_youtube_format(audios) is None
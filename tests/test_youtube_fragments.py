@@ -0,0 +1,120 @@
+"""Download de fragmentos HLS do download_youtube_video contra segmentos servidos localmente"""
+
+import functools
+import http.server
+import shutil
+import subprocess
+import threading
+import time
+
+import pytest
+
+import video_utils
+
+pytest.importorskip('yt_dlp')
+pytestmark = pytest.mark.skipif(not shutil.which('ffmpeg'), reason="requer o FFmpeg")
+
+SEGMENT_SECONDS = 0.5
+DURATION = 4
+
+
+class FragmentHandler(http.server.SimpleHTTPRequestHandler):
+    """Serve o diretório HLS com latência por segmento, contando as requisições simultâneas"""
+
+    latency = 0.1
+    fail_once = set()  # Segmentos que respondem 500 na primeira requisição
+    lock = threading.Lock()
+    active = 0
+    peak = 0
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if not self.path.endswith('.m4s'):
+            return super().do_GET()
+        cls = type(self)
+        with cls.lock:
+            cls.requests.append(self.path)
+            failing = self.path in cls.fail_once
+            cls.fail_once.discard(self.path)
+            cls.active += 1
+            cls.peak = max(cls.peak, cls.active)
+        try:
+            time.sleep(cls.latency)
+            if failing:
+                self.send_error(500)
+            else:
+                super().do_GET()
+        finally:
+            with cls.lock:
+                cls.active -= 1
+
+
+@pytest.fixture(scope='module')
+def hls_dir(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('hls')
+    subprocess.run([
+        'ffmpeg', '-v', 'error', '-f', 'lavfi',
+        '-i', f'testsrc2=size=160x120:rate=10:duration={DURATION}',
+        '-f', 'lavfi', '-i', f'sine=duration={DURATION}',
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-g', '5', '-c:a', 'aac',
+        '-f', 'hls', '-hls_time', str(SEGMENT_SECONDS), '-hls_segment_type', 'fmp4',
+        '-hls_playlist_type', 'vod',
+        '-hls_segment_filename', str(directory / 'seg%03d.m4s'),
+        str(directory / 'stream.m3u8'), '-y'
+    ], check=True)
+    return directory
+
+
+@pytest.fixture
+def server(hls_dir, monkeypatch):
+    monkeypatch.setenv(video_utils.CACHE_ENV, 'off')
+    FragmentHandler.active = FragmentHandler.peak = 0
+    FragmentHandler.requests = []
+    FragmentHandler.fail_once = set()
+    handler = functools.partial(FragmentHandler, directory=str(hls_dir))
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_port}/stream.m3u8"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _download(url, tmp_path, workers):
+    output = tmp_path / f'video_{workers}.%(ext)s'
+    offset = video_utils.download_youtube_video(url, str(output), fragment_workers=workers)
+    downloaded = video_utils.get_video_extension(str(output).replace('.%(ext)s', ''))
+    return offset, float(video_utils.probe_video(downloaded)['format']['duration'])
+
+
+def test_fragments_downloaded_in_parallel(server, tmp_path):
+    offset, duration = _download(server, tmp_path, 4)
+    assert offset == 0.0
+    assert duration == pytest.approx(DURATION, abs=0.1)
+    assert FragmentHandler.peak > 1
+
+
+def test_single_fragment_worker_is_sequential(server, tmp_path):
+    _, duration = _download(server, tmp_path, 1)
+    assert duration == pytest.approx(DURATION, abs=0.1)
+    assert FragmentHandler.peak == 1
+
+
+def test_failed_fragment_is_retried(server, tmp_path):
+    FragmentHandler.fail_once = {'/seg003.m4s'}
+    _, duration = _download(server, tmp_path, 4)
+    assert duration == pytest.approx(DURATION, abs=0.1)
+    assert FragmentHandler.requests.count('/seg003.m4s') == 2
+
+
+def test_section_downloads_only_get_reconnect_options():
+    options = video_utils._youtube_transfer_options(section=(10, 20), fragment_workers=4)
+    assert 'concurrent_fragment_downloads' not in options
+    assert '-reconnect' in options['external_downloader_args']['ffmpeg_i']
+
+    options = video_utils._youtube_transfer_options(fragment_workers=4)
+    assert options['concurrent_fragment_downloads'] == 4
+    assert options['skip_unavailable_fragments'] is False
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Script para conferir os vídeos finais dos datasets de datasets.toml
+
+Sem decodificar, conta os pacotes de vídeo e lê os metadados de cada vídeo
+com ffprobe, em paralelo, e compara com o trecho, o fps e a regra de frames
+pares do manifesto (veja validate_output em video_utils). Com --deep,
+decodifica também alguns GOPs sorteados de cada vídeo. Termina com código 1
+se algum vídeo estiver incorreto.
+
+Uso:
+    python validate_script.py
+    python validate_script.py --only Sidewalk Terminal1
+    python validate_script.py --deep 5
+"""
+
+import argparse
+import sys
+from video_utils import *
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--manifest', default=MANIFEST_FILE, help="Manifesto dos datasets")
+    parser.add_argument('--only', nargs='+', default=None,
+                        help="Confere apenas estes datasets (ex: Sidewalk Terminal1)")
+    parser.add_argument('--deep', type=int, nargs='?', const=3, default=0,
+                        help="Decodifica este número de GOPs sorteados por vídeo (padrão: 3)")
+    parser.add_argument('--seed', type=int, default=None, help="Semente do sorteio dos GOPs")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Vídeos conferidos ao mesmo tempo")
+    args = parser.parse_args()
+
+    reports = validate_datasets(load_manifest(args.manifest), only=args.only,
+                                deep=args.deep, workers=args.workers, seed=args.seed)
+    failed = 0
+    for name, report in reports.items():
+        if report['problems']:
+            failed += 1
+            print(f"❌ {name}: {'; '.join(report['problems'])}")
+        else:
+            print(f"✅ {name}: {report['frames']} quadros, {report['seconds']:.3f}s")
+
+    if failed:
+        print(f"\n{failed} de {len(reports)} vídeo(s) com problemas.")
+        sys.exit(1)
+    print(f"\nTodos os {len(reports)} vídeos conferem.")
+
+if __name__ == "__main__":
+    main()
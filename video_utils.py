@@ -1,161 +1,3005 @@
 import os
+import sys
+import hashlib
+import heapq
+import array
+import bisect
+import io
+import itertools
+import json
+import lzma
+import queue
+import random
+import shutil
+import struct
 import subprocess
-import requests
+import threading
+import time
+import zlib
 import tarfile
 import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, suppress
 from pathlib import Path
-import yt_dlp
-from tqdm import tqdm
+try:
+    import resource as resource_usage  # Só existe em sistemas Unix
+except ImportError:
+    resource_usage = None
 import re # Importa a biblioteca de expressões regulares
 
-def _run_ffmpeg_command(cmd):
-    """Função auxiliar para executar comandos FFmpeg com tratamento de erros."""
-    try:
-        subprocess.run(cmd, check=True, capture_output=True, text=True)
-    except subprocess.CalledProcessError as e:
+# yt_dlp, requests, tqdm, asyncio e multiprocessing.managers são importados
+# apenas dentro das funções que os usam: `from video_utils import *` fica
+# barato e os scripts do Zenodo nunca carregam o yt_dlp.
+
+# Linhas finais do stderr do FFmpeg guardadas para o relatório de erro
+FFMPEG_STDERR_LINES = 200
+
+def _wait_process(process):
+    """
+    Espera um processo filho terminar
+
+    Returns:
+        tuple: (código de saída, uso de recursos do filho via os.wait4, ou
+            None onde os.wait4 não existe)
+    """
+    if hasattr(os, 'wait4'):
+        _, status, rusage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        return process.returncode, rusage
+    return process.wait(), None
+
+def _process_metrics(wall, rusage, frames=0):
+    """Métricas de um processo filho concluído"""
+    metrics = {'wall': wall, 'cpu': None, 'peak_rss': None, 'frames': frames,
+               'fps': frames / wall if wall > 0 else 0.0}
+    if rusage is not None:
+        metrics['cpu'] = rusage.ru_utime + rusage.ru_stime
+        # ru_maxrss vem em KiB no Linux e em bytes no macOS
+        metrics['peak_rss'] = rusage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+    return metrics
+
+def _run_ffmpeg_command(cmd, duration=None, description=None, on_progress=None,
+                        record=True):
+    """
+    Função auxiliar para executar comandos FFmpeg com tratamento de erros.
+
+    O progresso é lido de `-progress pipe:1` enquanto o FFmpeg roda e mostrado
+    em uma barra do tqdm (em segundos de saída, de `duration` se informado);
+    cada bloco de progresso (frame, fps, speed, out_time_us...) também é
+    repassado a `on_progress`. Do stderr, só as últimas FFMPEG_STDERR_LINES
+    linhas são mantidas, para a mensagem de erro.
+
+    Returns:
+        dict: Métricas do processo (wall, cpu, peak_rss, frames, fps), também
+            somadas às da etapa em andamento se `record`
+    """
+    cmd = [cmd[0], '-nostats', '-progress', 'pipe:1'] + list(cmd[1:])
+    stderr_tail = deque(maxlen=FFMPEG_STDERR_LINES)
+    started = time.perf_counter()
+    process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE, text=True, errors='replace')
+    reader = threading.Thread(target=lambda: stderr_tail.extend(
+        line.rstrip('\n') for line in process.stderr), daemon=True)
+    reader.start()
+
+    from tqdm import tqdm
+    progress = {}
+    frames = 0
+    with tqdm(total=duration, desc=description, unit='s', leave=False,
+              disable=None, bar_format='{l_bar}{bar}| {n:.1f}/{total_fmt}s {postfix}') as bar:
+        for line in process.stdout:
+            key, _, value = line.strip().partition('=')
+            progress[key] = value
+            if key != 'progress':
+                continue
+            with suppress(ValueError):
+                frames = int(progress.get('frame', frames))
+            with suppress(ValueError):
+                bar.update(max(0.0, int(progress.get('out_time_us', 0)) / 1e6 - bar.n))
+            bar.set_postfix(fps=progress.get('fps'), speed=progress.get('speed'), refresh=False)
+            if on_progress:
+                on_progress(dict(progress))
+
+    returncode, rusage = _wait_process(process)
+    reader.join()
+    metrics = _process_metrics(time.perf_counter() - started, rusage, frames)
+    if returncode != 0:
+        e = subprocess.CalledProcessError(returncode, cmd, stderr='\n'.join(stderr_tail))
         print(f"Erro ao executar comando FFmpeg: {e}")
-        print(f"Stdout: {e.stdout}")
-        print(f"Stderr: {e.stderr}")
-        raise # Re-lança a exceção para que o chamador possa tratá-la
+        print(f"Stderr (últimas {FFMPEG_STDERR_LINES} linhas): {e.stderr}")
+        raise e # Re-lança a exceção para que o chamador possa tratá-la
+    if record:
+        _record_process_metrics(metrics)
+    return metrics
+
+# Cache de metadados do ffprobe: um SQLite no diretório do cache de downloads,
+# com uma linha por (tipo de consulta, caminho), válida enquanto tamanho, mtime
+# e inode do arquivo não mudarem. Sem o cache de downloads, os resultados
+# ficam só na memória do processo.
+PROBE_CACHE_FILE = 'probe.sqlite'
+PROBE_WORKERS = 8
+
+_probe_memory = {}
+_probe_memory_lock = threading.Lock()
+
+def _probe_key(path):
+    """(caminho absoluto, tamanho, mtime_ns, inode) de um arquivo"""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    return path, stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+@contextmanager
+def _probe_db():
+    """Conexão com o cache de metadados (None se desativado ou inacessível)"""
+    cache_dir = get_cache_dir()
+    if cache_dir is None:
+        yield None
+        return
+    import sqlite3
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        connection = sqlite3.connect(os.path.join(cache_dir, PROBE_CACHE_FILE), timeout=30)
+        # WAL: os scripts do run_all leem e gravam ao mesmo tempo
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('CREATE TABLE IF NOT EXISTS probes (kind TEXT, path TEXT, '
+                           'size INTEGER, mtime_ns INTEGER, inode INTEGER, data TEXT, '
+                           'PRIMARY KEY (kind, path))')
+    except (OSError, sqlite3.Error) as e:
+        print(f"Aviso: cache de metadados indisponível: {e}")
+        yield None
+        return
+    try:
+        with connection:
+            yield connection
+    finally:
+        connection.close()
+
+def _cached_probes(kind, paths, run, workers=None):
+    """
+    Resultados de `run(caminho)` (JSON do ffprobe) para cada caminho
+
+    Consulta a memória do processo, depois o SQLite (uma consulta para o
+    lote) e executa `run` em paralelo, fora de qualquer transação, só para
+    os arquivos novos ou alterados, gravando-os depois numa única transação
+    curta. As linhas de um arquivo
+    que mudou são apagadas (de todos os tipos de consulta). Caminhos sem
+    stat (URLs, arquivos inexistentes) vão direto para `run`, sem cache.
+    """
+    stat_paths = []
+    for path in paths:
+        try:
+            _probe_key(path)
+            stat_paths.append(path)
+        except OSError:
+            pass
+    if len(stat_paths) < len(paths):
+        cached = iter(_cached_probes(kind, stat_paths, run, workers) if stat_paths else [])
+        with_stat = set(stat_paths)
+        return [next(cached) if path in with_stat else json.loads(run(path))
+                for path in paths]
+
+    keys = [_probe_key(path) for path in paths]
+    found = {}
+    with _probe_memory_lock:
+        for key in keys:
+            if (kind, key) in _probe_memory:
+                found[key] = _probe_memory[(kind, key)]
+    missing = [key for key in dict.fromkeys(keys) if key not in found]
+    if not missing:
+        return [json.loads(found[key]) for key in keys]
+
+    # Leitura e limpeza numa transação curta: o ffprobe roda sem segurar o
+    # lock de escrita do SQLite, que os outros scripts do run_all disputam
+    with _probe_db() as db:
+        if db is not None:
+            wanted = set(missing)
+            changed = set()
+            for start in range(0, len(missing), 500):
+                batch = [key[0] for key in missing[start:start + 500]]
+                rows = db.execute(
+                    f"SELECT path, size, mtime_ns, inode, data FROM probes WHERE kind = ? "
+                    f"AND path IN ({','.join('?' * len(batch))})", [kind] + batch)
+                for path, size, mtime_ns, inode, data in rows:
+                    if (path, size, mtime_ns, inode) in wanted:
+                        found[(path, size, mtime_ns, inode)] = data
+                    else:
+                        changed.add(path)
+            db.executemany('DELETE FROM probes WHERE path = ?', [(path,) for path in changed])
+            missing = [key for key in missing if key not in found]
+
+    if missing:
+        workers = min(len(missing), workers or PROBE_WORKERS)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            probed = list(executor.map(_in_stage_context(lambda key: run(key[0])), missing))
+        found.update(zip(missing, probed))
+        with _probe_db() as db:
+            if db is not None:
+                db.executemany('INSERT OR REPLACE INTO probes VALUES (?, ?, ?, ?, ?, ?)',
+                               [(kind, *key, data) for key, data in zip(missing, probed)])
+
+    with _probe_memory_lock:
+        for key in dict.fromkeys(keys):
+            _probe_memory[(kind, key)] = found[key]
+    return [json.loads(found[key]) for key in keys]
+
+def _run_ffprobe(path):
+    cmd = [
+        'ffprobe', '-v', 'error', '-print_format', 'json',
+        '-show_format', '-show_streams', path
+    ]
+    result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+    return result.stdout
+
+def probe_videos(paths, workers=None):
+    """
+    Lê os fluxos e o formato de vários arquivos de mídia, com ffprobe em paralelo
+
+    Arquivos que não mudaram desde a última consulta (tamanho, mtime e
+    inode) vêm do cache de metadados, sem executar o ffprobe.
+
+    Returns:
+        list[dict]: Resultado de probe_video para cada caminho, na ordem de `paths`
+    """
+    return _cached_probes('info', list(paths), _run_ffprobe, workers)
+
+def probe_video(path):
+    """Lê os fluxos e o formato de um arquivo de mídia com ffprobe (veja probe_videos)"""
+    return probe_videos([path])[0]
+
+def probe_cache_prune():
+    """
+    Remove do cache de metadados os arquivos que não existem mais ou mudaram
+
+    Returns:
+        int: Linhas removidas
+    """
+    with _probe_db() as db:
+        if db is None:
+            return 0
+        stale = []
+        for kind, path, size, mtime_ns, inode in db.execute(
+                'SELECT kind, path, size, mtime_ns, inode FROM probes'):
+            try:
+                current = _probe_key(path)
+            except OSError:
+                current = None
+            if current != (path, size, mtime_ns, inode):
+                stale.append((kind, path))
+        db.executemany('DELETE FROM probes WHERE kind = ? AND path = ?', stale)
+    return len(stale)
+
+def _video_stream(info):
+    """Retorna o primeiro fluxo de vídeo de um resultado de probe_video"""
+    for stream in info.get('streams', []):
+        if stream.get('codec_type') == 'video':
+            return stream
+    return {}
+
+def _has_audio(info):
+    return any(stream.get('codec_type') == 'audio' for stream in info.get('streams', []))
+
+def _probe_fps(path):
+    """Taxa de quadros do vídeo de `path` (None se desconhecida)"""
+    return _frame_rate(_video_stream(probe_video(path))) or None
+
+def _probe_duration(path):
+    """Duração de `path` em segundos (None se desconhecida)"""
+    return float(probe_video(path)['format'].get('duration') or 0) or None
+
+def _same_video_format(infos):
+    """Verifica se os vídeos podem ser unidos pelo demuxer concat"""
+    signatures = set()
+    for info in infos:
+        video = _video_stream(info)
+        signatures.add((video.get('codec_name'), video.get('width'),
+                        video.get('height'), video.get('pix_fmt'), _has_audio(info)))
+    return len(signatures) == 1
+
+def _write_concat_list(video_files):
+    """Cria o arquivo de lista do demuxer concat e retorna seu caminho"""
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False) as f:
+        for video in video_files:
+            f.write(f"file '{os.path.abspath(video)}'\n")
+        return f.name
+
+# Recurso limitado por cada etapa do pipeline: downloads disputam a rede,
+# as demais etapas disputam a CPU.
+STAGE_RESOURCES = {
+    'download': 'network',
+    'extract': 'cpu',
+    'cut': 'cpu',
+    'filter': 'cpu',
+    'encode': 'cpu',
+    'export': 'cpu',
+}
+
+# Tempo sem nenhuma etapa de disco em andamento a partir do qual uma etapa
+# acima do orçamento é liberada (os scripts emendam uma etapa na outra)
+DISK_IDLE_GRACE = 2.0
+
+class StageBoard:
+    """
+    Limita quantas etapas de cada recurso rodam ao mesmo tempo e registra a
+    duração de cada etapa
+
+    Quando há fila, a vaga vai para a menor prioridade (ordem do dataset no
+    run_all), para que um dataset termine antes de o próximo ocupar a CPU.
+
+    Também controla o disco temporário dos Workspace: cada etapa reserva o
+    espaço que espera ocupar e só começa se ele couber no orçamento, somado
+    ao que os diretórios temporários já ocupam.
+
+    Args:
+        network_jobs (int): Etapas de rede simultâneas
+        cpu_jobs (int): Etapas de CPU simultâneas
+        disk_budget (int): Bytes de disco temporário (None = sem limite)
+    """
+
+    def __init__(self, network_jobs=2, cpu_jobs=1, disk_budget=None):
+        self._limits = {'network': network_jobs, 'cpu': cpu_jobs}
+        self._in_use = {resource: 0 for resource in self._limits}
+        self._waiting = {resource: [] for resource in [*self._limits, 'disk']}
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._timings = []
+        self._disk_budget = disk_budget
+        self._disk_held = {}
+        self._disk_reserved = 0
+        self._disk_steps = 0
+        self._disk_idle_since = 0.0
+        self._disk_peak = 0
+        self._disk_peaks = {}
+
+    def acquire(self, resource, priority=0):
+        """Bloqueia até haver vaga para uma etapa do recurso informado"""
+        with self._condition:
+            ticket = (priority, next(self._counter))
+            heapq.heappush(self._waiting[resource], ticket)
+            while (self._waiting[resource][0] != ticket
+                   or self._in_use[resource] >= self._limits[resource]):
+                self._condition.wait()
+            heapq.heappop(self._waiting[resource])
+            self._in_use[resource] += 1
+            self._condition.notify_all()
+
+    def release(self, resource):
+        """Libera a vaga ocupada por uma etapa"""
+        with self._condition:
+            self._in_use[resource] -= 1
+            self._condition.notify_all()
+
+    def acquire_disk(self, nbytes, priority=0):
+        """
+        Bloqueia até que `nbytes` caibam no orçamento de disco
+
+        Etapas que não reservam espaço (só consomem intermediários) não
+        esperam. Se nenhuma etapa roda há DISK_IDLE_GRACE segundos, a etapa
+        começa mesmo acima do orçamento (esperar não liberaria espaço).
+        """
+        with self._condition:
+            if nbytes:
+                ticket = (priority, next(self._counter))
+                heapq.heappush(self._waiting['disk'], ticket)
+                while not (self._waiting['disk'][0] == ticket
+                           and (self._disk_budget is None
+                                or sum(self._disk_held.values()) + self._disk_reserved + nbytes
+                                <= self._disk_budget
+                                or (self._disk_steps == 0 and time.monotonic()
+                                    - self._disk_idle_since >= DISK_IDLE_GRACE))):
+                    self._condition.wait(DISK_IDLE_GRACE)
+                heapq.heappop(self._waiting['disk'])
+            self._disk_reserved += nbytes
+            self._disk_steps += 1
+            self._condition.notify_all()
+
+    def release_disk(self, nbytes):
+        """Libera a reserva de uma etapa (o que ela gravou já está em update_disk)"""
+        with self._condition:
+            self._disk_reserved -= nbytes
+            self._disk_steps -= 1
+            if not self._disk_steps:
+                self._disk_idle_since = time.monotonic()
+            self._condition.notify_all()
+
+    def update_disk(self, owner, used, dataset=None):
+        """Registra quantos bytes o diretório temporário `owner` ocupa agora"""
+        with self._condition:
+            if used:
+                self._disk_held[owner] = used
+            else:
+                self._disk_held.pop(owner, None)
+            self._disk_peak = max(self._disk_peak, sum(self._disk_held.values()))
+            if dataset is not None:
+                self._disk_peaks[dataset] = max(self._disk_peaks.get(dataset, 0), used)
+            self._condition.notify_all()
+
+    def disk_report(self):
+        """Orçamento e picos de uso do disco temporário (total e por dataset)"""
+        with self._condition:
+            return {
+                'budget': self._disk_budget,
+                'peak': self._disk_peak,
+                'datasets': dict(self._disk_peaks),
+            }
+
+    def record(self, dataset, stage, seconds, waited, metrics=None):
+        """Registra a duração (e as métricas de recursos) de uma etapa concluída"""
+        with self._condition:
+            self._timings.append({
+                'dataset': dataset,
+                'stage': stage,
+                'seconds': seconds,
+                'waited': waited,
+                **(metrics or {}),
+            })
+
+    def timings(self):
+        """Retorna as durações registradas até agora"""
+        with self._condition:
+            return list(self._timings)
+
+_stage_board_manager_class = None
+
+def _stage_board_manager():
+    """
+    Retorna StageBoardManager, o BaseManager que compartilha um StageBoard
+    entre o run_all e os scripts que ele executa
+
+    A classe é criada no primeiro uso (multiprocessing.managers é lento de
+    importar e só é necessário com o agendador do run_all).
+    """
+    global _stage_board_manager_class
+    if _stage_board_manager_class is None:
+        from multiprocessing.managers import BaseManager
+
+        class StageBoardManager(BaseManager):
+            """Compartilha um StageBoard entre o run_all e os scripts que ele executa"""
+
+        _stage_board_manager_class = StageBoardManager
+    return _stage_board_manager_class
+
+def __getattr__(name):
+    # Mantém `from video_utils import StageBoardManager` sem importar o
+    # multiprocessing.managers junto com o módulo
+    if name == 'StageBoardManager':
+        return _stage_board_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Variáveis de ambiente usadas pelo run_all para conectar os scripts ao agendador
+SCHEDULER_ENV = 'VIDEO_DATASETS_SCHEDULER'
+DATASET_ENV = 'VIDEO_DATASETS_DATASET'
+PRIORITY_ENV = 'VIDEO_DATASETS_PRIORITY'
+
+_stage_board = None
+_stage_local = threading.local()
+
+def set_stage_board(board):
+    """Define o StageBoard usado pelas etapas deste processo"""
+    global _stage_board
+    _stage_board = board
+
+def set_stage_dataset(dataset, priority=0):
+    """
+    Define o dataset e a prioridade das etapas desta thread
+
+    Usado pelo run_all ao executar os scripts no mesmo processo, em threads;
+    sem isso, valem as variáveis DATASET_ENV e PRIORITY_ENV.
+    """
+    _stage_local.dataset = dataset
+    _stage_local.priority = priority
+
+def _stage_dataset():
+    """Dataset das etapas desta thread"""
+    return (getattr(_stage_local, 'dataset', None)
+            or os.environ.get(DATASET_ENV, os.path.basename(sys.argv[0])))
+
+def _stage_priority():
+    """Prioridade das etapas desta thread no agendador"""
+    priority = getattr(_stage_local, 'priority', None)
+    return int(os.environ.get(PRIORITY_ENV, 0)) if priority is None else priority
+
+def _in_stage_context(function):
+    """
+    Envolve `function` para rodar com o dataset e a prioridade da thread atual
+
+    Usado nas threads auxiliares (pools de ffprobe, de partes e de downloads,
+    amostragem de disco): suas etapas e sua saída ficam com o dataset que as
+    criou, inclusive quando o run_all executa os scripts em threads.
+    """
+    dataset = getattr(_stage_local, 'dataset', None)
+    priority = getattr(_stage_local, 'priority', None)
+    def run(*args, **kwargs):
+        _stage_local.dataset, _stage_local.priority = dataset, priority
+        return function(*args, **kwargs)
+    return run
+
+def _get_stage_board():
+    """Retorna o StageBoard ativo, conectando ao agendador do run_all se houver"""
+    global _stage_board
+    if _stage_board is None and os.environ.get(SCHEDULER_ENV):
+        host, port, authkey = os.environ[SCHEDULER_ENV].split(':')
+        StageBoardManager = _stage_board_manager()
+        StageBoardManager.register('get_board')
+        manager = StageBoardManager(address=(host, int(port)),
+                                    authkey=bytes.fromhex(authkey))
+        manager.connect()
+        _stage_board = manager.get_board()
+    return _stage_board
+
+@contextmanager
+def _stage(name):
+    """
+    Executa uma etapa do pipeline respeitando os limites do agendador
+
+    Também pode ser usado como decorador. Etapas aninhadas reutilizam a vaga
+    da etapa externa.
+    """
+    board = _get_stage_board()
+    if board is None or getattr(_stage_local, 'active', False):
+        yield
+        return
+
+    resource = STAGE_RESOURCES[name]
+    dataset = _stage_dataset()
+    requested = time.perf_counter()
+    board.acquire(resource, _stage_priority())
+    started = time.perf_counter()
+    thread_cpu = time.thread_time()
+    _stage_local.active = True
+    _stage_local.metrics = {'cpu': 0.0, 'peak_rss': 0, 'frames': 0}
+    try:
+        yield
+    finally:
+        _stage_local.active = False
+        seconds = time.perf_counter() - started
+        metrics = _stage_local.metrics
+        # CPU desta thread (Python) mais a dos processos FFmpeg da etapa
+        metrics['cpu'] += time.thread_time() - thread_cpu
+        if resource_usage is not None:
+            self_rss = resource_usage.getrusage(resource_usage.RUSAGE_SELF).ru_maxrss
+            metrics['peak_rss'] = max(metrics['peak_rss'],
+                                      self_rss * (1 if sys.platform == 'darwin' else 1024))
+        metrics['fps'] = metrics['frames'] / seconds if seconds > 0 else 0.0
+        board.release(resource)
+        board.record(dataset, name, seconds, started - requested, metrics)
+
+def _record_process_metrics(metrics):
+    """Soma as métricas de um processo FFmpeg às da etapa em andamento nesta thread"""
+    stage_metrics = getattr(_stage_local, 'metrics', None)
+    if not getattr(_stage_local, 'active', False) or stage_metrics is None:
+        return
+    stage_metrics['cpu'] += metrics['cpu'] or 0.0
+    stage_metrics['peak_rss'] = max(stage_metrics['peak_rss'], metrics['peak_rss'] or 0)
+    stage_metrics['frames'] += metrics['frames']
 
 def create_directory(path):
     """Cria diretório se não existir"""
     Path(path).mkdir(parents=True, exist_ok=True)
     print(f"Diretório criado/verificado: {path}")
 
-def download_file(url, filename):
-    """Baixa arquivo com barra de progresso"""
+# Diretório onde os Workspace criam seus temporários (ex: /dev/shm para
+# trechos curtos) e orçamento de disco para uso fora do run_all (só avisa)
+SCRATCH_ENV = 'VIDEO_DATASETS_SCRATCH'
+DISK_BUDGET_ENV = 'VIDEO_DATASETS_DISK_BUDGET'
+WORKSPACE_SAMPLE_INTERVAL = 1.0
+
+def disk_usage(path):
+    """Bytes ocupados em disco por um arquivo ou diretório"""
+    if os.path.isdir(path):
+        paths = [os.path.join(root, name)
+                 for root, dirs, files in os.walk(path) for name in files]
+    else:
+        paths = [path]
+    total = 0
+    for file in paths:
+        try:
+            stat = os.lstat(file)
+        except FileNotFoundError:
+            continue
+        total += stat.st_blocks * 512 if hasattr(stat, 'st_blocks') else stat.st_size
+    return total
+
+def _remove_path(path):
+    """Apaga um arquivo ou diretório intermediário e o índice de quadros ao lado"""
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        for file in (path, path + FRAME_INDEX_SUFFIX):
+            if os.path.lexists(file):
+                os.remove(file)
+    print(f"Intermediário removido: {path}")
+
+class Workspace:
+    """
+    Diretório temporário de um dataset que apaga cada intermediário assim que
+    a última etapa que o consome termina
+
+    Substitui tempfile.TemporaryDirectory nos scripts. O diretório é criado em
+    SCRATCH_ENV (ou no temporário do sistema). Com o run_all, cada etapa
+    reserva no agendador o espaço que espera gravar e aguarda enquanto o
+    orçamento de disco estiver esgotado; o uso real é medido durante a etapa
+    e o pico vai para o relatório da execução.
+
+    Exemplo:
+        with Workspace() as workspace:
+            tar_file = workspace.path('P2L_S5.tar.xz', 'extract')
+            with workspace.step('download'):
+                download_file(url, tar_file)
+            with workspace.step('extract', needs=3 * os.path.getsize(tar_file)):
+                extract_tar_xz(tar_file, workspace.dir)  # tar_file é apagado ao final
+
+    Args:
+        name (str): Prefixo do diretório (padrão: o dataset em execução)
+        scratch (str): Onde criar o diretório (padrão: SCRATCH_ENV)
+    """
+
+    def __init__(self, name=None, scratch=None):
+        self.name = name or os.path.splitext(_stage_dataset())[0]
+        self.scratch = scratch or os.environ.get(SCRATCH_ENV) or None
+        self.dir = None
+        self.peak = 0
+        self._consumers = {}
+        self._owner = None
+
+    def __enter__(self):
+        if self.scratch:
+            os.makedirs(self.scratch, exist_ok=True)
+        self.dir = tempfile.mkdtemp(prefix=f"{self.name}_", dir=self.scratch)
+        self._owner = f"{self.name}:{os.getpid()}:{id(self)}"
+        print(f"Diretório temporário criado: {self.dir}")
+        return self
+
+    def __exit__(self, *exc_info):
+        self._measure()
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self._report(0)
+        print(f"Pico de uso do diretório temporário: {self.peak / 2**20:.1f} MiB")
+
+    def path(self, name, *consumers):
+        """Caminho de um intermediário no diretório, consumido pelas etapas informadas"""
+        return self.track(os.path.join(self.dir, name), *consumers)
+
+    def track(self, path, *consumers):
+        """Registra as etapas que consomem `path`; ele é apagado quando a última terminar"""
+        if consumers:
+            self._consumers.setdefault(path, set()).update(consumers)
+        return path
+
+    def _report(self, used):
+        self.peak = max(self.peak, used)
+        board = _get_stage_board()
+        if board is not None:
+            board.update_disk(self._owner, used, self.name)
+
+    def _measure(self):
+        used = disk_usage(self.dir)
+        self._report(used)
+        return used
+
+    @contextmanager
+    def step(self, name, needs=0):
+        """
+        Executa uma etapa que grava no diretório
+
+        Args:
+            name (str): Nome da etapa (o mesmo usado em path/track)
+            needs (int): Bytes que a etapa deve gravar, reservados no orçamento
+        """
+        board = _get_stage_board()
+        if board is not None:
+            board.acquire_disk(needs, _stage_priority())
+        elif needs and os.environ.get(DISK_BUDGET_ENV):
+            budget = parse_size(os.environ[DISK_BUDGET_ENV])
+            if self._measure() + needs > budget:
+                print(f"Aviso: a etapa {name} deve passar do orçamento de disco "
+                      f"({budget / 2**20:.0f} MiB)")
+
+        # Mede o uso durante a etapa, para registrar o pico real
+        stop = threading.Event()
+        def sample():
+            while not stop.wait(WORKSPACE_SAMPLE_INTERVAL):
+                self._measure()
+        sampler = threading.Thread(target=_in_stage_context(sample), daemon=True)
+        sampler.start()
+        try:
+            yield
+            stop.set()
+            sampler.join()
+            self._measure()
+            self.finished(name)
+        finally:
+            stop.set()
+            if board is not None:
+                board.release_disk(needs)
+
+    def finished(self, name):
+        """Marca a etapa como concluída e apaga os intermediários sem outros consumidores"""
+        for path, consumers in list(self._consumers.items()):
+            consumers.discard(name)
+            if not consumers:
+                del self._consumers[path]
+                _remove_path(path)
+        self._measure()
+
+# Parâmetros do download HTTP: tamanho de cada leitura da resposta, buffer de
+# escrita em disco (também o intervalo entre gravações do estado de retomada)
+# e número de novas tentativas por faixa após falha de conexão
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_BUFFER_SIZE = 16 * 1024 * 1024
+DOWNLOAD_RETRIES = 5
+DOWNLOAD_TIMEOUT = (10, 60)
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+def _get_http_session():
+    """Retorna a sessão HTTP compartilhada, que reaproveita conexões"""
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            import requests
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _http_session = session
+    return _http_session
+
+def _split_ranges(start, end, parts):
+    """Divide o intervalo [start, end) em até `parts` faixas [início, fim, baixado]"""
+    if end <= start:
+        return []
+    parts = max(1, min(parts, end - start))
+    step = -(-(end - start) // parts)
+    return [[offset, min(offset + step, end), 0] for offset in range(start, end, step)]
+
+def _load_download_ranges(state_file, part_file, url, total_size, connections):
+    """
+    Recupera as faixas de um download interrompido ou cria faixas novas
+
+    O progresso vem apenas do arquivo de estado: o .part é pré-alocado com
+    o tamanho total, então o tamanho dele não indica quanto já foi baixado.
+    Sem estado válido para esta URL e tamanho, o download recomeça do zero.
+
+    Returns:
+        tuple: (faixas [início, fim, baixado], True se for uma retomada)
+    """
+    if os.path.exists(state_file) and os.path.exists(part_file):
+        try:
+            with open(state_file) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        if state.get('url') == url and state.get('size') == total_size:
+            return state['ranges'], True
+    return _split_ranges(0, total_size, connections), False
+
+def _save_download_ranges(state_file, url, total_size, ranges):
+    """Grava o progresso de cada faixa para permitir a retomada"""
+    with open(state_file + '.tmp', 'w') as f:
+        json.dump({'url': url, 'size': total_size, 'ranges': ranges}, f)
+    os.replace(state_file + '.tmp', state_file)
+
+def _download_range(session, url, part_file, byte_range, save_state, bar):
+    """Baixa uma faixa [início, fim) para sua posição no arquivo .part"""
+    import requests
+    start, end, _ = byte_range
+    for attempt in range(DOWNLOAD_RETRIES + 1):
+        if start + byte_range[2] >= end:
+            return
+        try:
+            headers = {'Range': f"bytes={start + byte_range[2]}-{end - 1}"}
+            with session.get(url, headers=headers, stream=True,
+                             timeout=DOWNLOAD_TIMEOUT) as response:
+                response.raise_for_status()
+                if response.status_code != 206:
+                    raise IOError(f"Servidor ignorou o cabeçalho Range: {url}")
+
+                with open(part_file, 'r+b', buffering=0) as file:
+                    file.seek(start + byte_range[2])
+                    buffer = bytearray()
+                    try:
+                        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                            buffer += chunk
+                            if len(buffer) >= DOWNLOAD_BUFFER_SIZE:
+                                file.write(buffer)
+                                byte_range[2] += len(buffer)
+                                bar.update(len(buffer))
+                                buffer.clear()
+                                save_state()
+                    finally:
+                        # Grava o que já chegou antes de registrar o progresso
+                        file.write(buffer)
+                        byte_range[2] += len(buffer)
+                        bar.update(len(buffer))
+                        save_state()
+        except (requests.RequestException, ConnectionError) as e:
+            if attempt == DOWNLOAD_RETRIES:
+                raise
+            print(f"Conexão interrompida ({e}), retomando faixa {start}-{end}...")
+            time.sleep(min(2 ** attempt, 30))
+
+def verify_checksum(filename, checksum):
+    """
+    Verifica o checksum de um arquivo
+
+    Args:
+        filename (str): Caminho do arquivo
+        checksum (str): 'algoritmo:hex' (ex: 'md5:0123...'); sem prefixo assume sha256
+
+    Returns:
+        bool: True se o checksum confere
+    """
+    algorithm, _, expected = checksum.rpartition(':')
+    digest = hashlib.new(algorithm or 'sha256')
+    with open(filename, 'rb') as f:
+        while chunk := f.read(DOWNLOAD_BUFFER_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest() == expected.lower()
+
+# Cache persistente de downloads, compartilhado entre execuções. O diretório
+# e o tamanho máximo podem ser alterados pelas variáveis de ambiente abaixo;
+# VIDEO_DATASETS_CACHE=off desativa o cache.
+CACHE_ENV = 'VIDEO_DATASETS_CACHE'
+CACHE_SIZE_ENV = 'VIDEO_DATASETS_CACHE_SIZE'
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'video_datasets')
+DEFAULT_CACHE_SIZE = '50G'
+
+# ioctl do Linux que cria um reflink (cópia por referência em btrfs/xfs)
+_FICLONE = 0x40049409
+
+def parse_size(value):
+    """Converte '50G', '512M', '1T' ou um número de bytes em bytes"""
+    value = str(value).strip().upper().rstrip('B')
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+def format_size(size):
+    """Formata um tamanho em bytes para leitura"""
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TiB"
+
+def get_cache_dir():
+    """Retorna o diretório do cache de downloads, ou None se estiver desativado"""
+    cache_dir = os.environ.get(CACHE_ENV, DEFAULT_CACHE_DIR)
+    if cache_dir.lower() in ('', '0', 'off', 'no', 'false'):
+        return None
+    return cache_dir
+
+def get_cache_max_size():
+    """Retorna o tamanho máximo do cache em bytes"""
+    return parse_size(os.environ.get(CACHE_SIZE_ENV, DEFAULT_CACHE_SIZE))
+
+def cache_key(url, variant=''):
+    """Chave do cache para uma URL e um seletor de formato/trecho"""
+    return hashlib.sha256(f"{url}\n{variant}".encode()).hexdigest()
+
+_file_hashes = {}  # _probe_key do arquivo -> SHA-256, nesta execução
+
+def file_sha256(filename):
+    """
+    Calcula o SHA-256 do conteúdo de um arquivo
+
+    O resultado fica guardado para o arquivo (caminho, tamanho, mtime e
+    inode): chamadas seguintes, como as de vários datasets que usam o mesmo
+    download, não leem o arquivo de novo.
+    """
+    key = _probe_key(filename)
+    if key not in _file_hashes:
+        digest = hashlib.sha256()
+        with open(filename, 'rb') as f:
+            while chunk := f.read(DOWNLOAD_BUFFER_SIZE):
+                digest.update(chunk)
+        _file_hashes[key] = digest.hexdigest()
+    return _file_hashes[key]
+
+def link_or_copy(src, dst):
+    """Cria `dst` como hardlink de `src`; usa reflink ou cópia se não for possível"""
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+        return
+    except OSError:
+        pass
+    try:
+        import fcntl
+        with open(src, 'rb') as source, open(dst, 'wb') as target:
+            fcntl.ioctl(target.fileno(), _FICLONE, source.fileno())
+        return
+    except (ImportError, OSError):
+        pass
+    shutil.copyfile(src, dst)
+
+def _cache_entry_path(cache_dir, key):
+    return os.path.join(cache_dir, 'entries', key + '.json')
+
+def _write_cache_entry(cache_dir, entry):
+    """Grava uma entrada do índice de forma atômica"""
+    entry_path = _cache_entry_path(cache_dir, entry['key'])
+    with open(entry_path + '.tmp', 'w') as f:
+        json.dump(entry, f, indent=2)
+    os.replace(entry_path + '.tmp', entry_path)
+
+def cache_entries(cache_dir=None):
+    """Lista as entradas do cache, da usada há mais tempo para a mais recente"""
+    cache_dir = cache_dir or get_cache_dir()
+    entries_dir = os.path.join(cache_dir, 'entries') if cache_dir else None
+    if not entries_dir or not os.path.isdir(entries_dir):
+        return []
+
+    entries = []
+    for name in os.listdir(entries_dir):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(entries_dir, name)) as f:
+                entries.append(json.load(f))
+        except (OSError, ValueError):
+            continue  # Entrada sendo gravada por outro processo
+    return sorted(entries, key=lambda entry: entry['last_used'])
+
+def cache_lookup(url, variant=''):
+    """Retorna a entrada do cache para `url`, ou None se não houver"""
+    cache_dir = get_cache_dir()
+    if cache_dir is None:
+        return None
+
+    try:
+        with open(_cache_entry_path(cache_dir, cache_key(url, variant))) as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not os.path.exists(os.path.join(cache_dir, 'objects', entry['sha256'])):
+        return None
+    return entry
+
+def cache_fetch(url, filename, variant=''):
+    """
+    Procura `url` no cache e, se encontrar, cria `filename` a partir dele
+
+    Returns:
+        dict: Entrada do cache (com 'ext' do arquivo original), ou None
+    """
+    entry = cache_lookup(url, variant)
+    if entry is None:
+        return None
+
+    cache_dir = get_cache_dir()
+    try:
+        link_or_copy(os.path.join(cache_dir, 'objects', entry['sha256']), filename)
+    except OSError:
+        return None
+    # O conteúdo é o do objeto: o hash já é conhecido
+    _file_hashes[_probe_key(filename)] = entry['sha256']
+
+    entry['last_used'] = time.time()
+    _write_cache_entry(cache_dir, entry)
+    print(f"Usando cópia em cache de {url}: {filename}")
+    return entry
+
+def cache_store(url, filename, variant=''):
+    """Adiciona um arquivo baixado ao cache e aplica o limite de tamanho"""
+    cache_dir = get_cache_dir()
+    if cache_dir is None:
+        return None
+
+    for subdir in ('objects', 'entries'):
+        os.makedirs(os.path.join(cache_dir, subdir), exist_ok=True)
+
+    sha256 = file_sha256(filename)
+    object_path = os.path.join(cache_dir, 'objects', sha256)
+    if not os.path.exists(object_path):
+        temp_object = f"{object_path}.{os.getpid()}.tmp"
+        link_or_copy(filename, temp_object)
+        os.replace(temp_object, object_path)
+
+    entry = {
+        'key': cache_key(url, variant),
+        'url': url,
+        'variant': variant,
+        'sha256': sha256,
+        'size': os.path.getsize(object_path),
+        'ext': os.path.splitext(filename)[1],
+        'last_used': time.time(),
+    }
+    _write_cache_entry(cache_dir, entry)
+    cache_prune()
+    # Metadados de arquivos temporários já apagados não crescem sem limite
+    probe_cache_prune()
+    return entry
+
+def cache_prune(max_size=None, cache_dir=None):
+    """
+    Remove as entradas usadas há mais tempo até o cache caber em `max_size`
+
+    Returns:
+        list[dict]: Entradas removidas
+    """
+    cache_dir = cache_dir or get_cache_dir()
+    if cache_dir is None:
+        return []
+    max_size = get_cache_max_size() if max_size is None else max_size
+
+    entries = cache_entries(cache_dir)
+    objects = {}
+    for entry in entries:
+        objects.setdefault(entry['sha256'], []).append(entry)
+    total_size = sum(group[0]['size'] for group in objects.values())
+
+    removed = []
+    for entry in entries:
+        if total_size <= max_size:
+            break
+        with suppress(FileNotFoundError):
+            os.remove(_cache_entry_path(cache_dir, entry['key']))
+        removed.append(entry)
+        # O conteúdo só é apagado quando nenhuma outra entrada o referencia
+        objects[entry['sha256']].remove(entry)
+        if not objects[entry['sha256']]:
+            with suppress(FileNotFoundError):
+                os.remove(os.path.join(cache_dir, 'objects', entry['sha256']))
+            total_size -= entry['size']
+    return removed
+
+# Builds incrementais: cada saída final ganha um arquivo ao lado com a
+# impressão digital (parâmetros de cada etapa, hash das origens e versão do
+# FFmpeg) usada para gerá-la.
+FINGERPRINT_SUFFIX = '.build.json'
+FORCE_ENV = 'VIDEO_DATASETS_FORCE'
+_ffmpeg_version = None
+
+def ffmpeg_version():
+    """Retorna a primeira linha de `ffmpeg -version`"""
+    global _ffmpeg_version
+    if _ffmpeg_version is None:
+        result = subprocess.run(['ffmpeg', '-version'], check=True,
+                                capture_output=True, text=True)
+        _ffmpeg_version = result.stdout.splitlines()[0]
+    return _ffmpeg_version
+
+class Build:
+    """
+    Impressão digital de um arquivo final, para reconstruí-lo só quando algo mudou
+
+    Exemplo:
+        build = (Build(final_path)
+                 .stage('download', url=url, fps=25, resolution='1080p')
+                 .stage('cut', start_frame=8475, end_frame=9474)
+                 .stage('encode', crf=23, preset='medium'))
+        if build.up_to_date():
+            return
+        ...
+        build.source(url, downloaded_file)
+        ...
+        build.save()
+
+    Etapas intermediárias que geram arquivos podem ser executadas com
+    `cached()`, que reaproveita o resultado (pelo cache de downloads) enquanto
+    nenhuma etapa até ela, inclusive, tiver mudado.
+    """
+
+    def __init__(self, output_file):
+        self.output_file = output_file
+        self.stages = []
+        self.sources = {}
+
+    def stage(self, name, **params):
+        """Declara uma etapa e seus parâmetros, na ordem de execução"""
+        # Ida e volta pelo JSON para comparar com a versão gravada (tuplas viram listas)
+        self.stages.append(json.loads(json.dumps({'stage': name, **params}, sort_keys=True)))
+        return self
+
+    def source(self, url, filename):
+        """Registra o hash do conteúdo baixado de `url`"""
+        self.sources[url] = file_sha256(filename)
+
+    def fingerprint(self):
+        return {'ffmpeg': ffmpeg_version(), 'stages': self.stages, 'sources': self.sources}
+
+    def recorded(self):
+        """Impressão digital gravada na última construção, ou None"""
+        try:
+            with open(self.output_file + FINGERPRINT_SUFFIX) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def changed_stage(self):
+        """
+        Primeira etapa que mudou desde a última construção
+
+        Returns:
+            str: Nome da etapa, ou None se nada mudou
+        """
+        recorded = self.recorded()
+        if os.environ.get(FORCE_ENV) or recorded is None or not os.path.exists(self.output_file):
+            return self.stages[0]['stage'] if self.stages else None
+        if recorded.get('ffmpeg') != ffmpeg_version():
+            return self.stages[0]['stage'] if self.stages else None
+
+        old_stages = recorded.get('stages', [])
+        for i, stage in enumerate(self.stages):
+            if i >= len(old_stages) or old_stages[i] != stage:
+                return stage['stage']
+            # A origem mudou se o cache de downloads só tem outro conteúdo para a URL
+            url = stage.get('url')
+            if url in recorded.get('sources', {}):
+                hashes = {entry['sha256'] for entry in cache_entries() if entry['url'] == url}
+                if hashes and recorded['sources'][url] not in hashes:
+                    return stage['stage']
+        if len(old_stages) != len(self.stages):
+            return self.stages[-1]['stage'] if self.stages else None
+        return None
+
+    def up_to_date(self):
+        """Informa se o arquivo final já corresponde às etapas declaradas"""
+        changed = self.changed_stage()
+        if changed is None:
+            print(f"{self.output_file} já está atualizado, nada a fazer.")
+            return True
+        print(f"Reconstruindo {self.output_file} a partir da etapa '{changed}'")
+        return False
+
+    def _stage_key(self, name):
+        """Chave das etapas até `name`, inclusive, e das origens já registradas"""
+        names = [stage['stage'] for stage in self.stages]
+        stages = self.stages[:names.index(name) + 1]
+        data = json.dumps({'ffmpeg': ffmpeg_version(), 'stages': stages,
+                           'sources': self.sources}, sort_keys=True)
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def cached(self, name, output_files, function, *args, **kwargs):
+        """
+        Executa a etapa `name`, que gera `output_files`, ou os reaproveita do cache
+
+        Returns:
+            bool: True se o resultado veio do cache
+        """
+        if isinstance(output_files, str):
+            output_files = [output_files]
+        url = f"build:{os.path.basename(self.output_file)}:{name}"
+        variant = self._stage_key(name)
+
+        if not os.environ.get(FORCE_ENV):
+            if all(cache_lookup(f"{url}:{os.path.basename(path)}", variant)
+                   for path in output_files):
+                if all(cache_fetch(f"{url}:{os.path.basename(path)}", path, variant)
+                       for path in output_files):
+                    return True
+
+        function(*args, **kwargs)
+        for path in output_files:
+            if os.path.exists(path):
+                cache_store(f"{url}:{os.path.basename(path)}", path, variant)
+        return False
+
+    def save(self):
+        """Grava a impressão digital ao lado do arquivo final"""
+        with open(self.output_file + FINGERPRINT_SUFFIX, 'w') as f:
+            json.dump(self.fingerprint(), f, indent=2, sort_keys=True)
+
+@_stage('download')
+def download_file(url, filename, connections=4, checksum=None):
+    """
+    Baixa arquivo com barra de progresso
+
+    O conteúdo é gravado em `filename + '.part'` e, se o download for
+    interrompido, a próxima chamada continua de onde parou usando
+    requisições Range. Quando o servidor aceita Range, o arquivo é dividido
+    em `connections` faixas baixadas em paralelo pela mesma sessão HTTP.
+
+    Args:
+        url (str): URL do arquivo
+        filename (str): Caminho de destino
+        connections (int): Conexões simultâneas
+        checksum (str): 'algoritmo:hex' verificado ao final (opcional)
+
+    Se o arquivo já estiver no cache de downloads, ele é apenas ligado
+    (hardlink/reflink) em `filename`, sem acessar a rede.
+    """
+    if cache_fetch(url, filename):
+        return
+
     print(f"Baixando {url}...")
-    response = requests.get(url, stream=True)
-    response.raise_for_status()
+    session = _get_http_session()
+    part_file = filename + '.part'
+    state_file = part_file + '.json'
 
-    total_size = int(response.headers.get('content-length', 0))
+    head = session.head(url, allow_redirects=True, timeout=DOWNLOAD_TIMEOUT)
+    total_size = int(head.headers.get('content-length', 0)) if head.ok else 0
+    accepts_ranges = head.ok and head.headers.get('accept-ranges', '').lower() == 'bytes'
 
-    with open(filename, 'wb') as file, tqdm(
+    from tqdm import tqdm
+    with tqdm(
         desc=filename,
         total=total_size,
         unit='B',
         unit_scale=True,
         unit_divisor=1024,
     ) as bar:
-        for chunk in response.iter_content(chunk_size=8192):
-            if chunk:
-                file.write(chunk)
-                bar.update(len(chunk))
+        if total_size and accepts_ranges:
+            ranges, resumed = _load_download_ranges(state_file, part_file, url,
+                                                    total_size, connections)
+            if not resumed:
+                cleanup_temp_files(part_file)
+            bar.update(sum(done for _, _, done in ranges))
+
+            state_lock = threading.Lock()
+            def save_state():
+                with state_lock:
+                    _save_download_ranges(state_file, url, total_size, ranges)
+
+            # O estado é gravado antes da pré-alocação: um .part sem estado
+            # nunca é tomado como baixado
+            save_state()
+            with open(part_file, 'ab') as file:
+                file.truncate(total_size)
 
+            with ThreadPoolExecutor(max_workers=connections) as executor:
+                futures = [executor.submit(_in_stage_context(_download_range), session, url,
+                                           part_file, byte_range, save_state, bar)
+                           for byte_range in ranges]
+                for future in futures:
+                    future.result()
+        else:
+            # Servidor sem suporte a Range: download sequencial desde o início
+            with session.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+                response.raise_for_status()
+                with open(part_file, 'wb', buffering=DOWNLOAD_BUFFER_SIZE) as file:
+                    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        file.write(chunk)
+                        bar.update(len(chunk))
+
+    if total_size and os.path.getsize(part_file) != total_size:
+        raise IOError(f"Tamanho inesperado em {part_file}: "
+                      f"{os.path.getsize(part_file)} bytes, esperado {total_size}")
+    if checksum and not verify_checksum(part_file, checksum):
+        cleanup_temp_files(part_file, state_file)
+        raise IOError(f"Checksum não confere para {url}")
+
+    os.replace(part_file, filename)
+    if os.path.exists(state_file):
+        os.remove(state_file)
+    cache_store(url, filename)
     print(f"Download concluído: {filename}")
 
-def extract_tar_xz(tar_path, extract_to):
-    """Extrai arquivo tar.xz"""
+def remote_file_size(url):
+    """Tamanho de um arquivo remoto em bytes (0 se o servidor não informar)"""
+    head = _get_http_session().head(url, allow_redirects=True, timeout=DOWNLOAD_TIMEOUT)
+    return int(head.headers.get('content-length', 0)) if head.ok else 0
+
+# Descompressão de .xz: blocos independentes em paralelo quando o arquivo
+# tem mais de um bloco (xz -T, pixz), senão `xz -T0` externo em um processo à
+# parte, senão o lzma do Python.
+XZ_HEADER_MAGIC = b'\xfd7zXZ\x00'
+XZ_FOOTER_MAGIC = b'YZ'
+
+def _xz_read_varint(data, pos):
+    """Lê um inteiro de tamanho variável do formato xz"""
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, pos
+
+def _xz_varint(value):
+    """Codifica um inteiro de tamanho variável do formato xz"""
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+def xz_blocks(path):
+    """
+    Lista os blocos de um arquivo .xz a partir dos índices dos seus fluxos
+
+    Returns:
+        list[tuple]: (posição, tamanho sem preenchimento, tamanho
+            descomprimido, flags do fluxo) de cada bloco, em ordem, ou None se
+            o arquivo não puder ser indexado
+    """
+    blocks = []
+    with open(path, 'rb') as f:
+        end = f.seek(0, os.SEEK_END)
+        while end > 0:
+            f.seek(end - 4)
+            if f.read(4) == b'\0\0\0\0':  # Preenchimento entre fluxos
+                end -= 4
+                continue
+            f.seek(end - 12)
+            footer = f.read(12)
+            if len(footer) != 12 or footer[10:] != XZ_FOOTER_MAGIC:
+                return None
+            index_size = (int.from_bytes(footer[4:8], 'little') + 1) * 4
+            index_start = end - 12 - index_size
+            f.seek(index_start)
+            index = f.read(index_size)
+            if index_start < 12 or index[0] != 0:
+                return None
+
+            count, pos = _xz_read_varint(index, 1)
+            records = []
+            for _ in range(count):
+                unpadded, pos = _xz_read_varint(index, pos)
+                uncompressed, pos = _xz_read_varint(index, pos)
+                records.append((unpadded, uncompressed))
+
+            stream_start = index_start - sum((unpadded + 3) & ~3 for unpadded, _ in records) - 12
+            f.seek(stream_start)
+            header = f.read(12)
+            if stream_start < 0 or header[:6] != XZ_HEADER_MAGIC or header[6:8] != footer[8:10]:
+                return None
+            offset = stream_start + 12
+            stream_blocks = []
+            for unpadded, uncompressed in records:
+                stream_blocks.append((offset, unpadded, uncompressed, header[6:8]))
+                offset += (unpadded + 3) & ~3
+            blocks[:0] = stream_blocks
+            end = stream_start
+    return blocks
+
+def xz_uncompressed_size(path):
+    """Tamanho descomprimido de um arquivo .xz, lido do índice (sem descomprimir)"""
+    blocks = xz_blocks(path)
+    if blocks is None:
+        return os.path.getsize(path)
+    return sum(uncompressed for _, _, uncompressed, _ in blocks)
+
+def _xz_decompress_block(path, block):
+    """Descomprime um bloco, montando um fluxo .xz só com ele"""
+    offset, unpadded, uncompressed, flags = block
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read((unpadded + 3) & ~3)
+
+    index = b'\0' + _xz_varint(1) + _xz_varint(unpadded) + _xz_varint(uncompressed)
+    index += b'\0' * (-len(index) % 4)
+    index += zlib.crc32(index).to_bytes(4, 'little')
+    backward_size = (len(index) // 4 - 1).to_bytes(4, 'little')
+    stream = (XZ_HEADER_MAGIC + flags + zlib.crc32(flags).to_bytes(4, 'little') + data + index
+              + zlib.crc32(backward_size + flags).to_bytes(4, 'little') + backward_size
+              + flags + XZ_FOOTER_MAGIC)
+    return lzma.decompress(stream, format=lzma.FORMAT_XZ)
+
+class _ChunkReader(io.RawIOBase):
+    """Arquivo somente leitura sobre um iterador de blocos de bytes"""
+
+    def __init__(self, chunks, on_close=None):
+        self._chunks = chunks
+        self._on_close = on_close
+        self._chunk = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._chunk:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._chunk = memoryview(chunk)
+        size = min(len(buffer), len(self._chunk))
+        buffer[:size] = self._chunk[:size]
+        self._chunk = self._chunk[size:]
+        return size
+
+    def close(self):
+        if not self.closed and self._on_close:
+            self._on_close()
+        super().close()
+
+def open_xz(path, workers=None):
+    """
+    Abre um arquivo .xz para leitura sequencial, descomprimindo em paralelo
+
+    Com vários blocos, até `workers` blocos são descomprimidos ao mesmo tempo
+    (o lzma libera o GIL) e entregues em ordem. Com um único bloco, usa
+    `xz -T0` em um processo separado, se instalado, para que a
+    descompressão rode em paralelo com quem lê; senão, o lzma do Python.
+
+    Returns:
+        io.BufferedReader: Conteúdo descomprimido
+    """
+    workers = workers or os.cpu_count() or 1
+    blocks = xz_blocks(path)
+    if blocks and len(blocks) > 1 and workers > 1:
+        executor = ThreadPoolExecutor(max_workers=workers)
+
+        def decompress_in_order():
+            pending = deque()
+            for block in blocks:
+                pending.append(executor.submit(_xz_decompress_block, path, block))
+                if len(pending) > workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+        reader = _ChunkReader(decompress_in_order(),
+                              on_close=lambda: executor.shutdown(cancel_futures=True))
+        return io.BufferedReader(reader, buffer_size=DOWNLOAD_CHUNK_SIZE)
+
+    if shutil.which('xz'):
+        process = subprocess.Popen(['xz', '-dc', '-T0', path], stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE)
+
+        def read_process():
+            yield from iter(lambda: process.stdout.read(DOWNLOAD_CHUNK_SIZE), b'')
+            if process.wait() != 0:
+                raise lzma.LZMAError(f"xz falhou em {path}: "
+                                     f"{process.stderr.read().decode(errors='replace')}")
+
+        def stop_process():
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+            process.stdout.close()
+            process.stderr.close()
+
+        return io.BufferedReader(_ChunkReader(read_process(), on_close=stop_process),
+                                 buffer_size=DOWNLOAD_CHUNK_SIZE)
+
+    return lzma.open(path)
+
+@_stage('extract')
+def extract_tar_xz(tar_path, extract_to, nested=False, workers=None):
+    """
+    Extrai arquivo tar.xz
+
+    A descompressão usa open_xz (vários núcleos quando possível). Com
+    `nested`, os tar.xz contidos no arquivo também são extraídos em
+    `extract_to`, vários ao mesmo tempo.
+    """
     print(f"Extraindo {tar_path}...")
-    with tarfile.open(tar_path, 'r:xz') as tar:
-        tar.extractall(path=extract_to)
+    nested_files = _extract_tar_stream(tar_path, extract_to, workers)
+
+    if nested and nested_files:
+        print(f"Extraindo {len(nested_files)} arquivos aninhados em paralelo...")
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+            for future in [executor.submit(_in_stage_context(_extract_tar_stream),
+                                           nested_file, extract_to, 1)
+                           for nested_file in nested_files]:
+                future.result()
     print(f"Extração concluída em: {extract_to}")
 
+def _extract_tar_stream(tar_path, extract_to, workers=None):
+    """
+    Extrai um tar.xz lendo-o como fluxo
+
+    Returns:
+        list[str]: Caminhos dos tar.xz contidos no arquivo
+    """
+    nested_files = []
+    with open_xz(tar_path, workers) as stream, tarfile.open(fileobj=stream, mode='r|') as tar:
+        for member in tar:
+            tar.extract(member, path=extract_to)
+            if member.isfile() and member.name.endswith('.tar.xz'):
+                nested_files.append(os.path.join(extract_to, member.name))
+    return nested_files
+
+@_stage('encode')
 def concatenate_videos(video_files, output_file):
-    """Concatena vídeos usando FFmpeg"""
+    """
+    Concatena vídeos usando FFmpeg (cópia de fluxo)
+
+    Raises:
+        ValueError: Se os vídeos não tiverem o mesmo codec, tamanho e formato
+            (use VideoPipeline, que concatena decodificando)
+    """
     print(f"Concatenando vídeos: {video_files}")
+    infos = probe_videos(video_files)
+    if not _same_video_format(infos):
+        raise ValueError(f"Vídeos com formatos diferentes não podem ser unidos por cópia: "
+                         f"{video_files}")
 
     # Cria arquivo de lista temporário
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False) as f:
-        for video in video_files:
-            f.write(f"file '{os.path.abspath(video)}'\n")
-        list_file = f.name
+    list_file = _write_concat_list(video_files)
 
     try:
         cmd = [
             'ffmpeg', '-f', 'concat', '-safe', '0', '-i', list_file,
             '-c', 'copy', output_file, '-y'
         ]
-        _run_ffmpeg_command(cmd) # Usa a função auxiliar
+        duration = sum(float(info['format'].get('duration') or 0) for info in infos)
+        _run_ffmpeg_command(cmd, duration=duration or None) # Usa a função auxiliar
         print(f"Concatenação concluída: {output_file}")
     finally:
         os.unlink(list_file)
 
-def convert_to_h264_mkv(input_file, output_file):
-    """Converte vídeo para H.264 MKV"""
-    print(f"Convertendo {input_file} para H.264 MKV...")
-    cmd = [
-        'ffmpeg', '-i', input_file,
-        '-c:v', 'libx264', '-c:a', 'aac',
-        '-preset', 'medium', '-crf', '23',
-        output_file, '-y'
-    ]
-    _run_ffmpeg_command(cmd) # Usa a função auxiliar
-    print(f"Conversão concluída: {output_file}")
+@_stage('encode')
+def convert_to_h264_mkv(input_file, output_file, segments=None, audio=True):
+    """
+    Converte vídeo para H.264 MKV
+
+    Com `audio=False`, o áudio é descartado em vez de recodificado para AAC.
+
+    Com `segments` > 1, o vídeo é dividido em keyframes em até `segments`
+    partes, codificadas em paralelo com os núcleos divididos entre elas, e
+    as partes são unidas por cópia (demuxer concat). O áudio é codificado
+    uma única vez, à parte. O resultado usa os mesmos parâmetros do modo
+    de processo único.
+    """
+    print(f"Convertendo {input_file} para H.264 MKV...")
+    if segments and segments > 1:
+        _convert_to_h264_mkv_segmented(input_file, output_file, segments, audio)
+        build_frame_index(output_file)
+        print(f"Conversão concluída: {output_file}")
+        return
+
+    cmd = [
+        'ffmpeg', '-i', input_file,
+        '-c:v', 'libx264', *(['-c:a', 'aac'] if audio else ['-an']),
+        '-preset', 'medium', '-crf', '23',
+        output_file, '-y'
+    ]
+    _run_ffmpeg_command(cmd, duration=_probe_duration(input_file)) # Usa a função auxiliar
+    build_frame_index(output_file)
+    print(f"Conversão concluída: {output_file}")
+
+def split_at_keyframes(input_file, segments):
+    """
+    Divide um vídeo em até `segments` partes de duração parecida, em keyframes
+
+    Returns:
+        list[tuple[float, int]]: (início em segundos, número de quadros) de
+            cada parte, em ordem
+    """
+    packets = read_packet_index(input_file)
+    if not packets:
+        return []
+    keyframes = [pts for pts, key in packets if key]
+    duration = packets[-1][0] - packets[0][0]
+
+    starts = [packets[0][0]]
+    for i in range(1, segments):
+        target = packets[0][0] + duration * i / segments
+        nearest = min(keyframes, key=lambda pts: abs(pts - target))
+        if nearest > starts[-1]:
+            starts.append(nearest)
+
+    bounds = starts + [float('inf')]
+    return [(bounds[i], sum(1 for pts, _ in packets if bounds[i] <= pts < bounds[i + 1]))
+            for i in range(len(starts))]
+
+def _convert_to_h264_mkv_segmented(input_file, output_file, segments, audio=True):
+    """Codifica as partes de split_at_keyframes em paralelo e as junta"""
+    parts = split_at_keyframes(input_file, segments)
+    threads = max(1, (os.cpu_count() or 1) // max(1, len(parts)))
+    print(f"Codificando {len(parts)} partes em paralelo ({threads} threads cada)")
+
+    output_dir = os.path.dirname(os.path.abspath(output_file))
+    with tempfile.TemporaryDirectory(dir=output_dir) as temp_dir:
+        commands = []
+        part_files = []
+        for i, (start, frames) in enumerate(parts):
+            part_files.append(os.path.join(temp_dir, f"part{i:03d}.mkv"))
+            commands.append([
+                'ffmpeg', '-ss', str(start), '-i', input_file,
+                '-frames:v', str(frames), '-an',
+                '-c:v', 'libx264', '-preset', 'medium', '-crf', '23',
+                '-threads', str(threads),
+                part_files[-1], '-y'
+            ])
+
+        has_audio = audio and _has_audio(probe_video(input_file))
+        audio_file = os.path.join(temp_dir, "audio.mka")
+        if has_audio:
+            commands.append(['ffmpeg', '-i', input_file, '-vn', '-c:a', 'aac',
+                             audio_file, '-y'])
+
+        with ThreadPoolExecutor(max_workers=len(commands)) as executor:
+            futures = [executor.submit(_in_stage_context(_run_ffmpeg_command), cmd,
+                                       record=False)
+                       for cmd in commands]
+            for future in futures:
+                # As partes rodam em outras threads; as métricas vão para a etapa desta
+                _record_process_metrics(future.result())
+
+        list_file = _write_concat_list(part_files)
+        try:
+            cmd = ['ffmpeg', '-f', 'concat', '-safe', '0', '-i', list_file]
+            if has_audio:
+                cmd += ['-i', audio_file, '-map', '0:v', '-map', '1:a']
+            cmd += ['-c', 'copy', output_file, '-y']
+            _run_ffmpeg_command(cmd)
+        finally:
+            os.unlink(list_file)
+
+# Folga, em segundos, baixada antes e depois de um trecho para garantir que
+# o keyframe anterior ao início do corte esteja no arquivo parcial
+KEYFRAME_MARGIN = 10
+
+def time_to_seconds(value):
+    """Converte 'HH:MM:SS[.ms]' (ou um número) em segundos"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    seconds = 0.0
+    for part in value.split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+def seconds_to_time(seconds):
+    """Converte segundos em 'HH:MM:SS.mmm'"""
+    hours, rest = divmod(max(seconds, 0.0), 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{int(hours):02d}:{int(minutes):02d}:{seconds:06.3f}"
+
+def clip_range_seconds(clip):
+    """
+    Retorna (início, fim) em segundos de um trecho
+
+    O trecho tem 'start_frame'/'end_frame'/'fps' (por frames) ou
+    'start_time'/'end_time' (por tempo), como os de _dataset_cut.
+
+    Raises:
+        ValueError: Se um trecho por frames não tiver 'fps'
+    """
+    if 'start_frame' in clip:
+        if not clip.get('fps'):
+            raise ValueError(f"Trecho por frames sem 'fps': {clip}")
+        return clip['start_frame'] / clip['fps'], clip['end_frame'] / clip['fps']
+    return time_to_seconds(clip['start_time']), time_to_seconds(clip['end_time'])
+
+# Custo relativo de decodificar cada codec do YouTube (H.264 = 1). Na
+# mesma resolução, o seletor prefere o formato mais barato de baixar e de
+# decodificar nas etapas seguintes.
+DECODE_COST = {'avc1': 1.0, 'h264': 1.0, 'hev1': 1.5, 'hvc1': 1.5,
+               'vp09': 2.0, 'vp9': 2.0, 'av01': 3.0}
+# Penalidade do áudio que não é AAC (o MKV final recodifica para AAC)
+NON_AAC_AUDIO_COST = 1.5
+YOUTUBE_HEIGHTS = {'1080p': 1080, '4K': 2160}
+FORMAT_CACHE_FILE = 'formats.json'
+
+# Transferência dos downloads do YouTube: fragmentos HLS/DASH baixados ao
+# mesmo tempo (a vazão de um fragmento por vez é limitada pela latência de
+# cada requisição), tamanho das requisições HTTP em partes, buffer de
+# leitura e novas tentativas por fragmento
+FRAGMENT_WORKERS_ENV = 'VIDEO_DATASETS_FRAGMENT_WORKERS'
+YOUTUBE_FRAGMENT_WORKERS = 8
+YOUTUBE_HTTP_CHUNK_SIZE = 10 * 1024 * 1024
+YOUTUBE_BUFFER_SIZE = DOWNLOAD_CHUNK_SIZE
+YOUTUBE_FRAGMENT_RETRIES = 10
+
+_format_choices = {}  # Escolhas de formato quando o cache está desativado
+
+def _format_bytes(fmt, duration=None):
+    """Bytes de um formato do yt-dlp (tamanho, estimativa ou taxa x duração)"""
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if not size and fmt.get('tbr') and duration:
+        size = fmt['tbr'] * duration * 125  # kbit/s -> bytes
+    return size or None
+
+def _codec_family(codec):
+    return (codec or '').split('.')[0].lower()
+
+def choose_youtube_format(formats, resolution=None, audio=True, duration=None):
+    """
+    Escolhe o formato do YouTube a baixar entre os listados pelo yt-dlp
+
+    Mantém a maior altura de vídeo até o limite de `resolution` ('1080p',
+    '4K' ou None, sem limite) e, entre os formatos dessa altura, o de menor
+    bytes x DECODE_COST do codec. Formatos sem tamanho conhecido ficam por
+    último. Com `audio`, acrescenta o áudio mais leve (preferindo AAC);
+    sem ele, o download é só de vídeo.
+
+    Returns:
+        str: Seletor do yt-dlp ('<vídeo>+<áudio>' ou '<vídeo>'), ou None se
+            não houver formato de vídeo
+    """
+    limit = YOUTUBE_HEIGHTS.get(resolution)
+    videos = [fmt for fmt in formats
+              if fmt.get('vcodec') not in (None, 'none') and fmt.get('height')
+              and (limit is None or fmt['height'] <= limit)]
+    if not videos:
+        return None
+    height = max(fmt['height'] for fmt in videos)
+
+    def cost(fmt, codec, costs, default):
+        size = _format_bytes(fmt, duration)
+        return (size is None, (size or 0) * costs.get(_codec_family(fmt.get(codec)), default))
+
+    video = min((fmt for fmt in videos if fmt['height'] == height),
+                key=lambda fmt: cost(fmt, 'vcodec', DECODE_COST, max(DECODE_COST.values())))
+    audios = [fmt for fmt in formats
+              if fmt.get('vcodec') == 'none' and fmt.get('acodec') not in (None, 'none')]
+    if not audio or not audios or video.get('acodec') not in (None, 'none'):
+        # Formato já com áudio: sem ele, o áudio é descartado na codificação
+        return str(video['format_id'])
+    best_audio = min(audios, key=lambda fmt: cost(fmt, 'acodec', {'mp4a': 1.0},
+                                                  NON_AAC_AUDIO_COST))
+    return f"{video['format_id']}+{best_audio['format_id']}"
+
+def _format_cache_path():
+    cache_dir = get_cache_dir()
+    return os.path.join(cache_dir, FORMAT_CACHE_FILE) if cache_dir else None
+
+def _load_format_choices():
+    path = _format_cache_path()
+    if path is None:
+        return _format_choices
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def youtube_format(url, resolution=None, audio=True):
+    """
+    Seletor de formato do yt-dlp para `url` (veja choose_youtube_format)
+
+    A escolha é gravada em FORMAT_CACHE_FILE, no diretório do cache, por
+    URL, resolução e áudio: as próximas construções usam o mesmo formato,
+    sem consultar a rede, e reaproveitam o download em cache. O seletor
+    gravado termina nos seletores genéricos do yt-dlp ('<id>/best[...]'),
+    usados se o formato escolhido deixar de existir ou se o vídeo não listar
+    formatos.
+    """
+    key = f"{url}|{resolution or ''}|{'audio' if audio else 'video'}"
+    limit = YOUTUBE_HEIGHTS.get(resolution)
+    generic = f"best[height<={limit}]/best" if limit else 'best'
+    choices = _load_format_choices()
+    if key in choices:
+        # Escolhas gravadas antes do seletor genérico ganham o mesmo fallback
+        selector = choices[key]
+        return selector if '/' in selector or selector == generic else f"{selector}/{generic}"
+
+    import yt_dlp
+    with yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True}) as ydl:
+        metadata = ydl.extract_info(url, download=False, process=False)
+    choice = choose_youtube_format(metadata.get('formats') or [], resolution, audio,
+                                   metadata.get('duration'))
+    selector = f"{choice}/{generic}" if choice else generic
+    print(f"Formato escolhido para {url}: {selector}")
+
+    path = _format_cache_path()
+    if path is None:
+        _format_choices[key] = selector
+        return selector
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    choices = _load_format_choices()  # Relê: outro processo pode ter gravado
+    choices[key] = selector
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(choices, f, indent=2)
+    os.replace(temp_path, path)
+    return selector
+
+def _youtube_transfer_options(section=None, fragment_workers=None,
+                              http_chunk_size=YOUTUBE_HTTP_CHUNK_SIZE,
+                              buffer_size=YOUTUBE_BUFFER_SIZE):
+    """
+    Opções de transferência do yt-dlp (não alteram o arquivo baixado)
+
+    O vídeo inteiro é baixado pelo próprio yt-dlp: formatos HLS/DASH com
+    `fragment_workers` fragmentos ao mesmo tempo (padrão: variável
+    VIDEO_DATASETS_FRAGMENT_WORKERS ou YOUTUBE_FRAGMENT_WORKERS) e formatos
+    https em requisições de `http_chunk_size` bytes. Fragmentos com falha
+    são baixados de novo e, se ainda assim faltarem, o download falha em vez
+    de gerar um vídeo com buracos. Trechos (`section`) são baixados pelo
+    FFmpeg, por uma única conexão, e recebem só as opções de reconexão.
+    """
+    options = {
+        'retries': DOWNLOAD_RETRIES,
+        'external_downloader_args': {'ffmpeg_i': ['-reconnect', '1',
+                                                  '-reconnect_on_network_error', '1',
+                                                  '-reconnect_delay_max', '30']},
+    }
+    if section:
+        return options
+    if fragment_workers is None:
+        fragment_workers = int(os.environ.get(FRAGMENT_WORKERS_ENV, YOUTUBE_FRAGMENT_WORKERS))
+    options.update({
+        'concurrent_fragment_downloads': max(1, fragment_workers),
+        'http_chunk_size': http_chunk_size,
+        'buffersize': buffer_size,
+        'noresizebuffer': True,
+        'fragment_retries': YOUTUBE_FRAGMENT_RETRIES,
+        'skip_unavailable_fragments': False,
+        'continuedl': True,
+    })
+    return options
+
+def merge_sections(ranges, gap=KEYFRAME_MARGIN):
+    """
+    Une os intervalos (início, fim) que se sobrepõem ou distam menos de `gap` segundos
+
+    Intervalos distantes continuam separados, para que cada um seja baixado
+    como um trecho próprio em vez de um único trecho que cubra todos.
+
+    Returns:
+        list[tuple[float, float]]: Intervalos unidos, em ordem
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start - merged[-1][1] < gap:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def _youtube_download_options(url, fps=None, resolution=None, section=None,
+                              margin=KEYFRAME_MARGIN, audio=True):
+    """
+    Opções do yt-dlp, variante do cache e início pedido de um download do YouTube
+
+    Trechos são copiados pelo FFmpeg a partir do keyframe anterior ao início
+    pedido; com `-copyts` (também na conversão), o arquivo mantém os instantes
+    do vídeo original e o início real pode ser lido dele (_section_offset).
+
+    Returns:
+        tuple: (ydl_opts sem 'outtmpl', variante do cache, início do trecho
+            pedido em segundos)
+    """
+    ydl_opts = {
+        'format': youtube_format(url, resolution, audio),
+    }
+
+    # Configurar FPS se especificado
+    if fps:
+        ydl_opts['postprocessors'] = [{
+            'key': 'FFmpegVideoConvertor',
+            'preferedformat': 'mp4',
+        }]
+        ydl_opts['postprocessor_args'] = {'videoconvertor': ['-copyts']}
+
+    # Baixar apenas o trecho necessário
+    start = 0.0
+    variant = f"format={ydl_opts['format']};convert={bool(fps)}"
+    if section:
+        start = max(0.0, section[0] - margin)
+        variant += f";section={start}-{section[1] + margin};copyts"
+        ydl_opts['external_downloader_args'] = {'ffmpeg_o': ['-copyts']}
+    return ydl_opts, variant, start
+
+def _section_offset(downloaded_file, section):
+    """
+    Instante do vídeo original em que o arquivo baixado começa
+
+    É o início do arquivo (com -copyts, o keyframe anterior ao trecho pedido),
+    na mesma escala usada por `-ss`; 0 quando o vídeo inteiro foi baixado.
+    """
+    if not section:
+        return 0.0
+    return float(probe_video(downloaded_file)['format'].get('start_time', 0) or 0)
+
+@_stage('download')
+def download_youtube_video(url, output_path, fps=None, resolution=None,
+                           section=None, margin=KEYFRAME_MARGIN, audio=True,
+                           fragment_workers=None, http_chunk_size=YOUTUBE_HTTP_CHUNK_SIZE,
+                           buffer_size=YOUTUBE_BUFFER_SIZE):
+    """
+    Baixa vídeo do YouTube com configurações específicas
+
+    Com `section`, baixa apenas o trecho (início, fim) em segundos, mais
+    `margin` segundos de cada lado para incluir o keyframe anterior ao corte.
+    O formato vem de youtube_format; com `audio=False`, baixa só o vídeo.
+
+    Sem `section`, formatos HLS/DASH são baixados com `fragment_workers`
+    fragmentos ao mesmo tempo (veja _youtube_transfer_options); trechos são
+    baixados pelo FFmpeg, com reconexão. Com o cache ativo, o download
+    parcial fica em <cache>/partial e é retomado, fragmento a fragmento, se
+    uma execução anterior foi interrompida. Ao final, mostra a vazão obtida.
+
+    Returns:
+        float: Instante, no vídeo original, em que o arquivo baixado começa
+            (0 quando o vídeo inteiro é baixado). Lido do próprio arquivo: a
+            cópia começa no keyframe anterior ao trecho pedido, não em
+            `section[0] - margin`. Deve ser repassado como `offset` para as
+            funções de corte.
+
+    O resultado é guardado no cache de downloads, indexado pela URL, pelo
+    formato e pelo trecho; com a mesma configuração, a próxima chamada não
+    acessa a rede.
+    """
+    ydl_opts, variant, start = _youtube_download_options(url, fps, resolution, section,
+                                                         margin, audio)
+
+    # Reaproveitar download anterior com a mesma configuração
+    base_name = output_path.replace('.%(ext)s', '')
+    entry = cache_lookup(url, variant)
+    if entry and cache_fetch(url, base_name + entry['ext'], variant):
+        return _section_offset(base_name + entry['ext'], section)
+
+    # Diretório estável para os fragmentos: permite retomar o download
+    cache_dir = get_cache_dir()
+    partial_dir = (os.path.join(cache_dir, 'partial', cache_key(url, variant))
+                   if cache_dir else None)
+    partial_base = os.path.join(partial_dir, 'video') if partial_dir else base_name
+    if partial_dir:
+        os.makedirs(partial_dir, exist_ok=True)
+
+    transfer = {'bytes': 0, 'seconds': 0.0}
+    def report_progress(progress):
+        if progress['status'] == 'finished':
+            transfer['bytes'] += (progress.get('total_bytes')
+                                  or progress.get('downloaded_bytes') or 0)
+            transfer['seconds'] += progress.get('elapsed') or 0.0
+
+    transfer_options = _youtube_transfer_options(section, fragment_workers, http_chunk_size,
+                                                 buffer_size)
+    transfer_options['external_downloader_args'].update(
+        ydl_opts.get('external_downloader_args', {}))
+    ydl_opts.update(transfer_options)
+    ydl_opts['outtmpl'] = partial_base + '.%(ext)s'
+    ydl_opts['progress_hooks'] = [report_progress]
+
+    print(f"Baixando vídeo do YouTube: {url}")
+    import yt_dlp
+    if section:
+        ydl_opts['download_ranges'] = yt_dlp.utils.download_range_func(
+            None, [(start, section[1] + margin)])
+        print(f"Baixando apenas o trecho {seconds_to_time(start)} a "
+              f"{seconds_to_time(section[1] + margin)}")
+
+    started = time.perf_counter()
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        ydl.download([url])
+    seconds = transfer['seconds'] or time.perf_counter() - started
+    if transfer['bytes'] and seconds > 0:
+        workers = ydl_opts.get('concurrent_fragment_downloads')
+        print(f"Transferidos {format_size(transfer['bytes'])} em {seconds:.1f}s "
+              f"({format_size(transfer['bytes'] / seconds)}/s"
+              + (f", {workers} fragmentos em paralelo)" if workers else ")"))
+
+    downloaded_file = get_video_extension(partial_base)
+    if partial_dir:
+        extension = os.path.splitext(downloaded_file)[1]
+        downloaded_file = shutil.move(downloaded_file, base_name + extension)
+        shutil.rmtree(partial_dir, ignore_errors=True)
+    cache_store(url, downloaded_file, variant)
+    print(f"Download do YouTube concluído")
+    return _section_offset(downloaded_file, section)
+
+def youtube_download_info(url, fps=None, resolution=None, section=None,
+                          margin=KEYFRAME_MARGIN, audio=True):
+    """
+    Estima um download do YouTube sem baixá-lo (metadados do yt-dlp)
+
+    Returns:
+        dict: 'bytes' (a baixar; 0 se já estiver no cache), 'size' (do
+            arquivo baixado) e 'width'/'height' (None se desconhecidos)
+    """
+    ydl_opts, variant, start = _youtube_download_options(url, fps, resolution, section,
+                                                         margin, audio)
+    entry = cache_lookup(url, variant)
+    if entry is not None:
+        video = _video_stream(probe_video(os.path.join(get_cache_dir(), 'objects',
+                                                       entry['sha256'])))
+        return {'bytes': 0, 'size': entry['size'],
+                'width': video.get('width'), 'height': video.get('height')}
+
+    import yt_dlp
+    with yt_dlp.YoutubeDL({**ydl_opts, 'quiet': True, 'no_warnings': True}) as ydl:
+        metadata = ydl.extract_info(url, download=False)
+    # Com formatos separados (vídeo + áudio), o yt-dlp lista os dois
+    formats = metadata.get('requested_formats') or [metadata]
+    size = sum(f.get('filesize') or f.get('filesize_approx') or 0 for f in formats)
+    if section and metadata.get('duration'):
+        size *= min(1.0, (section[1] + margin - start) / metadata['duration'])
+    return {'bytes': int(size), 'size': int(size),
+            'width': metadata.get('width'), 'height': metadata.get('height')}
+
+# Índice de quadros (<vídeo>.idx): cabeçalho FRAME_INDEX_HEADER seguido dos
+# instantes (float64), das posições em bytes (int64) e das flags de keyframe
+# (uint8) de cada quadro, em ordem de exibição.
+FRAME_INDEX_SUFFIX = '.idx'
+FRAME_INDEX_MAGIC = b'VDFIDX\0\0'
+FRAME_INDEX_VERSION = 1
+# Assinatura, versão, quadros, tamanho, mtime_ns e start_time
+FRAME_INDEX_HEADER = struct.Struct('<8sIQQqd')
+
+class FrameIndex:
+    """
+    Instante, posição em bytes e flag de keyframe de cada quadro de um vídeo
+
+    Os instantes são relativos ao início do arquivo, na mesma escala usada
+    por `-ss`. As consultas por instante e por keyframe usam busca binária.
+    Use load_frame_index() para obtê-lo a partir do arquivo ao lado do vídeo.
+    """
+
+    def __init__(self, pts, positions, keyframes, start_time=0.0):
+        self.pts = pts
+        self.positions = positions
+        self.keyframes = keyframes
+        self.start_time = start_time
+        self.keyframe_numbers = [i for i, key in enumerate(keyframes) if key]
+
+    def __len__(self):
+        return len(self.pts)
+
+    def packets(self, start=0, end=None):
+        """Mesmo formato de read_packet_index, a partir do keyframe anterior a `start`"""
+        first = self.keyframe_before(self.frame_at(start)) if len(self) else 0
+        last = len(self) if end is None else bisect.bisect_right(self.pts, end)
+        return [(self.pts[i], bool(self.keyframes[i])) for i in range(first, last)]
+
+    def frame_at(self, seconds):
+        """Número do quadro exibido no instante `seconds`"""
+        return max(0, bisect.bisect_right(self.pts, seconds + 1e-6) - 1)
+
+    def keyframe_before(self, frame):
+        """Número do último keyframe em ou antes do quadro `frame`"""
+        position = bisect.bisect_right(self.keyframe_numbers, frame) - 1
+        return self.keyframe_numbers[max(0, position)] if self.keyframe_numbers else 0
+
+    def seek_point(self, frame):
+        """
+        Onde começar a decodificar para chegar ao quadro `frame`
+
+        Returns:
+            tuple[int, float, int]: (keyframe, instante, posição em bytes)
+        """
+        keyframe = self.keyframe_before(frame)
+        return keyframe, self.pts[keyframe], self.positions[keyframe]
+
+    def frame_time(self, frame):
+        """Instante do quadro `frame`; após o último, o fim do último quadro"""
+        if frame < len(self):
+            return self.pts[max(0, frame)]
+        step = self.pts[-1] - self.pts[-2] if len(self) > 1 else 0.0
+        return self.pts[-1] + step * (frame - len(self) + 1)
+
+def build_frame_index(input_file):
+    """
+    Gera o índice de quadros de um vídeo e o grava em `<vídeo>.idx`
+
+    Uma única leitura dos cabeçalhos de pacotes com ffprobe, sem decodificar.
+
+    Returns:
+        FrameIndex: Índice gerado
+    """
+    start_time = float(probe_video(input_file)['format'].get('start_time', 0) or 0)
+    cmd = [
+        'ffprobe', '-v', 'error', '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts_time,pos,flags', '-of', 'csv=p=0',
+        input_file
+    ]
+    result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+
+    packets = []
+    for line in result.stdout.splitlines():
+        pts_time, pos, flags = (line.split(',') + ['', ''])[:3]
+        if pts_time not in ('', 'N/A'):
+            packets.append((float(pts_time) - start_time,
+                            int(pos) if pos.isdigit() else -1, 'K' in flags))
+    packets.sort()
+
+    index = FrameIndex(array.array('d', (pts for pts, _, _ in packets)),
+                       array.array('q', (pos for _, pos, _ in packets)),
+                       bytes(key for _, _, key in packets), start_time)
+    stat = os.stat(input_file)
+    with open(input_file + FRAME_INDEX_SUFFIX, 'wb') as f:
+        f.write(FRAME_INDEX_HEADER.pack(FRAME_INDEX_MAGIC, FRAME_INDEX_VERSION, len(index),
+                                        stat.st_size, stat.st_mtime_ns, start_time))
+        f.write(index.pts.tobytes())
+        f.write(index.positions.tobytes())
+        f.write(index.keyframes)
+    return index
+
+def load_frame_index(input_file, build=True):
+    """
+    Lê o índice de quadros de `<vídeo>.idx`, gerando-o se faltar ou estiver desatualizado
+
+    Returns:
+        FrameIndex: Índice, ou None se não houver índice válido e `build` for False
+    """
+    stat = os.stat(input_file)
+    try:
+        with open(input_file + FRAME_INDEX_SUFFIX, 'rb') as f:
+            magic, version, count, size, mtime_ns, start_time = \
+                FRAME_INDEX_HEADER.unpack(f.read(FRAME_INDEX_HEADER.size))
+            if (magic, version, size, mtime_ns) == (FRAME_INDEX_MAGIC, FRAME_INDEX_VERSION,
+                                                    stat.st_size, stat.st_mtime_ns):
+                pts = array.array('d')
+                pts.frombytes(f.read(count * 8))
+                positions = array.array('q')
+                positions.frombytes(f.read(count * 8))
+                keyframes = f.read(count)
+                if len(keyframes) == count:
+                    return FrameIndex(pts, positions, keyframes, start_time)
+    except (OSError, struct.error, ValueError):
+        pass
+    return build_frame_index(input_file) if build else None
+
+def frames_to_seconds(input_file, start_frame, end_frame, fps=None, offset=0):
+    """
+    Converte o trecho [start_frame, end_frame) em instantes do arquivo
+
+    Se o vídeo já tem índice de quadros, usa os instantes reais dele, o que
+    mantém o corte exato em vídeos com taxa variável. Quando o arquivo é um
+    trecho (`offset` diferente de 0), o primeiro quadro do índice corresponde
+    ao quadro round(início do arquivo * fps) do vídeo original.
+
+    Sem índice, não gera um (o que leria os pacotes do vídeo inteiro): estima
+    os instantes com `fps` constante (padrão: a taxa do próprio vídeo) e os
+    ajusta ao pacote a menos de meio quadro, lendo só os pacotes ao redor de
+    cada ponta do corte com read_packet_index.
+
+    Returns:
+        tuple[float, float]: (início, fim) em segundos
+    """
+    index = load_frame_index(input_file, build=False)
+    if index is not None and len(index) and not offset:
+        return index.frame_time(start_frame), index.frame_time(end_frame)
+    fps = fps or _probe_fps(input_file) or 30
+    if index is not None and len(index):
+        first_frame = round((offset + index.pts[0]) * fps)
+        return (index.frame_time(start_frame - first_frame),
+                index.frame_time(end_frame - first_frame))
+
+    def nearest_packet(seconds):
+        packets = read_packet_index(input_file, max(0, seconds - 2 / fps), seconds + 2 / fps)
+        nearest = min((pts for pts, _ in packets), key=lambda pts: abs(pts - seconds),
+                      default=seconds)
+        # Depois do último quadro não há pacote a ajustar
+        return nearest if abs(nearest - seconds) < 0.5 / fps else seconds
+
+    return (nearest_packet(start_frame / fps - offset),
+            nearest_packet(end_frame / fps - offset))
+
+def read_packet_index(input_file, start=0, end=None):
+    """
+    Lê o índice de pacotes de vídeo entre `start` e `end` segundos
+
+    Lê apenas os cabeçalhos dos pacotes (sem decodificar), a partir do
+    keyframe anterior a `start`. Os instantes são relativos ao início do
+    arquivo, na mesma escala usada por `-ss`.
+
+    Se o vídeo já tem índice de quadros (build_frame_index), ele é usado no
+    lugar do ffprobe.
+
+    Returns:
+        list[tuple[float, bool]]: (instante, é keyframe) em ordem de exibição
+    """
+    index = load_frame_index(input_file, build=False)
+    if index is not None:
+        return index.packets(start, end)
+
+    start_time = float(probe_video(input_file)['format'].get('start_time', 0) or 0)
+    interval = f"{start + start_time}%" + (f"{end + start_time}" if end is not None else '')
+    cmd = [
+        'ffprobe', '-v', 'error', '-select_streams', 'v:0',
+        '-read_intervals', interval,
+        '-show_entries', 'packet=pts_time,flags', '-of', 'csv=p=0',
+        input_file
+    ]
+    result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+
+    packets = []
+    for line in result.stdout.splitlines():
+        pts_time, _, flags = line.partition(',')
+        if pts_time not in ('', 'N/A'):
+            packets.append((float(pts_time) - start_time, 'K' in flags))
+    return sorted(packets)
+
+def _frame_rate(video):
+    """Taxa de quadros de um fluxo de probe_video (ex: '30000/1001')"""
+    numerator, _, denominator = video.get('avg_frame_rate', '0/0').partition('/')
+    try:
+        return float(numerator) / float(denominator or 1)
+    except ZeroDivisionError:
+        return 0.0
+
+# Bitstream filter que descarta os pacotes anteriores ao ponto de busca
+DROP_BEFORE_START_BSF = 'noise=drop=lt(pts\\,0)'
+
+def _cut_commands(input_file, output_file, start, end, seek='smart', encode_args=None):
+    """
+    Monta os comandos FFmpeg para cortar [start, end) segundos de um vídeo
+
+    Modos de `seek`:
+        'copy': busca na saída e cópia de fluxo (comportamento antigo; lê o
+            vídeo desde o início e começa no keyframe que houver)
+        'smart': busca na entrada até o keyframe anterior (índice de pacotes)
+            e corte exato. Os GOPs inteiros dentro do trecho são copiados e
+            só os GOPs parciais das pontas são recodificados; fontes que não
+            são H.264/AAC têm apenas o trecho recodificado. O custo depende
+            da duração do trecho, não da posição.
+
+    `encode_args` substitui as opções de codificação das partes recodificadas
+    (padrão: H.264/AAC, preset medium, CRF 23).
+
+    Returns:
+        tuple[list[list[str]], list[str]]: Comandos, em ordem, e arquivos
+            temporários a remover depois
+    """
+    duration = end - start
+    if seek == 'copy':
+        return [['ffmpeg', '-i', input_file, '-ss', str(start), '-t', str(duration),
+                 '-c', 'copy', output_file, '-y']], []
+
+    info = probe_video(input_file)
+    video = _video_stream(info)
+    half_frame = 0.5 / (_frame_rate(video) or 30)
+    index = read_packet_index(input_file, start, end + 1)
+    packets = [pts for pts, _ in index if start - half_frame <= pts < end - half_frame]
 
-def download_youtube_video(url, output_path, fps=None, resolution=None):
-    """Baixa vídeo do YouTube com configurações específicas"""
-    print(f"Baixando vídeo do YouTube: {url}")
+    # Limites de GOP dentro do trecho (inclui o fim, se ele cair num keyframe)
+    boundaries = [pts for pts, key in index
+                  if key and start - half_frame <= pts <= end + half_frame]
 
-    ydl_opts = {
-        'outtmpl': output_path,
-        'format': 'best',
-    }
+    audio_codecs = {stream.get('codec_name') for stream in info['streams']
+                    if stream.get('codec_type') == 'audio'}
+    encode = (encode_args or ['-c:v', 'libx264', '-c:a', 'aac',
+                              '-preset', 'medium', '-crf', '23'])
+    encode = encode + ['-pix_fmt', video.get('pix_fmt', 'yuv420p')]
+    if (video.get('codec_name') != 'h264' or not audio_codecs <= {'aac'}
+            or len(boundaries) < 2):
+        return [['ffmpeg', '-ss', str(start), '-i', input_file, '-t', str(duration)]
+                + encode + [output_file, '-y']], []
 
-    # Configurar filtros de formato baseado na resolução
-    if resolution == '4K':
-        ydl_opts['format'] = 'best[height<=2160]'
-    elif resolution == '1080p':
-        ydl_opts['format'] = 'best[height<=1080]/best[height<1080]'
+    # Partes: GOP parcial inicial (recodificado), GOPs inteiros (copiados) e
+    # GOP parcial final (recodificado). A parte copiada termina exatamente
+    # num keyframe, então limitá-la pelo número de pacotes a torna exata.
+    first_key, last_key = boundaries[0], boundaries[-1]
+    copied = sum(1 for pts in packets if first_key - half_frame <= pts < last_key - half_frame)
 
-    # Configurar FPS se especificado
-    if fps:
-        ydl_opts['postprocessors'] = [{
-            'key': 'FFmpegVideoConvertor',
-            'preferedformat': 'mp4',
-        }]
+    parts = []
+    commands = []
+    if first_key - start > half_frame:
+        parts.append(output_file + '.head.mkv')
+        commands.append(['ffmpeg', '-ss', str(start), '-i', input_file,
+                         '-t', str(first_key - start)] + encode + [parts[-1], '-y'])
+    # Com cópia, a busca na entrada pode parar num keyframe anterior (no MKV,
+    # o início do cluster); os pacotes anteriores a first_key ficam com
+    # instante negativo e são descartados.
+    parts.append(output_file + '.middle.mkv')
+    commands.append(['ffmpeg', '-ss', str(first_key), '-i', input_file,
+                     '-t', str(last_key - first_key), '-frames:v', str(copied),
+                     '-c', 'copy', '-bsf:v', DROP_BEFORE_START_BSF,
+                     '-bsf:a', DROP_BEFORE_START_BSF, parts[-1], '-y'])
+    if end - last_key > half_frame:
+        parts.append(output_file + '.tail.mkv')
+        commands.append(['ffmpeg', '-ss', str(last_key), '-i', input_file,
+                         '-t', str(end - last_key)] + encode + [parts[-1], '-y'])
 
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        ydl.download([url])
+    if len(parts) == 1:
+        commands[0][-2] = output_file
+        return commands, []
 
-    print(f"Download do YouTube concluído")
+    # O demuxer concat converte o H.264 das partes para Annex B (SPS/PPS em
+    # cada keyframe), então a junção por cópia continua decodificável mesmo
+    # com parâmetros de codificação diferentes entre as partes.
+    list_file = _write_concat_list(parts)
+    commands.append(['ffmpeg', '-f', 'concat', '-safe', '0', '-i', list_file,
+                     '-c', 'copy', output_file, '-y'])
+    return commands, parts + [list_file]
+
+def _run_cut(input_file, output_file, start, end, seek):
+    """Executa os comandos de _cut_commands e remove os temporários"""
+    commands, temp_files = _cut_commands(input_file, output_file, start, end, seek)
+    try:
+        for cmd in commands:
+            _run_ffmpeg_command(cmd, duration=end - start,
+                                description=os.path.basename(output_file))
+    finally:
+        cleanup_temp_files(*temp_files)
+
+@_stage('cut')
+def cut_video_by_frames(input_file, output_file, start_frame, end_frame, fps=None,
+                        offset=0, seek='smart'):
+    """
+    Corta vídeo por frames
 
-def cut_video_by_frames(input_file, output_file, start_frame, end_frame, fps=30):
-    """Corta vídeo por frames"""
+    `offset` é o instante do vídeo original em que `input_file` começa
+    (retorno de download_youtube_video ao baixar só um trecho). `seek`
+    escolhe entre corte exato ('smart') e o corte antigo por cópia ('copy');
+    veja _cut_commands. Sem `fps`, usa a taxa de quadros do próprio vídeo.
+    """
     print(f"Cortando vídeo por frames: {start_frame} a {end_frame}")
+    fps = fps or _probe_fps(input_file) or 30
 
-    start_time = start_frame / fps
-    end_time = end_frame / fps
-    duration = end_time - start_time
+    if seek == 'smart':
+        start_time, end_time = frames_to_seconds(input_file, start_frame, end_frame,
+                                                 fps, offset)
+    else:
+        start_time = start_frame / fps - offset
+        end_time = end_frame / fps - offset
 
-    cmd = [
-        'ffmpeg', '-i', input_file,
-        '-ss', str(start_time),
-        '-t', str(duration),
-        '-c', 'copy',
-        output_file, '-y'
-    ]
-    _run_ffmpeg_command(cmd) # Usa a função auxiliar
+    _run_cut(input_file, output_file, start_time, end_time, seek)
     print(f"Corte por frames concluído: {output_file}")
 
-def cut_video_by_time(input_file, output_file, start_time, end_time):
-    """Corta vídeo por tempo"""
+@_stage('cut')
+def cut_video_by_time(input_file, output_file, start_time, end_time, offset=0,
+                      seek='smart'):
+    """
+    Corta vídeo por tempo
+
+    `offset` é o instante do vídeo original em que `input_file` começa
+    (retorno de download_youtube_video ao baixar só um trecho). `seek`
+    escolhe entre corte exato ('smart') e o corte antigo por cópia ('copy');
+    veja _cut_commands.
+    """
     print(f"Cortando vídeo por tempo: {start_time} a {end_time}")
 
-    cmd = [
-        'ffmpeg', '-i', input_file,
-        '-ss', start_time,
-        '-to', end_time,
-        '-c', 'copy',
-        output_file, '-y'
-    ]
-    _run_ffmpeg_command(cmd) # Usa a função auxiliar
+    start = time_to_seconds(start_time) - offset
+    end = time_to_seconds(end_time) - offset
+
+    _run_cut(input_file, output_file, start, end, seek)
     print(f"Corte por tempo concluído: {output_file}")
 
+# Filtro que mantém apenas os frames pares
+EVEN_FRAMES_FILTER = 'select=not(mod(n\\,2))'
+
+@_stage('filter')
 def keep_even_frames(input_file, output_file):
     """Mantém apenas frames pares"""
     print(f"Mantendo apenas frames pares...")
 
     cmd = [
         'ffmpeg', '-i', input_file,
-        '-vf', 'select=not(mod(n\\,2))',
+        '-vf', EVEN_FRAMES_FILTER,
         '-c:v', 'libx264', '-c:a', 'aac',
         output_file, '-y'
     ]
-    _run_ffmpeg_command(cmd) # Usa a função auxiliar
+    _run_ffmpeg_command(cmd, duration=_probe_duration(input_file)) # Usa a função auxiliar
     print(f"Filtro de frames pares concluído: {output_file}")
 
+class PipelineStageError(subprocess.CalledProcessError):
+    """
+    Falha de uma etapa de run_piped_stages
+
+    Atributos além dos de CalledProcessError: `stage` (nome da etapa que
+    causou a falha) e `statuses` (nome -> código de saída de todas as etapas).
+    """
+
+    def __init__(self, stage, returncode, cmd, stderr, statuses):
+        super().__init__(returncode, cmd, stderr=stderr)
+        self.stage = stage
+        self.statuses = statuses
+
+    def __str__(self):
+        return f"Etapa '{self.stage}' falhou com código {self.returncode}: {self.statuses}"
+
+async def _read_stderr_tail(stream, tail):
+    """Guarda as últimas linhas do stderr de uma etapa"""
+    async for line in stream:
+        tail.append(line.decode(errors='replace').rstrip('\n'))
+
+async def run_piped_stages_async(stages):
+    """
+    Executa comandos encadeados por pipes (stdout de um -> stdin do próximo)
+
+    Todas as etapas rodam ao mesmo tempo, sem intermediários em disco. Se uma
+    etapa falhar, as demais são encerradas; se a tarefa for cancelada, todos
+    os processos são encerrados antes de o cancelamento seguir.
+
+    Args:
+        stages (list[tuple[str, list[str]]]): (nome, comando) de cada etapa
+
+    Raises:
+        PipelineStageError: Com a etapa que originou a falha (uma etapa que só
+            falhou porque a seguinte fechou o pipe, ou que foi encerrada
+            pela falha de outra, não é apontada como causa)
+    """
+    import asyncio
+    processes = []
+    tails = []
+    readers = []
+    killed = set()
+    read_fd = None
+    try:
+        for i, (name, cmd) in enumerate(stages):
+            last = i == len(stages) - 1
+            write_fd = None
+            if not last:
+                read_next, write_fd = os.pipe()
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *cmd, stdin=subprocess.DEVNULL if read_fd is None else read_fd,
+                    stdout=subprocess.DEVNULL if last else write_fd,
+                    stderr=subprocess.PIPE)
+            finally:
+                # Os pipes ficam só com os processos; o EOF chega quando eles terminam
+                if read_fd is not None:
+                    os.close(read_fd)
+                    read_fd = None
+                if write_fd is not None:
+                    os.close(write_fd)
+                    read_fd = read_next
+            processes.append(process)
+            tails.append(deque(maxlen=FFMPEG_STDERR_LINES))
+            readers.append(asyncio.ensure_future(_read_stderr_tail(process.stderr, tails[-1])))
+
+        waits = {asyncio.ensure_future(process.wait()): process for process in processes}
+        pending = set(waits)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            if any(task.result() != 0 for task in done):
+                for process in processes:
+                    if process.returncode is None:
+                        process.kill()
+                        killed.add(process.pid)
+        await asyncio.gather(*readers)
+    except BaseException:
+        if read_fd is not None:
+            os.close(read_fd)
+        for process in processes:
+            if process.returncode is None:
+                process.kill()
+        for process in processes:
+            await process.wait()
+        raise
+
+    statuses = {name: process.returncode for (name, _), process in zip(stages, processes)}
+    failed = [i for i, process in enumerate(processes) if process.returncode != 0]
+    if failed:
+        causes = [i for i in failed if processes[i].pid not in killed
+                  and not any('Broken pipe' in line for line in tails[i])]
+        root = (causes or failed)[0]
+        raise PipelineStageError(stages[root][0], processes[root].returncode, stages[root][1],
+                                 '\n'.join(tails[root]), statuses)
+    return statuses
+
+def run_piped_stages(stages, timeout=None):
+    """Versão bloqueante de run_piped_stages_async, com tempo limite opcional"""
+    import asyncio
+    return asyncio.run(asyncio.wait_for(run_piped_stages_async(stages), timeout))
+
+# Codecs do fluxo NUT entre etapas que não escolhem um codec
+PIPE_CODEC_ARGS = ['-c:v', 'rawvideo', '-c:a', 'pcm_s16le']
+
+def ffmpeg_chain(input_file, output_file, steps):
+    """
+    Monta as etapas de run_piped_stages para uma sequência de comandos FFmpeg
+
+    Cada etapa lê a anterior e escreve a seguinte em NUT pelo pipe; a
+    primeira lê `input_file` e a última grava `output_file`.
+
+    Args:
+        steps (list[tuple]): (nome, opções de saída) ou (nome, opções de
+            saída, opções de entrada). Etapas intermediárias sem opção de
+            codec usam PIPE_CODEC_ARGS.
+
+    Exemplo:
+        run_piped_stages(ffmpeg_chain(entrada, saida, [
+            ('cut', ['-t', '60'], ['-ss', '120']),
+            ('filter', ['-vf', EVEN_FRAMES_FILTER]),
+            ('encode', ['-c:v', 'libx264', '-c:a', 'aac', '-crf', '23']),
+        ]))
+    """
+    stages = []
+    for i, step in enumerate(steps):
+        name, output_args = step[0], list(step[1])
+        input_args = list(step[2]) if len(step) > 2 else []
+        cmd = ['ffmpeg', '-nostdin', '-v', 'error'] + input_args
+        cmd += ['-i', input_file if i == 0 else 'pipe:0'] + output_args
+        if i == len(steps) - 1:
+            cmd += [output_file, '-y']
+        else:
+            if not any(arg.startswith(('-c', '-codec', '-vcodec', '-acodec'))
+                       for arg in output_args):
+                cmd += PIPE_CODEC_ARGS
+            cmd += ['-f', 'nut', 'pipe:1']
+        stages.append((name, cmd))
+    return stages
+
+# Perfis de saída prontos para make_renditions
+RENDITION_PROFILES = {
+    'full': {},
+    '720p': {'height': 720},
+    '480p': {'height': 480},
+    'even': {'filter': EVEN_FRAMES_FILTER},
+}
+
+@_stage('encode')
+def make_renditions(input_file, outputs, crf=23, preset='medium', audio_codec='aac'):
+    """
+    Gera várias versões de um vídeo decodificando a entrada uma única vez
+
+    Um único processo FFmpeg divide o vídeo decodificado com o filtro
+    `split` e codifica cada saída com seu próprio perfil.
+
+    Args:
+        input_file (str): Vídeo de entrada
+        outputs (dict): Caminho de saída -> perfil, com as chaves opcionais
+            'width'/'height' (reduz, sem ampliar; o lado omitido mantém a
+            proporção), 'fps' (taxa de quadros), 'filter' (filtro extra, ex:
+            EVEN_FRAMES_FILTER), 'crf' e 'preset'. Veja RENDITION_PROFILES.
+        crf, preset, audio_codec: Padrões da codificação das saídas
+            (`audio_codec=None` descarta o áudio)
+
+    Returns:
+        list[str]: Caminhos gerados
+    """
+    print(f"Gerando {len(outputs)} versões de {input_file} com uma única decodificação...")
+    has_audio = audio_codec and _has_audio(probe_video(input_file))
+
+    labels = [f'[v{i}]' for i in range(len(outputs))]
+    graph = [f"[0:v]split={len(outputs)}{''.join(labels)}"]
+    cmd = ['ffmpeg', '-i', input_file]
+    output_args = []
+    for i, (output_file, profile) in enumerate(outputs.items()):
+        filters = []
+        if profile.get('filter'):
+            filters.append(profile['filter'])
+        if profile.get('fps'):
+            filters.append(f"fps={profile['fps']}")
+        # Sem ampliar: o lado pedido é limitado ao tamanho da entrada
+        width = f"min({profile['width']}\\,iw)" if profile.get('width') else -2
+        height = f"min({profile['height']}\\,ih)" if profile.get('height') else -2
+        if profile.get('width') or profile.get('height'):
+            filters.append(f"scale={width}:{height}")
+        graph.append(f"{labels[i]}{','.join(filters) or 'null'}[out{i}]")
+
+        output_args += ['-map', f'[out{i}]']
+        if has_audio:
+            output_args += ['-map', '0:a', '-c:a', audio_codec]
+        output_args += ['-c:v', 'libx264', '-preset', profile.get('preset', preset),
+                        '-crf', str(profile.get('crf', crf)), output_file, '-y']
+
+    cmd += ['-filter_complex', ';'.join(graph)] + output_args
+    _run_ffmpeg_command(cmd, description=os.path.basename(input_file))
+    for output_file in outputs:
+        build_frame_index(output_file)
+    print(f"Versões geradas: {list(outputs)}")
+    return list(outputs)
+
+class VideoPipeline:
+    """
+    Pipeline preguiçoso de corte, filtros, concatenação e codificação
+
+    As etapas são apenas registradas; run() inspeciona as entradas com
+    ffprobe e gera o menor número de execuções do FFmpeg: um único grafo de
+    filtros com uma única codificação final, ou cópia do fluxo quando não há
+    corte nem filtro e o codec de entrada já é o de saída.
+
+    Exemplo:
+        VideoPipeline(entrada).cut_frames(140, 1436, fps=24).keep_even_frames().run(saida)
+    """
+
+    def __init__(self, *input_files):
+        self.input_files = list(input_files)
+        self.cut = None
+        self._frame_cut = None
+        self.filters = []
+        self.video_codec = 'libx264'
+        self.audio_codec = 'aac'
+        self.crf = 23
+        self.preset = 'medium'
+
+    def concat(self, *input_files):
+        """Acrescenta vídeos ao final da linha do tempo"""
+        self.input_files += input_files
+        return self
+
+    def cut_frames(self, start_frame, end_frame, fps=None, offset=0):
+        """Corta por frames (mesma semântica de cut_video_by_frames)"""
+        fps = fps or _probe_fps(self.input_files[0]) or 30
+        self.cut = (start_frame / fps - offset, end_frame / fps - offset)
+        self._frame_cut = (start_frame, end_frame, fps, offset)
+        return self
+
+    def cut_time(self, start_time, end_time, offset=0):
+        """Corta por tempo (mesma semântica de cut_video_by_time)"""
+        self.cut = (time_to_seconds(start_time) - offset,
+                    time_to_seconds(end_time) - offset)
+        self._frame_cut = None
+        return self
+
+    def filter(self, expression):
+        """Acrescenta um filtro de vídeo do FFmpeg"""
+        self.filters.append(expression)
+        return self
+
+    def keep_even_frames(self):
+        """Mantém apenas os frames pares"""
+        return self.filter(EVEN_FRAMES_FILTER)
+
+    def encode(self, crf=23, preset='medium', audio_codec='aac'):
+        """Define a codificação final (H.264; `audio_codec=None` descarta o áudio)"""
+        self.crf = crf
+        self.preset = preset
+        self.audio_codec = audio_codec
+        return self
+
+    def _encode_args(self):
+        """Opções de codificação final do FFmpeg"""
+        audio = ['-c:a', self.audio_codec] if self.audio_codec else ['-an']
+        return ['-c:v', self.video_codec] + audio + ['-preset', self.preset,
+                                                     '-crf', str(self.crf)]
+
+    def _codecs_match(self, infos):
+        """Verifica se as entradas já estão nos codecs de saída, com o mesmo formato"""
+        target = {'video': 'h264', 'audio': self.audio_codec}
+        signatures = set()
+        for info in infos:
+            for stream in info['streams']:
+                codec_type = stream.get('codec_type')
+                if codec_type in target and stream.get('codec_name') != target[codec_type]:
+                    return False
+            video = _video_stream(info)
+            signatures.add((video.get('width'), video.get('height'), video.get('pix_fmt')))
+        return len(signatures) == 1
+
+    def plan(self, output_file):
+        """
+        Monta os comandos FFmpeg necessários, sem executá-los
+
+        Returns:
+            dict: 'commands' (comandos FFmpeg, em ordem), 'temp_files'
+                (arquivos a remover após a execução) e 'copy' (True se não
+                há codificação)
+        """
+        infos = probe_videos(self.input_files)
+        # Corte por frames numa única entrada: instantes reais do índice de quadros
+        if self._frame_cut and len(self.input_files) == 1:
+            self.cut = frames_to_seconds(self.input_files[0], *self._frame_cut)
+        copy = not self.cut and not self.filters and self._codecs_match(infos)
+        temp_files = []
+
+        # Só corte numa entrada já em H.264: corte exato copiando os GOPs
+        # inteiros e recodificando apenas as pontas
+        if (self.cut and not self.filters and len(self.input_files) == 1
+                and self._codecs_match(infos)):
+            commands, temp_files = _cut_commands(
+                self.input_files[0], output_file, self.cut[0], self.cut[1],
+                seek='smart', encode_args=self._encode_args())
+            copy = not any(self.video_codec in cmd for cmd in commands)
+            return {'commands': commands, 'temp_files': temp_files, 'copy': copy}
+
+        cmd = ['ffmpeg']
+
+        if len(self.input_files) == 1 or _same_video_format(infos):
+            # Uma entrada, ou várias concatenadas pelo demuxer concat
+            if self.cut:
+                cmd += ['-ss', str(self.cut[0])]
+            if len(self.input_files) == 1:
+                cmd += ['-i', self.input_files[0]]
+            else:
+                list_file = _write_concat_list(self.input_files)
+                temp_files.append(list_file)
+                cmd += ['-f', 'concat', '-safe', '0', '-i', list_file]
+            if self.cut:
+                cmd += ['-t', str(self.cut[1] - self.cut[0])]
+            if self.filters:
+                cmd += ['-vf', ','.join(self.filters)]
+        else:
+            # Formatos diferentes: concatena decodificando, no mesmo grafo, com
+            # cada vídeo ajustado à resolução do primeiro (o filtro concat exige
+            # resolução e proporção de pixel iguais)
+            without_video = [input_file for input_file, info in zip(self.input_files, infos)
+                             if not _video_stream(info).get('width')]
+            if without_video:
+                raise ValueError(f"Não é possível concatenar arquivos sem vídeo: "
+                                 f"{without_video}")
+            first = _video_stream(infos[0])
+            size = f"{first['width']}:{first['height']}"
+            with_audio = bool(self.audio_codec) and all(_has_audio(info) for info in infos)
+            for input_file in self.input_files:
+                cmd += ['-i', input_file]
+            scaled = ''.join(f"[{i}:v:0]scale={size}:force_original_aspect_ratio=decrease,"
+                             f"pad={size}:(ow-iw)/2:(oh-ih)/2,setsar=1[s{i}];"
+                             for i in range(len(self.input_files)))
+            streams = ''.join(f"[s{i}]" + (f"[{i}:a:0]" if with_audio else '')
+                              for i in range(len(self.input_files)))
+            graph = (f"{scaled}{streams}concat=n={len(self.input_files)}:v=1"
+                     f":a={int(with_audio)}[v]" + ('[a]' if with_audio else ''))
+            if self.filters:
+                graph += f";[v]{','.join(self.filters)}[vf]"
+            cmd += ['-filter_complex', graph,
+                    '-map', '[vf]' if self.filters else '[v]']
+            if with_audio:
+                cmd += ['-map', '[a]']
+            if self.cut:
+                cmd += ['-ss', str(self.cut[0]), '-t', str(self.cut[1] - self.cut[0])]
+
+        if copy:
+            cmd += ['-c', 'copy']
+        else:
+            cmd += self._encode_args()
+        cmd += [output_file, '-y']
+        return {'commands': [cmd], 'temp_files': temp_files, 'copy': copy}
+
+    def run(self, output_file):
+        """Executa o pipeline e grava o resultado em `output_file`"""
+        plan = self.plan(output_file)
+        print(f"Processando {self.input_files} -> {output_file} "
+              f"({'cópia de fluxo' if plan['copy'] else 'codificação única'})")
+        try:
+            with _stage('cut' if plan['copy'] else 'encode'):
+                duration = self.cut[1] - self.cut[0] if self.cut else None
+                for cmd in plan['commands']:
+                    _run_ffmpeg_command(cmd, duration=duration,
+                                        description=os.path.basename(output_file))
+        finally:
+            cleanup_temp_files(*plan['temp_files'])
+        build_frame_index(output_file)
+        print(f"Pipeline concluído: {output_file}")
+        return output_file
+
+def _import_numpy():
+    """Importa o NumPy, dependência opcional usada só pela leitura de quadros"""
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("A leitura de quadros requer o NumPy: uv sync --extra frames "
+                          "(ou pip install numpy)") from None
+    return numpy
+
+def _scaled_size(width, height, size):
+    """Resolve `size` (largura, altura), com um dos lados None para manter a proporção"""
+    if not size:
+        return width, height
+    new_width, new_height = size
+    if new_width is None:
+        new_width = round(width * new_height / height / 2) * 2
+    elif new_height is None:
+        new_height = round(height * new_width / width / 2) * 2
+    return int(new_width), int(new_height)
+
+def iter_frame_batches(input_file, batch_size=32, start_frame=None, end_frame=None,
+                       fps=None, offset=0, stride=1, size=None, ring_size=4):
+    """
+    Decodifica um vídeo em lotes de quadros RGB (N, H, W, 3) uint8 do NumPy
+
+    O FFmpeg decodifica em uma thread de fundo e escreve os quadros brutos
+    (rawvideo) direto em um anel de `ring_size` buffers pré-alocados, sem
+    criar um array por quadro. Cada lote é uma visão de um desses buffers e
+    só vale até a próxima iteração; copie-o (np.copy) para guardá-lo.
+
+    Args:
+        input_file (str): Vídeo de entrada
+        batch_size (int): Quadros por lote (o último lote pode ser menor)
+        start_frame, end_frame (int): Trecho, com a mesma semântica de
+            cut_video_by_frames (`fps` e `offset` incluídos)
+        stride (int): Mantém um quadro a cada `stride`, contados a partir do
+            início do trecho (2 equivale a keep_even_frames)
+        size (tuple): (largura, altura) de saída, redimensionada no próprio
+            FFmpeg; um dos lados pode ser None para manter a proporção
+        ring_size (int): Lotes decodificados com antecedência, mais o lote em uso
+
+    Yields:
+        numpy.ndarray: Lote de forma (N, H, W, 3)
+    """
+    np = _import_numpy()
+    video = _video_stream(probe_video(input_file))
+    width, height = _scaled_size(video['width'], video['height'], size)
+
+    cmd = ['ffmpeg', '-v', 'error', '-nostdin']
+    if start_frame is not None or end_frame is not None:
+        start, end = frames_to_seconds(input_file, start_frame or 0,
+                                       end_frame if end_frame is not None else 0, fps, offset)
+        if start_frame is not None:
+            cmd += ['-ss', str(max(0.0, start))]
+        if end_frame is not None:
+            cmd += ['-t', str(end - start)]
+    cmd += ['-i', input_file]
+    filters = []
+    if stride > 1:
+        filters.append(f'select=not(mod(n\\,{stride}))')
+    if size:
+        filters.append(f'scale={width}:{height}')
+    if filters:
+        cmd += ['-vf', ','.join(filters)]
+    cmd += ['-an', '-sn', '-fps_mode', 'passthrough',
+            '-f', 'rawvideo', '-pix_fmt', 'rgb24', 'pipe:1']
+
+    ring = [np.empty((batch_size, height, width, 3), dtype=np.uint8)
+            for _ in range(max(2, ring_size))]
+    frame_bytes = height * width * 3
+    free_slots = queue.Queue()
+    for slot in range(len(ring)):
+        free_slots.put(slot)
+    filled = queue.Queue()
+    stderr = tempfile.TemporaryFile()
+    process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                               stderr=stderr, bufsize=0)
+
+    def decode():
+        try:
+            while True:
+                slot = free_slots.get()
+                if slot is None:
+                    return
+                view = memoryview(ring[slot]).cast('B')
+                filled_bytes = 0
+                while filled_bytes < len(view):
+                    read = process.stdout.readinto(view[filled_bytes:])
+                    if not read:
+                        break
+                    filled_bytes += read
+                if filled_bytes >= frame_bytes:
+                    filled.put((slot, filled_bytes // frame_bytes))
+                if filled_bytes < len(view):
+                    filled.put(None)
+                    return
+        except Exception as e:
+            filled.put(e)
+
+    decoder = threading.Thread(target=decode, daemon=True)
+    decoder.start()
+    in_use = None
+    try:
+        while True:
+            item = filled.get()
+            if in_use is not None:
+                free_slots.put(in_use)
+                in_use = None
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            in_use, frames = item
+            yield ring[in_use][:frames]
+
+        if process.wait() != 0:
+            stderr.seek(0)
+            raise subprocess.CalledProcessError(
+                process.returncode, cmd, stderr=stderr.read().decode(errors='replace'))
+    finally:
+        # Interrompido antes do fim: encerra o FFmpeg e libera a thread
+        if process.poll() is None:
+            process.kill()
+        free_slots.put(None)
+        decoder.join()
+        process.wait()
+        process.stdout.close()
+        stderr.close()
+
+# Arquivo de quadros (.frames): cabeçalho de FRAME_STORE_ALIGN bytes, blocos
+# de quadros RGB uint8 (crus ou comprimidos com zlib), índice JSON e, no fim,
+# o deslocamento do índice (uint64) seguido da assinatura.
+FRAME_STORE_MAGIC = b'VDFRAMES'
+FRAME_STORE_VERSION = 1
+FRAME_STORE_ALIGN = 4096
+FRAME_STORE_COMPRESSION = (None, 'zlib')
+
+@_stage('export')
+def export_frame_store(input_file, store_file, chunk_frames=256, compression=None,
+                       size=None, **frame_options):
+    """
+    Exporta os quadros de um vídeo para um arquivo de quadros mapeável em memória
+
+    Sem compressão, os blocos ficam contíguos e alinhados, e FrameStore lê
+    qualquer quadro como uma fatia de np.memmap, sem cópia; com
+    compression='zlib' (nível 1), cada bloco é comprimido separadamente e
+    apenas o bloco acessado é descomprimido.
+
+    Args:
+        input_file (str): Vídeo de entrada
+        store_file (str): Arquivo de saída (.frames)
+        chunk_frames (int): Quadros por bloco
+        compression (str): None ou 'zlib'
+        size (tuple): Repassado para iter_frame_batches
+        **frame_options: Trecho e passo, repassados para iter_frame_batches
+    """
+    if compression not in FRAME_STORE_COMPRESSION:
+        raise ValueError(f"Compressão não suportada: {compression}")
+
+    print(f"Exportando quadros de {input_file} para {store_file}...")
+    fps = _frame_rate(_video_stream(probe_video(input_file))) / frame_options.get('stride', 1)
+    chunks = []
+    shape = None
+    part_file = store_file + '.part'
+    with open(part_file, 'wb') as f:
+        f.write(FRAME_STORE_MAGIC.ljust(FRAME_STORE_ALIGN, b'\0'))
+        for batch in iter_frame_batches(input_file, batch_size=chunk_frames, size=size,
+                                        **frame_options):
+            shape = batch.shape[1:]
+            data = batch.data if compression is None else zlib.compress(batch.data, 1)
+            chunks.append({'offset': f.tell(), 'frames': len(batch), 'size': len(data)})
+            f.write(data)
+
+        index_offset = f.tell()
+        height, width, channels = shape or (0, 0, 3)
+        index = {
+            'version': FRAME_STORE_VERSION,
+            'source': os.path.basename(input_file),
+            'fps': fps,
+            'width': width,
+            'height': height,
+            'channels': channels,
+            'count': sum(chunk['frames'] for chunk in chunks),
+            'chunk_frames': chunk_frames,
+            'compression': compression,
+            'chunks': chunks,
+        }
+        f.write(json.dumps(index).encode())
+        f.write(index_offset.to_bytes(8, 'little') + FRAME_STORE_MAGIC)
+    os.replace(part_file, store_file)
+    print(f"Exportação concluída: {index['count']} quadros {width}x{height} em {store_file}")
+    return store_file
+
+class FrameStore:
+    """
+    Leitura com acesso aleatório de um arquivo gerado por export_frame_store
+
+    store[i] retorna o quadro i como array (H, W, 3) uint8 e store[a:b] um
+    lote (N, H, W, 3). Sem compressão, são fatias de um np.memmap somente
+    leitura: nada é copiado e processos que abrem o mesmo arquivo dividem o
+    cache de páginas. O objeto pode ser enviado a workers de um DataLoader;
+    cada processo reabre o mapeamento.
+
+    Exemplo:
+        store = FrameStore("IJCB Videos/Street.frames")
+        frame = store[1234]
+    """
+
+    def __init__(self, store_file):
+        self.store_file = store_file
+        with open(store_file, 'rb') as f:
+            if f.read(len(FRAME_STORE_MAGIC)) != FRAME_STORE_MAGIC:
+                raise ValueError(f"{store_file} não é um arquivo de quadros")
+            trailer_offset = f.seek(-16, os.SEEK_END)
+            trailer = f.read(16)
+            if trailer[8:] != FRAME_STORE_MAGIC:
+                raise ValueError(f"{store_file} está incompleto")
+            index_offset = int.from_bytes(trailer[:8], 'little')
+            f.seek(index_offset)
+            self.index = json.loads(f.read(trailer_offset - index_offset))
+        if self.index['version'] != FRAME_STORE_VERSION:
+            raise ValueError(f"Versão não suportada de {store_file}: {self.index['version']}")
+        self.fps = self.index['fps']
+        self.frame_shape = (self.index['height'], self.index['width'], self.index['channels'])
+        self._memmap = None
+        self._chunk_cache = (None, None)
+
+    def __len__(self):
+        return self.index['count']
+
+    @property
+    def shape(self):
+        return (len(self),) + self.frame_shape
+
+    def __getstate__(self):
+        # O mapeamento e o bloco em cache não vão para outros processos
+        state = dict(self.__dict__)
+        state['_memmap'] = None
+        state['_chunk_cache'] = (None, None)
+        return state
+
+    def _frames(self):
+        """Todos os quadros, como np.memmap (apenas sem compressão)"""
+        if self._memmap is None:
+            np = _import_numpy()
+            if not len(self):
+                # np.memmap não mapeia um trecho vazio
+                return np.empty(self.shape, np.uint8)
+            self._memmap = np.memmap(self.store_file, dtype=np.uint8, mode='r',
+                                     offset=FRAME_STORE_ALIGN, shape=self.shape)
+        return self._memmap
+
+    def _chunk(self, number):
+        """Quadros de um bloco comprimido, descomprimindo só o último bloco lido"""
+        cached_number, frames = self._chunk_cache
+        if cached_number != number:
+            np = _import_numpy()
+            chunk = self.index['chunks'][number]
+            with open(self.store_file, 'rb') as f:
+                f.seek(chunk['offset'])
+                data = zlib.decompress(f.read(chunk['size']))
+            frames = np.frombuffer(data, dtype=np.uint8).reshape(
+                (chunk['frames'],) + self.frame_shape)
+            self._chunk_cache = (number, frames)
+        return frames
+
+    def __getitem__(self, key):
+        if self.index['compression'] is None:
+            return self._frames()[key]
+
+        np = _import_numpy()
+        chunk_frames = self.index['chunk_frames']
+        if isinstance(key, slice):
+            frames = [self[i] for i in range(*key.indices(len(self)))]
+            return np.stack(frames) if frames else np.empty((0,) + self.frame_shape, np.uint8)
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError(f"Quadro {key} fora do intervalo (0-{len(self) - 1})")
+        return self._chunk(key // chunk_frames)[key % chunk_frames]
+
 def cleanup_temp_files(*files):
     """Remove arquivos temporários"""
     for file in files:
@@ -175,6 +3019,7 @@ def get_video_extension(filename):
     return filename  # Retorna o nome original se não encontrar
 
 
+@_stage('encode')
 def images_to_video(input_folder, output_path, fps, pattern):
     """
     Converte uma sequência de imagens em um vídeo MKV com codificação H.264
@@ -238,4 +3083,623 @@ def images_to_video(input_folder, output_path, fps, pattern):
 
     except Exception as e:
         print(f"Erro inesperado: {e}")
-        return False
\ No newline at end of file
+        return False
+
+def _iter_tar_images(tar_file, extension, reorder_window):
+    """
+    Lê, em ordem numérica, as imagens de um tar.xz sem extraí-las para o disco
+
+    O arquivo é lido como fluxo (descomprimido por open_xz). Imagens fora de ordem no tar são
+    reordenadas dentro de uma janela de `reorder_window` quadros.
+    """
+    pending = []
+    last_number = None
+    with open_xz(tar_file) as stream, tarfile.open(fileobj=stream, mode='r|') as tar:
+        for member in tar:
+            stem, ext = os.path.splitext(os.path.basename(member.name))
+            if not member.isfile() or ext.lower() != extension or not stem.isdigit():
+                continue
+            number = int(stem)
+            if last_number is not None and number < last_number:
+                raise ValueError(f"Imagens muito fora de ordem em {tar_file}: "
+                                 f"{number} após {last_number}")
+
+            heapq.heappush(pending, (number, tar.extractfile(member).read()))
+            if len(pending) > reorder_window:
+                last_number, data = heapq.heappop(pending)
+                yield data
+
+    while pending:
+        yield heapq.heappop(pending)[1]
+
+@_stage('encode')
+def tar_images_to_video(tar_files, output_path, fps, extension='.jpg', reorder_window=64):
+    """
+    Converte as imagens de um ou mais arquivos tar.xz em um único vídeo MKV H.264
+
+    As imagens são lidas diretamente do fluxo descompactado e enviadas ao
+    FFmpeg pelo stdin (image2pipe), sem nunca serem gravadas em disco; a
+    descompactação acontece em paralelo com a codificação.
+
+    Args:
+        tar_files (list[str]): Arquivos tar.xz, na ordem em que entram no vídeo
+        output_path (str): Caminho de saída do arquivo MKV
+        fps (int/float): Taxa de quadros por segundo
+        extension (str): Extensão das imagens (nomes numéricos, ex: 00000001.jpg)
+        reorder_window (int): Quadros mantidos em memória para corrigir a ordem
+
+    Returns:
+        bool: True se a conversão foi bem-sucedida, False caso contrário
+    """
+    # Cria o diretório de saída se não existir
+    output_dir = os.path.dirname(output_path)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    codec = 'mjpeg' if extension.lower() in ('.jpg', '.jpeg') else 'png'
+    cmd = [
+        'ffmpeg',
+        '-y',  # Sobrescreve arquivo de saída se existir
+        '-f', 'image2pipe',  # Imagens concatenadas no stdin
+        '-framerate', str(fps),  # Taxa de quadros
+        '-c:v', codec,
+        '-i', 'pipe:0',
+        '-c:v', 'libx264',  # Codec de vídeo H.264
+        '-pix_fmt', 'yuv420p',  # Formato de pixel para compatibilidade
+        '-crf', '23',  # Qualidade (0-51, onde 23 é boa qualidade)
+        '-preset', 'medium',  # Preset de velocidade/qualidade
+        output_path
+    ]
+
+    print(f"Convertendo imagens de {len(tar_files)} arquivo(s) tar.xz para '{output_path}'...")
+    frames = 0
+    started = time.perf_counter()
+    with tempfile.TemporaryFile() as stderr:
+        try:
+            process = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                                       stdout=subprocess.DEVNULL, stderr=stderr)
+        except FileNotFoundError:
+            print("Erro: FFmpeg não encontrado. Certifique-se de que está instalado e no PATH.")
+            return False
+
+        try:
+            for tar_file in tar_files:
+                print(f"Lendo imagens de {tar_file}...")
+                for data in _iter_tar_images(tar_file, extension.lower(), reorder_window):
+                    process.stdin.write(data)
+                    frames += 1
+        except BrokenPipeError:
+            pass  # FFmpeg encerrou antes; o erro é reportado abaixo
+        except Exception as e:
+            process.kill()
+            process.wait()
+            print(f"Erro ao ler imagens: {e}")
+            return False
+        finally:
+            with suppress(BrokenPipeError):
+                process.stdin.close()
+
+        returncode, rusage = _wait_process(process)
+        _record_process_metrics(_process_metrics(time.perf_counter() - started,
+                                                 rusage, frames))
+        if returncode != 0:
+            stderr.seek(0)
+            print(f"Erro durante a conversão:")
+            print(f"Código de saída: {process.returncode}")
+            print(f"Erro: {stderr.read().decode(errors='replace')}")
+            return False
+
+    build_frame_index(output_path)
+    print(f"Conversão concluída com sucesso! {frames} quadros codificados.")
+    return True
+
+# Manifesto dos datasets (datasets.toml): cada entrada de [datasets.<Nome>]
+# gera "<output_dir>/<Nome>.mkv"; [defaults] vale para todas.
+MANIFEST_FILE = 'datasets.toml'
+DATASET_KINDS = ('youtube', 'zenodo_images', 'zenodo_videos')
+# Tamanho nominal de cada resolução pedida ao YouTube (para as estimativas)
+RESOLUTION_SIZES = {'1080p': (1920, 1080), '4K': (3840, 2160)}
+
+def load_manifest(path=MANIFEST_FILE):
+    """
+    Lê o manifesto dos datasets
+
+    Tipos (`kind`):
+        youtube: trecho de um vídeo (start_frame/end_frame com fps, ou
+            start_time/end_time), cortado e codificado; keep_even_frames opcional
+        zenodo_images: tar.xz de tar.xz aninhados com imagens JPEG (fps)
+        zenodo_videos: tar.xz com partes de vídeo concatenadas na ordem de `parts`
+
+    `audio = false` (youtube e zenodo_videos) baixa só o vídeo e descarta o
+    áudio na codificação; o padrão mantém o áudio, em AAC.
+
+    Returns:
+        list[dict]: Datasets, com 'name' e 'output' (caminho do vídeo final)
+
+    Raises:
+        ValueError: Se um dataset tiver tipo inválido ou faltar algum campo
+    """
+    import tomllib
+    with open(path, 'rb') as f:
+        manifest = tomllib.load(f)
+
+    defaults = manifest.get('defaults', {})
+    datasets = []
+    for name, entry in manifest.get('datasets', {}).items():
+        dataset = {**defaults, **entry, 'name': name}
+        kind = dataset.get('kind')
+        if kind not in DATASET_KINDS:
+            raise ValueError(f"{path}: tipo inválido para {name}: {kind!r}")
+        required = ['url', 'output_dir']
+        if kind == 'youtube':
+            required += ['fps'] + (['start_frame', 'end_frame'] if 'start_frame' in dataset
+                                   else ['start_time', 'end_time'])
+        elif kind == 'zenodo_images':
+            required.append('fps')
+        else:
+            required.append('parts')
+        missing = [key for key in required if key not in dataset]
+        if missing:
+            raise ValueError(f"{path}: {name} não define {', '.join(missing)}")
+        dataset['output'] = os.path.join(dataset['output_dir'], f"{name}.mkv")
+        datasets.append(dataset)
+    return datasets
+
+def _dataset_cut(dataset):
+    """Parâmetros de corte de um dataset do YouTube (formato de clip_range_seconds)"""
+    if 'start_frame' in dataset:
+        return {'start_frame': dataset['start_frame'], 'end_frame': dataset['end_frame'],
+                'fps': dataset['fps']}
+    return {'start_time': dataset['start_time'], 'end_time': dataset['end_time']}
+
+def dataset_build(dataset):
+    """Build (impressão digital) do vídeo final de um dataset do manifesto"""
+    build = Build(dataset['output'])
+    if dataset['kind'] == 'youtube':
+        build.stage('download', url=dataset['url'], fps=dataset['fps'],
+                    resolution=dataset.get('resolution'), audio=dataset.get('audio', True))
+        build.stage('cut', **_dataset_cut(dataset))
+        if dataset.get('keep_even_frames'):
+            build.stage('filter', keep_even_frames=True)
+    else:
+        build.stage('download', url=dataset['url']).stage('extract')
+        if dataset['kind'] == 'zenodo_videos':
+            build.stage('concat', parts=dataset['parts'])
+    encode = ({'fps': dataset['fps']} if dataset['kind'] == 'zenodo_images'
+              else {'audio': dataset.get('audio', True)})
+    return build.stage('encode', **encode, crf=dataset['crf'], preset=dataset['preset'])
+
+def plan_datasets(datasets, only=None):
+    """
+    Agrupa os datasets por origem, para baixar cada origem uma única vez
+
+    Datasets do YouTube selecionados com a mesma URL, fps, resolução e áudio
+    compartilham um download quando seus trechos se sobrepõem ou estão
+    próximos (merge_sections); trechos distantes formam grupos separados,
+    cada um baixando só o próprio intervalo. Os do Zenodo compartilham o
+    arquivo da mesma URL.
+
+    Returns:
+        list[dict]: Grupos com 'kind', 'url', 'fps', 'resolution', 'audio',
+            'section' e 'datasets' (apenas os selecionados)
+
+    Raises:
+        ValueError: Se `only` citar um dataset que não está no manifesto
+    """
+    names = [dataset['name'] for dataset in datasets]
+    unknown = sorted(set(only or []) - set(names))
+    if unknown:
+        raise ValueError(f"Datasets desconhecidos: {', '.join(unknown)}")
+
+    groups = {}
+    for dataset in datasets:
+        youtube = dataset['kind'] == 'youtube'
+        key = (dataset['kind'], dataset['url'],
+               dataset['fps'] if youtube else None,
+               dataset.get('resolution') if youtube else None,
+               dataset.get('audio', True) if youtube else None)
+        if only and dataset['name'] not in only:
+            continue
+        group = groups.setdefault(key, {
+            'kind': key[0], 'url': key[1], 'fps': key[2], 'resolution': key[3],
+            'audio': key[4], 'section': None, 'datasets': [],
+        })
+        group['datasets'].append(dataset)
+
+    plan = []
+    for group in groups.values():
+        if group['kind'] != 'youtube':
+            plan.append(group)
+            continue
+        ranges = {dataset['name']: clip_range_seconds(_dataset_cut(dataset))
+                  for dataset in group['datasets']}
+        for section in merge_sections(ranges.values()):
+            plan.append({**group, 'section': section, 'datasets': [
+                dataset for dataset in group['datasets']
+                if section[0] <= ranges[dataset['name']][0] <= section[1]]})
+    return plan
+
+def _build_youtube(group, pending):
+    """Baixa o intervalo do grupo uma vez e corta/codifica cada dataset pendente"""
+    with Workspace() as workspace:
+        base_name = pending[0][0]['name'].lower()
+        temp_video = os.path.join(workspace.dir, f"{base_name}_temp.%(ext)s")
+        with workspace.step('download'):
+            offset = download_youtube_video(group['url'], temp_video, fps=group['fps'],
+                                            resolution=group['resolution'],
+                                            section=group['section'], audio=group['audio'])
+        downloaded_file = get_video_extension(temp_video.replace('.%(ext)s', ''))
+        workspace.track(downloaded_file, *(dataset['name'] for dataset, _ in pending))
+
+        for dataset, build in pending:
+            build.source(group['url'], downloaded_file)
+            create_directory(dataset['output_dir'])
+            pipeline = VideoPipeline(downloaded_file)
+            if 'start_frame' in dataset:
+                pipeline.cut_frames(dataset['start_frame'], dataset['end_frame'],
+                                    dataset['fps'], offset=offset)
+            else:
+                pipeline.cut_time(dataset['start_time'], dataset['end_time'], offset=offset)
+            if dataset.get('keep_even_frames'):
+                pipeline.keep_even_frames()
+            with workspace.step(dataset['name']):
+                pipeline.encode(dataset['crf'], dataset['preset'],
+                                audio_codec='aac' if group['audio'] else None) \
+                    .run(dataset['output'])
+            _save_dataset(dataset, build)
+
+def _download_archive(workspace, url):
+    """Baixa o tar.xz de `url` no Workspace (consumido pela etapa 'extract')"""
+    tar_file = workspace.path(url.split('/')[-1], 'extract')
+    with workspace.step('download', needs=0 if cache_lookup(url) else remote_file_size(url)):
+        download_file(url, tar_file)
+    return tar_file
+
+def _build_zenodo_images(group, pending):
+    """Extrai os tar.xz aninhados e codifica as imagens direto do fluxo de cada um"""
+    url = group['url']
+    with Workspace() as workspace:
+        tar_file = _download_archive(workspace, url)
+        for _, build in pending:
+            build.source(url, tar_file)
+
+        # O arquivo principal contém apenas os tar.xz de cada parte (já
+        # compactados); as imagens nunca são extraídas para o disco
+        with workspace.step('extract', needs=xz_uncompressed_size(tar_file)):
+            extract_tar_xz(tar_file, workspace.dir)
+        nested_tar_files = sorted(
+            workspace.track(os.path.join(workspace.dir, item), 'encode')
+            for item in os.listdir(workspace.dir)
+            if item.endswith('.tar.xz') and item != os.path.basename(tar_file))
+        if not nested_tar_files:
+            raise RuntimeError(f"Nenhum tar.xz aninhado encontrado em {url}")
+
+        with workspace.step('encode'):
+            for dataset, build in pending:
+                create_directory(dataset['output_dir'])
+                if not tar_images_to_video(nested_tar_files, dataset['output'],
+                                           fps=dataset['fps']):
+                    raise RuntimeError(f"Não foi possível criar {dataset['output']}")
+                _save_dataset(dataset, build)
+
+def _build_zenodo_videos(group, pending):
+    """Extrai as partes de vídeo e as concatena/codifica em uma única execução"""
+    url = group['url']
+    with Workspace() as workspace:
+        tar_file = _download_archive(workspace, url)
+        for _, build in pending:
+            build.source(url, tar_file)
+
+        parts = sorted({part for dataset, _ in pending for part in dataset['parts']})
+        part_files = [workspace.path(part, 'encode') for part in parts]
+        # Reaproveita a extração anterior do mesmo arquivo, se houver
+        with workspace.step('extract', needs=xz_uncompressed_size(tar_file)):
+            pending[0][1].cached('extract', part_files, extract_tar_xz, tar_file, workspace.dir)
+
+        with workspace.step('encode'):
+            for dataset, build in pending:
+                video_files = [os.path.join(workspace.dir, part) for part in dataset['parts']]
+                missing = [video for video in video_files if not os.path.exists(video)]
+                if missing:
+                    raise FileNotFoundError(f"Arquivo não encontrado: {missing[0]}")
+                create_directory(dataset['output_dir'])
+                audio_codec = 'aac' if dataset.get('audio', True) else None
+                VideoPipeline(*video_files).encode(dataset['crf'], dataset['preset'],
+                                                   audio_codec).run(dataset['output'])
+                _save_dataset(dataset, build)
+
+_DATASET_BUILDERS = {
+    'youtube': _build_youtube,
+    'zenodo_images': _build_zenodo_images,
+    'zenodo_videos': _build_zenodo_videos,
+}
+
+def build_datasets(datasets, only=None):
+    """
+    Constrói os datasets do manifesto que estiverem desatualizados
+
+    Args:
+        datasets (list[dict]): Resultado de load_manifest
+        only (list[str]): Nomes dos datasets a construir (padrão: todos)
+    """
+    for group in plan_datasets(datasets, only):
+        pending = []
+        for dataset in group['datasets']:
+            build = dataset_build(dataset)
+            if not build.up_to_date():
+                pending.append((dataset, build))
+        if pending:
+            _DATASET_BUILDERS[group['kind']](group, pending)
+
+# Diferença tolerada, em quadros, entre o esperado e o vídeo final (arredondamento
+# dos cortes por tempo)
+VALIDATION_FRAME_TOLERANCE = 1
+
+def expected_output(dataset):
+    """
+    Quadros e duração esperados do vídeo final de um dataset do manifesto
+
+    Só os datasets do YouTube têm trecho conhecido: por frames, o número de
+    quadros é end_frame - start_frame; por tempo, depende da taxa real do
+    vídeo (None aqui). keep_even_frames mantém a metade (arredondada para
+    cima, pois o quadro 0 fica). A duração é a do trecho, em quadros da
+    origem, mesmo com frames pares.
+
+    Returns:
+        dict: 'frames' (None se desconhecido), 'span_frames' e 'span_seconds'
+            (trecho por frames ou por tempo; None nos do Zenodo) e 'even'
+    """
+    expected = {'frames': None, 'span_frames': None, 'span_seconds': None,
+                'even': bool(dataset.get('keep_even_frames'))}
+    if dataset['kind'] != 'youtube':
+        return expected
+    if 'start_frame' in dataset:
+        span = dataset['end_frame'] - dataset['start_frame']
+        expected['span_frames'] = span
+        expected['frames'] = (span + 1) // 2 if expected['even'] else span
+    else:
+        start, end = clip_range_seconds(_dataset_cut(dataset))
+        expected['span_seconds'] = end - start
+    return expected
+
+def _run_ffprobe_packets(path):
+    cmd = [
+        'ffprobe', '-v', 'error', '-count_packets', '-of', 'json',
+        '-show_entries', 'stream=codec_type,codec_name,nb_read_packets,avg_frame_rate'
+                         ':format=duration', path
+    ]
+    result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+    return result.stdout
+
+def _probe_packets(path):
+    """Fluxos (com nb_read_packets) e duração de um vídeo, lendo só os pacotes"""
+    return _cached_probes('packets', [path], _run_ffprobe_packets)[0]
+
+def _check_gops(path, samples, seed=None):
+    """Decodifica `samples` GOPs sorteados e retorna os problemas encontrados"""
+    packets = read_packet_index(path)
+    starts = [i for i, (_, key) in enumerate(packets) if key]
+    problems = []
+    for i in sorted(random.Random(seed).sample(starts, min(samples, len(starts)))):
+        following = [j for j in starts if j > i]
+        frames = (following[0] if following else len(packets)) - i
+        pts = packets[i][0]
+        cmd = ['ffmpeg', '-v', 'error', '-xerror', '-ss', str(pts), '-i', path,
+               '-map', '0:v:0', '-frames:v', str(frames), '-f', 'null', '-']
+        try:
+            decoded = _run_ffmpeg_command(cmd, record=False)['frames']
+        except subprocess.CalledProcessError:
+            problems.append(f"erro ao decodificar o GOP em {seconds_to_time(pts)}")
+            continue
+        if decoded != frames:
+            problems.append(f"GOP em {seconds_to_time(pts)}: {decoded} de {frames} quadros")
+    return problems
+
+def validate_output(dataset, deep=0, seed=None):
+    """
+    Confere o vídeo final de um dataset sem decodificá-lo
+
+    Conta os pacotes de vídeo e lê os metadados com ffprobe e compara com
+    expected_output: número de quadros, duração do trecho, codec H.264,
+    fps (zenodo_images) e presença de áudio conforme `audio`. Sem número
+    esperado, confere se os pacotes batem com duração x fps (arquivo
+    truncado ou com quadros faltando). Com `deep`, decodifica também
+    `deep` GOPs sorteados.
+
+    Returns:
+        dict: 'frames' e 'seconds' do vídeo (None se não existir) e
+            'problems' (lista vazia se estiver correto)
+    """
+    report = {'frames': None, 'seconds': None, 'problems': []}
+    problems = report['problems']
+    if not os.path.exists(dataset['output']):
+        problems.append(f"{dataset['output']} não existe")
+        return report
+
+    info = _probe_packets(dataset['output'])
+    video = _video_stream(info)
+    if not video:
+        problems.append("sem fluxo de vídeo")
+        return report
+    frames = int(video.get('nb_read_packets') or 0)
+    seconds = float(info.get('format', {}).get('duration') or 0)
+    fps = _frame_rate(video)
+    report['frames'], report['seconds'] = frames, seconds
+    if video.get('codec_name') != 'h264':
+        problems.append(f"codec {video.get('codec_name')}, esperado h264")
+    if dataset.get('audio', True) is False and _has_audio(info):
+        problems.append("tem áudio, mas o dataset usa audio = false")
+    if dataset['kind'] == 'zenodo_images' and fps and abs(fps - dataset['fps']) > 0.01:
+        problems.append(f"{fps:.3f} fps, esperado {dataset['fps']}")
+
+    expected = expected_output(dataset)
+    tolerance = VALIDATION_FRAME_TOLERANCE
+    if expected['span_seconds'] is not None and fps:
+        span = round(expected['span_seconds'] * fps)
+        expected['frames'] = (span + 1) // 2 if expected['even'] else span
+        expected['span_frames'] = span
+    if expected['frames'] is not None:
+        if abs(frames - expected['frames']) > tolerance:
+            problems.append(f"{frames} quadros, esperado {expected['frames']}")
+        if fps and abs(seconds - expected['span_frames'] / fps) > (tolerance + 1) / fps:
+            problems.append(f"duração {seconds:.3f}s, esperado "
+                            f"{expected['span_frames'] / fps:.3f}s")
+    elif fps and seconds:
+        per_second = fps / 2 if expected['even'] else fps
+        if abs(frames - seconds * per_second) > max(tolerance + 1, 0.01 * frames):
+            problems.append(f"{frames} quadros em {seconds:.3f}s a {fps:.3f} fps "
+                            f"(esperado ~{seconds * per_second:.0f})")
+    if frames == 0:
+        problems.append("nenhum quadro")
+
+    if deep and frames:
+        problems += _check_gops(dataset['output'], deep, seed)
+    return report
+
+def dataset_outputs(datasets, only=None):
+    """
+    Vídeos finais já construídos dos datasets do manifesto
+
+    Returns:
+        list[str]: Caminhos de 'output' que existem, na ordem do manifesto
+
+    Raises:
+        ValueError: Se `only` citar um dataset que não está no manifesto
+    """
+    unknown = sorted(set(only or []) - {dataset['name'] for dataset in datasets})
+    if unknown:
+        raise ValueError(f"Datasets desconhecidos: {', '.join(unknown)}")
+    return [dataset['output'] for dataset in datasets
+            if (not only or dataset['name'] in only) and os.path.exists(dataset['output'])]
+
+def validate_datasets(datasets, only=None, deep=0, workers=None, seed=None):
+    """
+    Executa validate_output em todos os vídeos finais, em paralelo
+
+    Returns:
+        dict: Nome do dataset -> relatório de validate_output, na ordem do manifesto
+    """
+    chosen = [dataset for group in plan_datasets(datasets, only)
+              for dataset in group['datasets']]
+    workers = workers or min(8, 2 * (os.cpu_count() or 1))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        reports = executor.map(_in_stage_context(
+            lambda dataset: validate_output(dataset, deep, seed)), chosen)
+        by_name = {dataset['name']: report for dataset, report in zip(chosen, reports)}
+    return {dataset['name']: by_name[dataset['name']] for dataset in datasets
+            if dataset['name'] in by_name}
+
+def _save_dataset(dataset, build):
+    """Valida o vídeo final e só então grava a impressão digital da construção"""
+    problems = validate_output(dataset)['problems']
+    if problems:
+        raise RuntimeError(f"{dataset['output']} inválido: {'; '.join(problems)}")
+    build.save()
+    print(f"Arquivo salvo em: {dataset['output']}")
+
+def calibrate_encoder(crf=23, preset='medium', size='1280x720', seconds=2, fps=30):
+    """Mede a vazão do libx264 (pixels/s) codificando um vídeo sintético"""
+    width, height = map(int, size.split('x'))
+    cmd = ['ffmpeg', '-f', 'lavfi', '-i', f'testsrc2=size={size}:rate={fps}:duration={seconds}',
+           '-c:v', 'libx264', '-preset', preset, '-crf', str(crf), '-f', 'null', '-']
+    metrics = _run_ffmpeg_command(cmd, duration=seconds, description='Calibração',
+                                  record=False)
+    return width * height * fps * seconds / metrics['wall']
+
+def encoder_rate_from_benchmark(path):
+    """
+    Vazão do libx264 (pixels/s) medida pelo benchmark_script
+
+    Usa o resultado de convert_to_h264_mkv na maior resolução medida.
+    """
+    with open(path) as f:
+        results = json.load(f)['results']
+    rates = []
+    for name, result in results.items():
+        match = re.fullmatch(r'convert_to_h264_mkv\[(\d+)x(\d+)\]', name)
+        if match and result.get('fps'):
+            pixels = int(match.group(1)) * int(match.group(2))
+            rates.append((pixels, result['fps'] * pixels))
+    if not rates:
+        raise ValueError(f"{path} não tem resultados de convert_to_h264_mkv")
+    return max(rates)[1]
+
+def _output_frames(dataset):
+    """Quadros e dimensões de um vídeo final já construído, ou None"""
+    if not os.path.exists(dataset['output']):
+        return None
+    info = probe_video(dataset['output'])
+    video = _video_stream(info)
+    frames = float(info['format'].get('duration', 0)) * _frame_rate(video)
+    return int(frames), video.get('width'), video.get('height')
+
+def estimate_datasets(datasets, only=None, pixel_rate=None):
+    """
+    Estima, sem executar nada, o custo de construir os datasets pendentes
+
+    Downloads pelos metadados do yt-dlp e pelo HEAD HTTP (0 se já estiverem
+    no cache), codificação pela vazão `pixel_rate` do libx264 (pixels/s, de
+    calibrate_encoder ou encoder_rate_from_benchmark) e disco temporário pelo
+    tamanho da origem e dos arquivos extraídos. Valores desconhecidos são None.
+
+    Returns:
+        list[dict]: Um item por download (grupo de plan_datasets), com 'url', 'download_bytes',
+            'scratch_bytes' e 'datasets' (nome, etapa alterada, quadros,
+            'encode_seconds')
+    """
+    estimates = []
+    for group in plan_datasets(datasets, only):
+        rows = []
+        for dataset in group['datasets']:
+            changed = dataset_build(dataset).changed_stage()
+            rows.append({'name': dataset['name'], 'changed': changed, 'frames': None,
+                         'encode_seconds': None if changed else 0.0})
+        estimate = {'url': group['url'], 'kind': group['kind'], 'datasets': rows,
+                    'download_bytes': 0, 'scratch_bytes': 0}
+        estimates.append(estimate)
+        if not any(row['changed'] for row in rows):
+            continue
+
+        width = height = None
+        try:
+            if group['kind'] == 'youtube':
+                info = youtube_download_info(group['url'], fps=group['fps'],
+                                             resolution=group['resolution'],
+                                             section=group['section'],
+                                             audio=group['audio'])
+                estimate['download_bytes'] = info['bytes']
+                estimate['scratch_bytes'] = info['size']
+                width, height = info['width'], info['height']
+            else:
+                entry = cache_lookup(group['url'])
+                if entry is not None:
+                    archive = os.path.join(get_cache_dir(), 'objects', entry['sha256'])
+                    size, extracted = entry['size'], xz_uncompressed_size(archive)
+                else:
+                    # Sem o arquivo, supõe que a extração ocupa o mesmo que ele
+                    size = extracted = remote_file_size(group['url'])
+                    estimate['download_bytes'] = size
+                estimate['scratch_bytes'] = size + extracted
+        except Exception as e:
+            print(f"Aviso: não foi possível consultar {group['url']}: {e}")
+            estimate['download_bytes'] = estimate['scratch_bytes'] = None
+
+        for dataset, row in zip(group['datasets'], rows):
+            if not row['changed']:
+                continue
+            if dataset['kind'] == 'youtube':
+                start, end = clip_range_seconds(_dataset_cut(dataset))
+                frames = (end - start) * dataset['fps']
+                if dataset.get('keep_even_frames'):
+                    frames /= 2
+                size = ((width, height) if width and height
+                        else RESOLUTION_SIZES.get(dataset.get('resolution')))
+            else:
+                # O tamanho das imagens só é conhecido depois do download:
+                # usa o vídeo final da construção anterior, se houver
+                previous = _output_frames(dataset)
+                frames, size = (previous[0], previous[1:]) if previous else (None, None)
+            row['frames'] = int(frames) if frames else None
+            if frames and size and pixel_rate:
+                row['encode_seconds'] = frames * size[0] * size[1] / pixel_rate
+    return estimates